@@ -1,166 +1,4591 @@
-from fastapi import FastAPI, APIRouter, Query, HTTPException
+from fastapi import FastAPI, APIRouter, Query, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse, JSONResponse, FileResponse
+from fastapi.routing import APIRoute
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne, monitoring
+from pymongo.errors import OperationFailure, PyMongoError
+from bson.errors import BSONError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
+from pydantic_core import to_json, to_jsonable_python
+from typing import List, Optional, Dict, Any, Tuple, Callable, Set, Iterator, AsyncIterator
 import uuid
 from datetime import datetime, timezone, timedelta
 import random
+import re
 import math
 import numpy as np
 import hashlib
 import json
+import time
+import asyncio
+import threading
+import bisect
+import csv
+import io
+import zlib
+import shutil
+import multiprocessing
+import sys
+import tracemalloc
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow / Parquet responses are unavailable without pyarrow
+    pa = pc = pq = None
+
+try:
+    import brotli
+except ImportError:  # responses are gzip-compressed only
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # fast responses fall back to pydantic_core's serializer
+    orjson = None
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # the snapshot cache and realtime fan-out stay in-process
+    aioredis = None
+    RedisError = OSError
+
+try:
+    import fcntl
+except ImportError:  # no directory locks (Windows); run a single worker
+    fcntl = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection counts across the client's pools, for /metrics (events arrive on driver threads)"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+    
+    def _add(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+    
+    def connection_created(self, event): self._add(open=1)
+    def connection_closed(self, event): self._add(open=-1)
+    def connection_check_out_started(self, event): self._add(waiting=1)
+    def connection_check_out_failed(self, event): self._add(waiting=-1)
+    def connection_checked_out(self, event): self._add(waiting=-1, checked_out=1)
+    def connection_checked_in(self, event): self._add(checked_out=-1)
+    def connection_ready(self, event): pass
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+pool_monitor = PoolMonitor()
+client = AsyncIOMotorClient(mongo_url, event_listeners=[pool_monitor])
+db = client[os.environ['DB_NAME']]
+
+# ==================== FAST RESPONSES ====================
+# Opt-in: endpoint return values are serialized once, straight to JSON bytes,
+# instead of being re-validated against response_model and passed through
+# jsonable_encoder. response_model still drives the OpenAPI schema.
+
+FAST_RESPONSES = os.environ.get("FAST_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+def fast_json_dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=to_jsonable_python, option=orjson.OPT_SERIALIZE_NUMPY)
+    return to_json(content)
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return fast_json_dumps(content)
+
+class FastResponseRoute(APIRoute):
+    """APIRoute that, with FAST_RESPONSES on, wraps async endpoints to return FastJSONResponse directly"""
+    
+    def get_route_handler(self) -> Callable:
+        if FAST_RESPONSES and asyncio.iscoroutinefunction(self.endpoint):
+            endpoint, status_code = self.endpoint, self.status_code or 200
+            
+            async def call(**values):
+                content = await endpoint(**values)
+                if isinstance(content, Response):
+                    return content
+                return FastJSONResponse(content, status_code=status_code)
+            
+            self.dependant.call = call
+        return super().get_route_handler()
+
+# Create the main app
+app = FastAPI(
+    title="Energy-Morph API",
+    version="1.0.0",
+    default_response_class=FastJSONResponse if FAST_RESPONSES else JSONResponse
+)
+
+# Create a router with the /api prefix
+api_router = APIRouter(prefix="/api", route_class=FastResponseRoute)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# ==================== MODELS ====================
+
+class GridMetrics(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    timestamp: str
+    solar_output: float
+    wind_output: float
+    megapack_charge: float
+    grid_demand: float
+    efficiency_ratio: float
+    zone: str
+
+class KPIData(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    total_renewable_output: float
+    grid_uptime: float
+    efficiency_gain: float
+    co2_savings: float
+    megapack_capacity: float
+    peak_demand_handled: float
+    sparkline_data: List[float]
+
+class SNNPrediction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    timestamp: str
+    predicted_demand: List[float]
+    predicted_solar: List[float]
+    predicted_wind: List[float]
+    confidence: float
+    spike_patterns: List[Dict[str, Any]]
+    forecast_version: Optional[int] = None
+    generated_at: Optional[str] = None
+    age_seconds: Optional[float] = None
+    stale: Optional[bool] = None
+
+class BlockchainTransaction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    tx_hash: str
+    timestamp: str
+    energy_type: str
+    amount_kwh: float
+    source: str
+    destination: str
+    verified: bool
+    block_number: int
+
+class HeatmapData(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    zones: List[str]
+    timestamps: List[str]
+    power_values: List[List[Optional[float]]]  # None where a zone-hour has no readings
+    efficiency_values: List[List[Optional[float]]]
+
+class QueryRequest(BaseModel):
+    query_type: str
+    date_range: Optional[str] = "24h"
+    zone: Optional[str] = None
+    metric: Optional[str] = None
+    explain: bool = False
+
+class ScenarioBatchRequest(BaseModel):
+    scenario_ids: Optional[List[str]] = None  # all scenarios when omitted
+    runs: int = Field(default=1000, ge=1, le=100_000)
+    seed: Optional[int] = Field(default=None, ge=0)
+    steps_per_hour: int = Field(default=60, ge=1, le=60)
+
+class JobRequest(BaseModel):
+    kind: str  # scenario_batch, export, report or ledger_verify
+    params: Dict[str, Any] = Field(default_factory=dict)
+    priority: int = Field(default=5, ge=0, le=9)  # lower runs first
+
+class QueryResponse(BaseModel):
+    results: List[Dict[str, Any]]
+    aggregations: Dict[str, Any]
+    query_time_ms: float
+    execution_stats: Optional[Dict[str, Any]] = None
+
+# ==================== ZONE REGISTRY ====================
+# Sites (factories) and their metered zones. SITES_CONFIG names a JSON list
+# of sites, each {"id", "name", "zones": [names] or a count, and optionally
+# "grid_frequency_hz" and "timezone"}; without it the registry holds the
+# original six-zone site. Zones are numbered across sites in registration
+# order, so per-zone arrays are indexed by that position.
+
+SITES_CONFIG = os.environ.get("SITES_CONFIG", "")
+ZONE_PAGE_SIZE = int(os.environ.get("ZONE_PAGE_SIZE", "100"))
+ZONE_PAGE_MAX = 5000
+DEFAULT_SITES = [{
+    "id": "gigafactory",
+    "name": "Gigafactory",
+    "zones": ["Zone_A", "Zone_B", "Zone_C", "Zone_D", "Zone_E", "Zone_F"]
+}]
+
+@dataclass
+class Site:
+    id: str
+    name: str
+    first: int  # registry position of the site's first zone
+    zones: List[str]
+    grid_frequency_hz: float = 60.0
+    timezone: str = "UTC"
+    
+    @property
+    def positions(self) -> np.ndarray:
+        return np.arange(self.first, self.first + len(self.zones))
+    
+    def describe(self) -> Dict[str, Any]:
+        return {"id": self.id, "name": self.name, "zone_count": len(self.zones),
+                "grid_frequency_hz": self.grid_frequency_hz, "timezone": self.timezone}
+
+class ZoneRegistry:
+    """Sites and their zones; zone names map to positions shared by every per-zone array"""
+    
+    def __init__(self, sites: List[Dict[str, Any]]):
+        self.sites: Dict[str, Site] = {}
+        self.zones: List[str] = []
+        for spec in sites:
+            zones = spec["zones"]
+            if isinstance(zones, int):
+                zones = [f"{spec['id']}/Z{i:04d}" for i in range(zones)]
+            if not zones or spec["id"] in self.sites:
+                raise ValueError(f"Site {spec['id']!r} is a duplicate or has no zones")
+            self.sites[spec["id"]] = Site(
+                spec["id"], spec.get("name", spec["id"]), len(self.zones), list(zones),
+                float(spec.get("grid_frequency_hz", 60.0)), spec.get("timezone", "UTC")
+            )
+            self.zones.extend(zones)
+        self.index = {zone: i for i, zone in enumerate(self.zones)}
+        if len(self.index) != len(self.zones):
+            raise ValueError("Zone names must be unique across sites")
+        self.names = np.array(self.zones, dtype=object)
+        self.default_site = next(iter(self.sites.values()))
+    
+    @classmethod
+    def from_config(cls, path: str = SITES_CONFIG) -> "ZoneRegistry":
+        if not path:
+            return cls(DEFAULT_SITES)
+        with open(path) as f:
+            return cls(json.load(f))
+    
+    def positions(self, names: List[Any]) -> np.ndarray:
+        """Position of each zone name, -1 for unknown names"""
+        return np.fromiter((self.index.get(name, -1) if isinstance(name, str) else -1 for name in names),
+                           dtype=np.int64, count=len(names))
+
+zone_registry = ZoneRegistry.from_config()
+
+def select_zones(site: Optional[str] = None, zones: Optional[str] = None, offset: int = 0,
+                 limit: int = ZONE_PAGE_SIZE) -> Tuple[Site, np.ndarray, int]:
+    """Site, registry positions of one page of zones and the total matched (400 on unknown names).
+    
+    `zones` (comma-separated) picks zones by name, repeats dropped, otherwise
+    every zone of `site` (default: the first registered site) is paged through.
+    """
+    if site is not None and site not in zone_registry.sites:
+        raise HTTPException(status_code=400, detail=f"Unknown site: {site}")
+    selected_site = zone_registry.sites[site] if site is not None else zone_registry.default_site
+    if zones:
+        names = list(dict.fromkeys(zones.split(",")))
+        positions = zone_registry.positions(names)
+        unknown = [name for name, position in zip(names, positions.tolist()) if position < 0]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown zones: {', '.join(unknown[:20])}")
+    else:
+        positions = selected_site.positions
+    return selected_site, positions[offset:offset + limit], len(positions)
+
+def zone_scope(site: Site, positions: np.ndarray, total: int) -> str:
+    """Cache-key suffix identifying a zone selection"""
+    if total and len(positions) and np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions))):
+        return f"{site.id}:{positions[0]}+{len(positions)}"
+    return f"{site.id}:" + hashlib.blake2b(positions.tobytes(), digest_size=8).hexdigest()
+
+# ==================== DATA GENERATION ====================
+
+GRID_METRIC_FIELDS = ("solar_output", "wind_output", "megapack_charge", "grid_demand", "efficiency_ratio")
+
+rng = np.random.default_rng()
+
+def generate_time_series(hours: int = 24, base: float = 100, variance: float = 20) -> List[float]:
+    """Generate realistic time-series data with daily patterns"""
+    data = []
+    for i in range(hours):
+        hour_factor = math.sin((i / 24) * 2 * math.pi - math.pi/2) * 0.3 + 1
+        noise = random.gauss(0, variance)
+        value = base * hour_factor + noise
+        data.append(max(0, round(value, 2)))
+    return data
+
+def generate_grid_metrics_columns(hours: int = 24, zones: int = 6, step_hours: float = 1.0, start_hour: float = 0.0) -> Dict[str, np.ndarray]:
+    """Generate grid metrics for every zone at once as step-major column arrays; `hours` steps of `step_hours` each"""
+    size = hours * zones
+    hour_idx = start_hour + np.arange(hours) * step_hours
+    hour_factor = np.repeat(np.sin((hour_idx / 24) * 2 * np.pi - np.pi/2) * 0.3 + 1, zones)
+    
+    return {
+        "solar_output": np.round(80 * hour_factor + rng.normal(0, 10, size), 2),
+        "wind_output": np.round(60 + rng.normal(0, 15, size), 2),
+        "megapack_charge": np.round(rng.uniform(40, 95, size), 2),
+        "grid_demand": np.round(120 * hour_factor + rng.normal(0, 20, size), 2),
+        "efficiency_ratio": np.round(0.75 + rng.normal(0, 0.05, size), 3)
+    }
+
+def generate_uuid4_batch(count: int) -> List[str]:
+    """Generate `count` random UUID4 strings from a single entropy read"""
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    digits = raw.tobytes().hex()
+    return [
+        f"{digits[i:i+8]}-{digits[i+8:i+12]}-{digits[i+12:i+16]}-{digits[i+16:i+20]}-{digits[i+20:i+32]}"
+        for i in range(0, 32 * count, 32)
+    ]
+
+def grid_metrics_records(columns: Dict[str, np.ndarray], timestamps: List[str], zones: List[str]) -> List[Dict[str, Any]]:
+    """Serialize metric columns into GridMetrics-shaped dicts; `timestamps` and `zones` label each row"""
+    keys = ("id", "timestamp") + GRID_METRIC_FIELDS + ("zone",)
+    rows = zip(
+        generate_uuid4_batch(len(zones)),
+        timestamps,
+        *(columns[field].tolist() for field in GRID_METRIC_FIELDS),
+        zones
+    )
+    return [dict(zip(keys, row)) for row in rows]
+
+def generate_heatmap_data(positions: np.ndarray, hours: int = 24) -> Dict:
+    """Generate heatmap data for power distribution visualization for the zones at `positions`"""
+    # Hour-aligned so successive snapshots share column timestamps (see `since` on /heatmap/data)
+    current_hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    timestamps = [(current_hour - timedelta(hours=hours-1-i)).isoformat() for i in range(hours)]
+    
+    hour_factor = np.sin((np.arange(hours) / 24) * 2 * np.pi - np.pi/2) * 0.3 + 1
+    base_power = 50 + (positions % 6) * 20.0
+    power = np.maximum(0, base_power[:, None] * hour_factor + rng.normal(0, 10, (len(positions), hours)))
+    efficiency = np.clip(0.7 + rng.normal(0, 0.1, power.shape) + power / 500, 0, 1)
+    
+    return {
+        "zones": zone_registry.names[positions].tolist(),
+        "timestamps": timestamps,
+        "power_values": np.round(power, 2),
+        "efficiency_values": np.round(efficiency, 3)
+    }
+
+# ==================== REALTIME SNAPSHOTS ====================
+# Per-zone readings are drawn for the whole site at once so the totals cover
+# the site, while only the requested page of zones is itemized.
+
+GRID_ZONE_STATUSES = np.array(["optimal", "nominal", "high_demand"])
+HEATMAP_ZONE_STATUSES = np.array(["optimal", "nominal", "high_load", "low_load"])
+
+def realtime_grid_snapshot(site: Optional[Site] = None, positions: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Current real-time grid status of `site` (default site), itemizing its zones at `positions` (default: first page)"""
+    site = site or zone_registry.default_site
+    if positions is None:
+        positions = site.positions[:ZONE_PAGE_SIZE]
+    page = positions - site.first
+    power = rng.uniform(50, 150, len(site.zones))
+    demand = rng.uniform(40, 140, len(site.zones))
+    statuses = GRID_ZONE_STATUSES[rng.integers(0, len(GRID_ZONE_STATUSES), len(page))].tolist()
+    
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "site": site.id,
+        "zone_count": len(site.zones),
+        "total_generation": round(float(power.sum()), 2),
+        "total_demand": round(float(demand.sum()), 2),
+        "grid_frequency": round(site.grid_frequency_hz + random.gauss(0, 0.02), 3),
+        "zones": {
+            zone: {"power_output": p, "demand": d, "efficiency": e, "status": status}
+            for zone, p, d, e, status in zip(
+                zone_registry.names[positions].tolist(),
+                power[page].round(2).tolist(),
+                demand[page].round(2).tolist(),
+                rng.uniform(0.7, 0.95, len(page)).round(3).tolist(),
+                statuses
+            )
+        }
+    }
+
+def realtime_heatmap_snapshot(site: Optional[Site] = None, positions: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Current per-zone heatmap state for the morphing visualization, for the zones at `positions` of `site`"""
+    site = site or zone_registry.default_site
+    if positions is None:
+        positions = site.positions[:ZONE_PAGE_SIZE]
+    count = len(positions)
+    statuses = HEATMAP_ZONE_STATUSES[rng.integers(0, len(HEATMAP_ZONE_STATUSES), count)].tolist()
+    
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "site": site.id,
+        "zone_count": len(site.zones),
+        "zones": {
+            zone: {"power_level": p, "efficiency": e, "status": status, "color_intensity": c}
+            for zone, p, e, status, c in zip(
+                zone_registry.names[positions].tolist(),
+                rng.uniform(30, 100, count).round(2).tolist(),
+                rng.uniform(0.7, 0.95, count).round(3).tolist(),
+                statuses,
+                rng.uniform(0.3, 1.0, count).round(2).tolist()
+            )
+        }
+    }
+
+# ==================== TIME-SERIES STORE ====================
+
+GRID_METRICS_COLLECTION = "grid_metrics"
+INSERT_BATCH_SIZE = int(os.environ.get("INSERT_BATCH_SIZE", "10000"))
+
+def to_utc_datetime(value: Any) -> datetime:
+    """Parse an ISO timestamp (or pass a datetime through) as an aware UTC datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def summarize_explain(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Pull execution time, documents/keys examined and index usage out of an explain() document"""
+    summary = {"execution_time_ms": 0, "docs_examined": 0, "keys_examined": 0, "indexes_used": [], "collection_scan": False}
+    
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        if "executionTimeMillis" in node:
+            summary["execution_time_ms"] = max(summary["execution_time_ms"], node["executionTimeMillis"])
+        summary["docs_examined"] += node.get("totalDocsExamined", 0)
+        summary["keys_examined"] += node.get("totalKeysExamined", 0)
+        if node.get("stage") == "COLLSCAN":
+            summary["collection_scan"] = True
+        if "indexName" in node and node["indexName"] not in summary["indexes_used"]:
+            summary["indexes_used"].append(node["indexName"])
+        for value in node.values():
+            walk(value)
+    
+    walk(plan)
+    return summary
+
+class GridMetricsStore:
+    """Grid metric readings in a MongoDB time-series collection bucketed by zone"""
+    
+    def __init__(self, database, collection: str = GRID_METRICS_COLLECTION, batch_size: int = INSERT_BATCH_SIZE,
+                 rollups: Optional["RollupStore"] = None):
+        self.db = database
+        self.name = collection
+        self.collection = database[collection]
+        self.batch_size = batch_size
+        self.rollups = rollups
+    
+    async def ensure_schema(self):
+        """Create the time-series collection and its (zone, timestamp) index"""
+        if not await self.db.list_collection_names(filter={"name": self.name}):
+            try:
+                await self.db.create_collection(self.name, timeseries={
+                    "timeField": "timestamp",
+                    "metaField": "zone",
+                    "granularity": "seconds"
+                })
+            except OperationFailure:
+                # Servers older than 5.0 have no time-series collections; a plain
+                # collection with the compound index below serves the same scans.
+                logger.warning("Time-series collections unavailable, using a regular collection for %s", self.name)
+                await self.db.create_collection(self.name)
+        await self.collection.create_index([("zone", ASCENDING), ("timestamp", ASCENDING)])
+    
+    async def insert_many(self, readings: List[Dict[str, Any]]) -> int:
+        """Insert readings in `batch_size` chunks; returns the number written"""
+        return await self.insert_documents([
+            {
+                "timestamp": to_utc_datetime(reading["timestamp"]),
+                "zone": reading["zone"],
+                **{field: float(reading[field]) for field in GRID_METRIC_FIELDS}
+            }
+            for reading in readings
+        ])
+    
+    async def insert_documents(self, documents: List[Dict[str, Any]],
+                               on_chunk: Optional[Callable[[int], None]] = None) -> int:
+        """Insert prepared documents (aware UTC timestamp, zone, float metrics) in `batch_size` chunks.
+        
+        `on_chunk(rows)` runs once a chunk and its rollups are written, so a caller
+        retrying after a failure can resume from the first unfinished chunk.
+        """
+        inserted = 0
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            result = await self.collection.insert_many(batch, ordered=False)
+            inserted += len(result.inserted_ids)
+            if self.rollups is not None:
+                await self.rollups.apply(batch)
+            if on_chunk is not None:
+                on_chunk(len(batch))
+        return inserted
+    
+    async def aggregate(self, pipeline: List[Dict[str, Any]], explain: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Run a pipeline, returning its rows and timing (plus explain() statistics on request)"""
+        started = time.perf_counter()
+        rows = await self.collection.aggregate(pipeline).to_list(length=None)
+        stats = {"round_trip_ms": round((time.perf_counter() - started) * 1000, 2), "returned": len(rows)}
+        if explain:
+            plan = await self.db.command({
+                "explain": {"aggregate": self.name, "pipeline": pipeline, "cursor": {}},
+                "verbosity": "executionStats"
+            })
+            stats.update(summarize_explain(plan))
+        return rows, stats
+
+# ==================== DOWNSAMPLING ====================
+# Long chart series are reduced server-side. min/max keeps the extremes of
+# every bucket, so a lone grid_demand spike always survives; LTTB keeps the
+# visual shape and, for large inputs, picks among min/max candidates first.
+
+DOWNSAMPLE_METHODS = ("minmax", "lttb")
+DOWNSAMPLE_MAX_POINTS = 5000
+# With max_points set, series are read from the finest rollup tier holding at most this many times as many buckets
+DOWNSAMPLE_OVERSAMPLE = int(os.environ.get("DOWNSAMPLE_OVERSAMPLE", "16"))
+# min/max candidates per output point that LTTB chooses from on large inputs
+LTTB_PRESELECT = 4
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the first and last point plus the min and max of each interior bucket, ascending, at most `max_points`"""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    interior = y[1:-1]
+    size = -(-len(interior) // max(1, (max_points - 2) // 2))
+    full = len(interior) // size * size
+    blocks = interior[:full].reshape(-1, size)
+    offsets = np.arange(0, full, size)
+    lows, highs = blocks.argmin(axis=1) + offsets, blocks.argmax(axis=1) + offsets
+    if full < len(interior):
+        tail = interior[full:]
+        lows = np.append(lows, full + tail.argmin())
+        highs = np.append(highs, full + tail.argmax())
+    picks = np.unique(np.concatenate([lows, highs])) + 1
+    return np.concatenate([[0], picks, [n - 1]])
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets indices, ascending, at most `max_points`; the global min and max are always kept"""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    if n > max_points * LTTB_PRESELECT:
+        candidates = minmax_indices(y, max_points * LTTB_PRESELECT)
+        return candidates[lttb_indices(x[candidates], y[candidates], max_points)]
+    
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)  # max_points - 2 interior buckets
+    counts = np.diff(edges)
+    next_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1])[1:] / counts[1:], x[n - 1])
+    next_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1])[1:] / counts[1:], y[n - 1])
+    picks = np.empty(max_points, dtype=np.int64)
+    picks[0], picks[-1] = 0, n - 1
+    ax, ay = float(x[0]), float(y[0])
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        picks[i + 1] = lo + int(area.argmax())
+        ax, ay = float(x[picks[i + 1]]), float(y[picks[i + 1]])
+    
+    # A spike narrower than its bucket can lose to a wider triangle; swap the extremes back in
+    for extreme in (int(y.argmin()), int(y.argmax())):
+        if 0 < extreme < n - 1:
+            picks[np.searchsorted(edges, extreme, side="right")] = extreme
+    return picks
+
+def downsample_indices(x: np.ndarray, y: np.ndarray, max_points: int, method: str = "minmax") -> np.ndarray:
+    """Ascending indices of at most `max_points` points of the series (x, y) chosen by `method`"""
+    if method == "lttb":
+        return lttb_indices(x, y, max_points)
+    return minmax_indices(y, max_points)
+
+def check_downsample_method(method: str) -> str:
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown downsample method: {method} (expected one of {', '.join(DOWNSAMPLE_METHODS)})")
+    return method
+
+def frame_epoch(timestamps: List[str]) -> np.ndarray:
+    return np.array([to_utc_datetime(ts).timestamp() for ts in timestamps])
+
+def downsample_frame(frame: Dict[str, Any], max_points: int, method: str) -> Dict[str, Any]:
+    """Keep at most `max_points` buckets per zone, chosen on grid_demand; dropped cells become NaN so frame_table skips them"""
+    epoch = frame_epoch(frame["timestamps"])
+    demand = frame["columns"]["grid_demand"]
+    keep = np.zeros(demand.shape, dtype=bool)
+    for zone in range(demand.shape[1]):
+        rows = np.flatnonzero(~np.isnan(demand[:, zone]))
+        keep[rows[downsample_indices(epoch[rows], demand[rows, zone], max_points, method)], zone] = True
+    return {**frame, "columns": {field: np.where(keep, values, np.nan) for field, values in frame["columns"].items()}}
+
+def downsample_series(series: Dict[str, List[Any]], max_points: int, method: str) -> Dict[str, List[Any]]:
+    """Reduce aligned fleet series to at most `max_points` points chosen on demand, keeping them aligned"""
+    keep = downsample_indices(frame_epoch(series["timestamps"]), np.asarray(series["demand"]), max_points, method).tolist()
+    return {name: [values[i] for i in keep] for name, values in series.items()}
+
+# ==================== ROLLUPS ====================
+
+# Rollup tiers, finest first: bucket width in seconds
+ROLLUP_TIERS = {"1m": 60, "1h": 3600, "1d": 86400}
+ROLLUP_MAX_POINTS = int(os.environ.get("ROLLUP_MAX_POINTS", "300"))
+# Zone x bucket cells a downsampling read may pull into one rollup frame
+ROLLUP_MAX_FRAME_CELLS = int(os.environ.get("ROLLUP_MAX_FRAME_CELLS", "500000"))
+
+def pick_rollup_tier(span_seconds: float, max_points: int = ROLLUP_MAX_POINTS) -> str:
+    """Finest rollup tier that covers `span_seconds` in at most `max_points` buckets"""
+    for tier, seconds in ROLLUP_TIERS.items():
+        if span_seconds / seconds <= max_points:
+            return tier
+    return "1d"
+
+def check_frame_cells(span_seconds: float, zone_count: int, tier: str):
+    """413 unless a `tier` frame of `zone_count` zones over `span_seconds` stays within ROLLUP_MAX_FRAME_CELLS"""
+    cells = math.ceil(span_seconds / ROLLUP_TIERS[tier]) * zone_count
+    if cells > ROLLUP_MAX_FRAME_CELLS:
+        raise HTTPException(status_code=413, detail=f"{zone_count} zones over this range need {cells} rollup cells "
+                                                    f"(limit {ROLLUP_MAX_FRAME_CELLS}); request fewer zones or a shorter range")
+
+def pick_frame_tier(span_seconds: float, zone_count: int, max_points: int) -> str:
+    """pick_rollup_tier with the bucket budget shrunk to keep zones x buckets within ROLLUP_MAX_FRAME_CELLS (413 if daily buckets exceed it)"""
+    tier = pick_rollup_tier(span_seconds, min(max_points, ROLLUP_MAX_FRAME_CELLS // max(1, zone_count)))
+    check_frame_cells(span_seconds, zone_count, tier)
+    return tier
+
+class RollupStore:
+    """Incrementally maintained per-zone min/max/sum/count rollups of grid metrics"""
+    
+    def __init__(self, database, prefix: str = "grid_rollup"):
+        self.collections = {tier: database[f"{prefix}_{tier}"] for tier in ROLLUP_TIERS}
+    
+    async def ensure_schema(self):
+        for collection in self.collections.values():
+            await collection.create_index([("zone", ASCENDING), ("bucket", ASCENDING)], unique=True)
+            await collection.create_index([("bucket", ASCENDING), ("zone", ASCENDING)])
+    
+    async def is_empty(self) -> bool:
+        return await self.collections["1d"].find_one({}, {"_id": 1}) is None
+    
+    def range_filter(self, start: datetime, end: datetime, zones: List[str], tier: str) -> Dict[str, Any]:
+        """Filter for the buckets of `tier` overlapping [start, end)"""
+        seconds = ROLLUP_TIERS[tier]
+        first = datetime.fromtimestamp(start.timestamp() // seconds * seconds, timezone.utc)
+        return {"zone": {"$in": zones}, "bucket": {"$gte": first, "$lt": end}}
+    
+    async def has_data(self, start: datetime, end: datetime, zones: List[str], tier: str) -> bool:
+        return await self.collections[tier].find_one(self.range_filter(start, end, zones, tier), {"_id": 1}) is not None
+    
+    async def iter_documents(self, start: datetime, end: datetime, zones: List[str], tier: str, chunk_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream rollup documents over [start, end) in (bucket, zone) order, `chunk_size` at a time"""
+        cursor = self.collections[tier].find(
+            self.range_filter(start, end, zones, tier), {"_id": 0}
+        ).sort([("bucket", ASCENDING), ("zone", ASCENDING)]).batch_size(chunk_size)
+        chunk = []
+        async for doc in cursor:
+            chunk.append(doc)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    async def apply(self, documents: List[Dict[str, Any]]):
+        """Fold a batch of stored readings into every tier with one bulk upsert per tier"""
+        if not documents:
+            return
+        zone_names, zone_idx = np.unique([doc["zone"] for doc in documents], return_inverse=True)
+        epoch = np.array([doc["timestamp"].timestamp() for doc in documents])
+        values = np.array([[doc[field] for field in GRID_METRIC_FIELDS] for doc in documents])
+        
+        for tier, seconds in ROLLUP_TIERS.items():
+            buckets = (epoch // seconds).astype(np.int64) * seconds
+            keys, group = np.unique(buckets * len(zone_names) + zone_idx, return_inverse=True)
+            order = np.argsort(group, kind="stable")
+            starts = np.searchsorted(group[order], np.arange(len(keys)))
+            ordered = values[order]
+            sums = np.add.reduceat(ordered, starts).tolist()
+            mins = np.minimum.reduceat(ordered, starts).tolist()
+            maxs = np.maximum.reduceat(ordered, starts).tolist()
+            counts = np.diff(np.append(starts, len(documents))).tolist()
+            
+            operations = []
+            for i, key in enumerate(keys.tolist()):
+                bucket, zone = divmod(key, len(zone_names))
+                operations.append(UpdateOne(
+                    {"zone": str(zone_names[zone]), "bucket": datetime.fromtimestamp(bucket, timezone.utc)},
+                    {
+                        "$inc": {"count": counts[i], **{f"{field}.sum": sums[i][j] for j, field in enumerate(GRID_METRIC_FIELDS)}},
+                        "$min": {f"{field}.min": mins[i][j] for j, field in enumerate(GRID_METRIC_FIELDS)},
+                        "$max": {f"{field}.max": maxs[i][j] for j, field in enumerate(GRID_METRIC_FIELDS)}
+                    },
+                    upsert=True
+                ))
+            await self.collections[tier].bulk_write(operations, ordered=False)
+    
+    async def frame(self, start: datetime, end: datetime, zones: List[str], tier: str) -> Optional[Dict[str, Any]]:
+        """Bucket averages over [start, end) pivoted to bucket x zone arrays, or None when empty"""
+        seconds = ROLLUP_TIERS[tier]
+        docs = await self.collections[tier].find(
+            self.range_filter(start, end, zones, tier), {"_id": 0}
+        ).to_list(length=None)
+        if not docs:
+            return None
+        
+        buckets = sorted({doc["bucket"] for doc in docs})
+        bucket_pos = {bucket: i for i, bucket in enumerate(buckets)}
+        zone_pos = {zone: i for i, zone in enumerate(zones)}
+        rows = [bucket_pos[doc["bucket"]] for doc in docs]
+        cols = [zone_pos[doc["zone"]] for doc in docs]
+        
+        columns = {}
+        for field in GRID_METRIC_FIELDS:
+            grid = np.full((len(buckets), len(zones)), np.nan)
+            grid[rows, cols] = [doc[field]["sum"] / doc["count"] for doc in docs]
+            columns[field] = grid
+        
+        return {
+            "resolution": tier,
+            "bucket_seconds": seconds,
+            "timestamps": [to_utc_datetime(bucket).isoformat() for bucket in buckets],
+            "zones": zones,
+            "columns": columns
+        }
+    
+    async def backfill(self, store: "GridMetricsStore", batch_size: int = INSERT_BATCH_SIZE):
+        """Rebuild every tier from the raw readings already in `store`"""
+        cursor = store.collection.find({}, {"_id": 0})
+        batch = []
+        async for doc in cursor:
+            doc["timestamp"] = to_utc_datetime(doc["timestamp"])
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await self.apply(batch)
+                batch = []
+        await self.apply(batch)
+
+def frame_table(frame: Dict[str, Any]) -> Dict[str, Any]:
+    """Timestamp, zone and rounded metric columns for every populated (bucket, zone) cell of a rollup frame"""
+    columns = frame["columns"]
+    bucket_idx, zone_idx = np.nonzero(~np.isnan(columns["grid_demand"]))
+    table = {
+        field: np.round(columns[field][bucket_idx, zone_idx], 3 if field == "efficiency_ratio" else 2)
+        for field in GRID_METRIC_FIELDS
+    }
+    table["timestamp"] = [frame["timestamps"][i] for i in bucket_idx.tolist()]
+    table["zone"] = [frame["zones"][i] for i in zone_idx.tolist()]
+    return table
+
+def frame_aggregations(frame: Dict[str, Any], hours: int) -> Dict[str, float]:
+    """Fleet-wide KPI aggregations over a rollup frame (per-bucket totals across zones)"""
+    columns = frame["columns"]
+    bucket_hours = frame["bucket_seconds"] / 3600
+    demand = np.nansum(columns["grid_demand"], axis=1)
+    solar = np.nansum(columns["solar_output"], axis=1)
+    wind = np.nansum(columns["wind_output"], axis=1)
+    expected_buckets = max(1, math.ceil(hours / bucket_hours))
+    return {
+        "avg_efficiency": round(float(np.nanmean(columns["efficiency_ratio"])), 3),
+        "max_demand": round(float(demand.max()), 2),
+        "min_demand": round(float(demand.min()), 2),
+        "total_renewable_kwh": round(float((solar + wind).sum() * bucket_hours), 2),
+        "peak_solar_output": round(float(solar.max()), 2),
+        "peak_wind_output": round(float(wind.max()), 2),
+        "uptime_percentage": round(min(100.0, 100 * len(frame["timestamps"]) / expected_buckets), 2)
+    }
+
+def frame_series(frame: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Fleet demand, generation and efficiency for every bucket in a rollup frame"""
+    columns = frame["columns"]
+    return {
+        "timestamps": frame["timestamps"],
+        "demand": np.round(np.nansum(columns["grid_demand"], axis=1), 2).tolist(),
+        "generation": np.round(np.nansum(columns["solar_output"] + columns["wind_output"], axis=1), 2).tolist(),
+        "efficiency": np.round(np.nanmean(columns["efficiency_ratio"], axis=1), 3).tolist()
+    }
+
+# Pre-adaptive-dispatch grid efficiency and displaced grid emissions, for KPI derivation
+EFFICIENCY_BASELINE = 0.6
+CO2_KG_PER_KWH = 0.4
+
+def frame_kpis(frame: Dict[str, Any]) -> KPIData:
+    """Dashboard KPI cards derived from the last day of hourly rollups"""
+    columns = frame["columns"]
+    generation = np.nansum(columns["solar_output"] + columns["wind_output"], axis=1)
+    demand = np.nansum(columns["grid_demand"], axis=1)
+    peak = int(np.argmax(demand))
+    aggregations = frame_aggregations(frame, 24)
+    return KPIData(
+        total_renewable_output=round(float(generation[-1]), 2),
+        grid_uptime=aggregations["uptime_percentage"],
+        efficiency_gain=round((aggregations["avg_efficiency"] / EFFICIENCY_BASELINE - 1) * 100, 2),
+        co2_savings=round(aggregations["total_renewable_kwh"] * CO2_KG_PER_KWH / 1000, 2),
+        megapack_capacity=round(float(np.nanmean(columns["megapack_charge"][-1])), 2),
+        peak_demand_handled=round(min(100.0, 100 * float(generation[peak]) / max(float(demand[peak]), 1e-9)), 2),
+        sparkline_data=np.round(generation, 2).tolist()
+    )
+
+rollup_store = RollupStore(db)
+metrics_store = GridMetricsStore(db, rollups=rollup_store)
+
+def synthetic_frame(hours: int, tier: str, zones: List[str]) -> Dict[str, Any]:
+    """Rollup-frame-shaped synthetic metrics of `zones` for the trailing `hours` hours at `tier` resolution"""
+    seconds = ROLLUP_TIERS[tier]
+    steps = max(1, math.ceil(hours * 3600 / seconds))
+    columns = generate_grid_metrics_columns(steps, len(zones), seconds / 3600)
+    now = datetime.now(timezone.utc)
+    return {
+        "resolution": tier,
+        "bucket_seconds": seconds,
+        "timestamps": [(now - timedelta(seconds=seconds * (steps - i))).isoformat() for i in range(steps)],
+        "zones": zones,
+        "columns": {field: values.reshape(steps, len(zones)) for field, values in columns.items()}
+    }
+
+async def grid_metrics_table(hours: int, zones: Optional[List[str]] = None, max_points: Optional[int] = None,
+                             method: str = "minmax") -> Dict[str, Any]:
+    """Per-zone grid metric columns of `zones` (default: every zone) from the rollups, or synthetic while none are stored.
+    
+    Hourly by default. With `max_points`, the finest tier within
+    DOWNSAMPLE_OVERSAMPLE times that budget is read and every zone's series
+    reduced to at most `max_points` buckets. Either way the frame stays within
+    ROLLUP_MAX_FRAME_CELLS (413 otherwise).
+    """
+    if zones is None:
+        zones = zone_registry.zones
+    if max_points is None:
+        tier = "1h"
+        check_frame_cells(hours * 3600, len(zones), tier)
+    else:
+        tier = pick_frame_tier(hours * 3600, len(zones), max_points * DOWNSAMPLE_OVERSAMPLE)
+    now = datetime.now(timezone.utc)
+    frame = await rollup_store.frame(now - timedelta(hours=hours), now, zones, tier)
+    if frame is None:
+        frame = synthetic_frame(hours, tier, zones)
+    if max_points is not None:
+        frame = downsample_frame(frame, max_points, method)
+    return frame_table(frame)
+
+async def grid_metrics_snapshot(hours: int, zones: Optional[List[str]] = None, max_points: Optional[int] = None,
+                                method: str = "minmax") -> List[Dict[str, Any]]:
+    """GridMetrics-shaped rows for the trailing `hours` hours"""
+    # Rows are serialized straight from the column arrays; building one
+    # GridMetrics per row and re-validating it dominated request time.
+    table = await grid_metrics_table(hours, zones, max_points, method)
+    return await asyncio.to_thread(grid_metrics_records, table, table["timestamp"], table["zone"])
+
+async def heatmap_matrices(hours: int, since: Optional[datetime] = None, zones: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Zone x hour power and efficiency arrays of `zones` (default: every zone) from the rollups, or synthetic while none are stored.
+    
+    With `since`, only the hour columns at or after it are returned; the column
+    holding `since` is included because the current hour keeps filling in.
+    Zone-hours without readings are NaN.
+    """
+    if zones is None:
+        zones = zone_registry.zones
+    check_frame_cells(hours * 3600, len(zones), "1h")
+    now = datetime.now(timezone.utc)
+    window_start = now - timedelta(hours=hours)
+    start = max(window_start, since) if since is not None else window_start
+    frame = await rollup_store.frame(start, now, zones, "1h")
+    if frame is not None:
+        columns = frame["columns"]
+        return {
+            "zones": frame["zones"],
+            "timestamps": frame["timestamps"],
+            "power_values": np.round(columns["grid_demand"].T, 2),
+            "efficiency_values": np.round(columns["efficiency_ratio"].T, 3)
+        }
+    if since is not None and await rollup_store.has_data(window_start, now, zones, "1h"):
+        empty = np.empty((len(zones), 0))
+        return {"zones": zones, "timestamps": [], "power_values": empty, "efficiency_values": empty}
+    
+    data = generate_heatmap_data(zone_registry.positions(zones), hours)
+    keep = slice(None)
+    if since is not None:
+        keep = slice(sum(to_utc_datetime(ts) < since for ts in data["timestamps"]), None)
+    data["timestamps"] = data["timestamps"][keep]
+    data["power_values"] = data["power_values"][:, keep]
+    data["efficiency_values"] = data["efficiency_values"][:, keep]
+    return data
+
+def nan_to_none(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    """Nested lists of `matrix` with NaN as None, so missing cells serialize as null"""
+    rows = matrix.tolist()
+    for i, j in np.argwhere(np.isnan(matrix)).tolist():
+        rows[i][j] = None
+    return rows
+
+async def heatmap_data_snapshot(hours: int, since: Optional[datetime] = None, zones: Optional[List[str]] = None) -> HeatmapData:
+    """Zone x hour power and efficiency matrices for the trailing `hours` hours (or just those from `since`)"""
+    data = await heatmap_matrices(hours, since, zones)
+    return HeatmapData(
+        zones=data["zones"],
+        timestamps=data["timestamps"],
+        power_values=nan_to_none(data["power_values"]),
+        efficiency_values=nan_to_none(data["efficiency_values"])
+    )
+
+async def kpi_summary_snapshot() -> KPIData:
+    """Dashboard KPIs from the last day of rollups, or synthetic while none are stored"""
+    now = datetime.now(timezone.utc)
+    frame = await rollup_store.frame(now - timedelta(hours=24), now, zone_registry.zones, "1h")
+    if frame is not None:
+        return frame_kpis(frame)
+    
+    return KPIData(
+        total_renewable_output=round(random.uniform(450, 550), 2),
+        grid_uptime=round(99.5 + random.uniform(0, 0.5), 2),
+        efficiency_gain=round(25 + random.uniform(0, 10), 2),
+        co2_savings=round(1200 + random.uniform(0, 300), 2),
+        megapack_capacity=round(random.uniform(70, 95), 2),
+        peak_demand_handled=round(random.uniform(85, 98), 2),
+        sparkline_data=generate_time_series(24, 100, 15)
+    )
+
+# ==================== WORKER DIRECTORIES ====================
+# The ledger, SNN checkpoints and job results each assume one writing process.
+# A worker claims a directory under an exclusive lock held for its lifetime:
+# the first claimant gets the configured path, other workers of the same
+# deployment (uvicorn --workers N, gunicorn) the next free `<name>-<n>`
+# sibling. The lock dies with its process, so a restarted worker takes a free
+# slot back along with whatever it left there.
+
+WORKER_LOCK_FILE = ".worker.lock"
+claimed_directories: Dict[Path, Path] = {}
+directory_locks: List[io.TextIOWrapper] = []
+
+def claim_worker_directory(base: Path) -> Path:
+    """`base`, or the first `base`-n sibling no other live process has claimed; idempotent within a process"""
+    base = Path(base)
+    if base in claimed_directories:
+        return claimed_directories[base]
+    slot = 0
+    while True:
+        path = base if slot == 0 else base.with_name(f"{base.name}-{slot}")
+        path.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            break
+        handle = open(path / WORKER_LOCK_FILE, "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            slot += 1
+            continue
+        directory_locks.append(handle)
+        break
+    if slot:
+        logger.info(f"{base} is held by another worker; using {path}")
+    claimed_directories[base] = claimed_directories[path] = path
+    return path
+
+# ==================== SPIKING NETWORK ====================
+# Leaky integrate-and-fire reservoir over the five SNN neuron groups. The
+# input groups are driven by hourly fleet history, every membrane is updated
+# at once per step, and a ridge readout of per-hour spike counts predicts the
+# next hour; forecasts are rolled forward by feeding predictions back in. The
+# readout is fit once and then updated by recursive least squares as each new
+# hour arrives, with its state checkpointed to memory-mapped .npy files.
+
+SNN_GROUPS = {"solar_input": 100, "wind_input": 100, "demand_sensor": 150, "storage_control": 80, "grid_balance": 200}
+SNN_METRICS = ("grid_demand", "solar_output", "wind_output", "megapack_charge")
+SNN_CHANNELS = SNN_METRICS + ("hour_sin", "hour_cos")
+SNN_TARGETS = 3  # the readout predicts the first three metrics
+# Group -> (history metric it is tuned to, input gain scale)
+SNN_INPUTS = {
+    "solar_input": ("solar_output", 1.0),
+    "wind_input": ("wind_output", 1.0),
+    "demand_sensor": ("grid_demand", 1.0),
+    "storage_control": ("megapack_charge", 0.5)
+}
+# (pre group, post group, connection probability, weight mean, weight std)
+SNN_CONNECTIONS = [
+    ("solar_input", "storage_control", 0.1, 0.04, 0.01),
+    ("wind_input", "storage_control", 0.1, 0.04, 0.01),
+    ("demand_sensor", "storage_control", 0.1, 0.04, 0.01),
+    ("solar_input", "grid_balance", 0.1, 0.1, 0.03),
+    ("wind_input", "grid_balance", 0.1, 0.1, 0.03),
+    ("demand_sensor", "grid_balance", 0.1, 0.1, 0.03),
+    ("storage_control", "grid_balance", 0.1, -0.1, 0.03),
+    ("grid_balance", "grid_balance", 0.05, 0.0, 0.15)
+]
+SNN_STEPS_PER_HOUR = 20
+SNN_DT_MS = 5.0
+SNN_TAU_MS = 25.0
+SNN_HISTORY_HOURS = int(os.environ.get("SNN_HISTORY_HOURS", "96"))
+SNN_MIN_HISTORY_HOURS = 48
+SNN_HORIZON_HOURS = 24
+SNN_WARMUP_HOURS = 4
+SNN_RIDGE_PENALTY = float(os.environ.get("SNN_RIDGE_PENALTY", "1.0"))
+SNN_SEED = int(os.environ.get("SNN_SEED", "7"))
+SNN_PROBE_NEURONS = 5  # neurons per group whose spike times are reported
+SNN_FORGETTING = float(os.environ.get("SNN_FORGETTING", "1.0"))  # RLS forgetting factor; 1.0 = exact recursive ridge
+SNN_ERROR_WINDOW = 168  # hours of a-priori forecast errors kept for drift reporting
+SNN_CHECKPOINT_DIR = os.environ.get("SNN_CHECKPOINT_DIR", str(ROOT_DIR / "snn_checkpoint"))  # "" disables checkpoints
+
+class SpikingGridForecaster:
+    """LIF reservoir with sparse (ELL) synapses and an online ridge readout of next-hour fleet demand, solar and wind"""
+    
+    def __init__(self, seed: int = SNN_SEED):
+        self.seed = seed
+        net_rng = np.random.default_rng(seed)
+        self.groups: Dict[str, slice] = {}
+        offset = 0
+        for name, count in SNN_GROUPS.items():
+            self.groups[name] = slice(offset, offset + count)
+            offset += count
+        self.size = offset
+        self.decay = math.exp(-SNN_DT_MS / SNN_TAU_MS)
+        
+        # External drive: bias + encoders @ channels, with mixed-sign tuning to the group's metric
+        self.bias = np.zeros(self.size)
+        self.encoders = np.zeros((self.size, len(SNN_CHANNELS)))
+        for group, (metric, gain) in SNN_INPUTS.items():
+            neurons = self.groups[group]
+            count = neurons.stop - neurons.start
+            self.bias[neurons] = net_rng.uniform(0.1, 0.3, count) * gain
+            self.encoders[neurons, SNN_CHANNELS.index(metric)] = net_rng.uniform(0.05, 0.15, count) * net_rng.choice([-1, 1], count) * gain
+            self.encoders[neurons, -2:] = net_rng.normal(0, 0.03, (count, 2))
+        
+        # Synapses in ELL layout: one row of targets per presynaptic neuron, padded
+        # to the largest out-degree with zero-weight edges into a sink neuron
+        pre, post, weights = [], [], []
+        for source, target, probability, mean, std in SNN_CONNECTIONS:
+            src, dst = self.groups[source], self.groups[target]
+            i, j = np.nonzero(net_rng.random((src.stop - src.start, dst.stop - dst.start)) < probability)
+            pre.append(i + src.start)
+            post.append(j + dst.start)
+            weights.append(net_rng.normal(mean, std, len(i)))
+        pre = np.concatenate(pre)
+        order = np.argsort(pre, kind="stable")
+        pre, post, weights = pre[order], np.concatenate(post)[order], np.concatenate(weights)[order]
+        degree = np.bincount(pre, minlength=self.size)
+        slot = np.arange(len(pre)) - np.repeat(np.cumsum(degree) - degree, degree)
+        self.targets = np.full((self.size, degree.max()), self.size)
+        self.synapse_weights = np.zeros((self.size, degree.max()))
+        self.targets[pre, slot] = post
+        self.synapse_weights[pre, slot] = weights
+        self.synapse_count = len(pre)
+        
+        self.readout: Optional[np.ndarray] = None
+        self.precision: Optional[np.ndarray] = None
+        self.last_hour = -1
+        self.checkpoint_version = 0
+        self.activity: Optional[Dict[str, Any]] = None
+        self.reset()
+    
+    def reset(self):
+        self.v = np.zeros(self.size)
+        self.synaptic = np.zeros(self.size)
+        self.last_spiked = np.empty(0, dtype=np.int64)
+    
+    def propagate(self, spiked: np.ndarray) -> np.ndarray:
+        """Postsynaptic input from the synapse rows of the neurons that just spiked"""
+        return np.bincount(
+            self.targets[spiked].ravel(), weights=self.synapse_weights[spiked].ravel(), minlength=self.size + 1
+        )[:self.size]
+    
+    def run_hour(self, channels: np.ndarray, record: bool = False) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Present one hour of input for SNN_STEPS_PER_HOUR steps; per-neuron spike counts (and spikes per step if `record`)"""
+        current = self.bias + self.encoders @ channels
+        counts = np.zeros(self.size)
+        steps = []
+        v, synaptic, last_spiked = self.v, self.synaptic, self.last_spiked
+        for _ in range(SNN_STEPS_PER_HOUR):
+            v = v * self.decay + current + synaptic
+            v[last_spiked] = 0.0  # one-step refractory period after a spike
+            spiked = np.flatnonzero(v >= 1.0)
+            v[spiked] = 0.0
+            counts[spiked] += 1
+            synaptic = self.propagate(spiked)
+            last_spiked = spiked
+            if record:
+                steps.append(spiked)
+        self.v, self.synaptic, self.last_spiked = v, synaptic, last_spiked
+        return counts, steps
+    
+    @staticmethod
+    def channels(values: np.ndarray, hour: float) -> np.ndarray:
+        """Input channels for one hour: normalized metrics plus time of day on the unit circle"""
+        angle = 2 * np.pi * hour / 24
+        return np.concatenate([values, [np.sin(angle), np.cos(angle)]])
+    
+    def fit(self, history: np.ndarray, hours: np.ndarray):
+        """Refit from scratch on `history` (hours x SNN_METRICS, oldest first, `hours` = epoch hour per row)"""
+        self.mean, self.std = history.mean(axis=0), history.std(axis=0) + 1e-9
+        normalized = (history - self.mean) / self.std
+        
+        self.reset()
+        states = np.empty((len(history), self.size + 1))
+        states[:, -1] = 1.0
+        for t in range(len(history)):
+            states[t, :-1] = self.run_hour(self.channels(normalized[t], hours[t]))[0] / SNN_STEPS_PER_HOUR
+        
+        # Ridge in dual form (fewer hours than neurons), scored by leave-one-out residuals
+        x = states[SNN_WARMUP_HOURS:-1]
+        y = normalized[SNN_WARMUP_HOURS + 1:, :SNN_TARGETS]
+        gram = x @ x.T
+        inverse = np.linalg.inv(gram + SNN_RIDGE_PENALTY * np.eye(len(x)))
+        self.readout = x.T @ (inverse @ y)
+        # Primal (x'x + penalty I)^-1 by Woodbury, the starting point for the online updates
+        self.precision = (np.eye(self.size + 1) - x.T @ inverse @ x) / SNN_RIDGE_PENALTY
+        hat = gram @ inverse
+        loo = (y - hat @ y) / (1 - np.diag(hat))[:, None]
+        self.target_var = float(np.mean(y.var(axis=0))) + 1e-9
+        self.loo_mse = float(np.mean(loo ** 2))
+        
+        self.features = states[-1].copy()
+        self.last_input = normalized[-1].copy()
+        self.last_hour = int(hours[-1])
+        self.samples = 0
+        self.errors = np.full(SNN_ERROR_WINDOW, np.nan)
+        self.last_update = 0.0
+    
+    def learn(self, values: np.ndarray, hour: int) -> float:
+        """Recursive least squares step on one newly observed hour, then advance the reservoir with it; returns the a-priori squared error"""
+        normalized = (values - self.mean) / self.std
+        x = self.features
+        error = normalized[:SNN_TARGETS] - x @ self.readout
+        px = self.precision @ x
+        gain = px / (SNN_FORGETTING + x @ px)
+        update = np.outer(gain, error)
+        self.readout += update
+        self.precision -= np.outer(gain, px)
+        if SNN_FORGETTING < 1.0:
+            self.precision /= SNN_FORGETTING
+        self.last_update = float(np.linalg.norm(update) / (np.linalg.norm(self.readout) + 1e-12))
+        
+        self.features[:-1] = self.run_hour(self.channels(normalized, hour))[0] / SNN_STEPS_PER_HOUR
+        self.last_input = normalized
+        self.last_hour = int(hour)
+        self.samples += 1
+        squared = float(np.mean(error ** 2))
+        self.errors = np.roll(self.errors, -1)
+        self.errors[-1] = squared
+        return squared
+    
+    def advance(self, history: np.ndarray, hours: np.ndarray, checkpoint_dir: Optional[str] = None) -> Dict[str, Any]:
+        """Bring the model up to the last row of `history`: sync from the checkpoint, learn unseen hours, or refit when there is no usable state"""
+        t0 = time.perf_counter()
+        loaded = bool(checkpoint_dir) and self.load_checkpoint(checkpoint_dir)
+        load_ms = (time.perf_counter() - t0) * 1000
+        
+        t0 = time.perf_counter()
+        unseen = hours > self.last_hour if self.readout is not None else None
+        if unseen is None or (unseen.any() and hours[unseen][0] - self.last_hour > SNN_HISTORY_HOURS):
+            self.fit(history, hours)
+            mode, learned = "refit", 0
+        else:
+            for values, hour in zip(history[unseen], hours[unseen]):
+                self.learn(values, hour)
+            mode, learned = "online", int(unseen.sum())
+        update_ms = (time.perf_counter() - t0) * 1000
+        
+        t0 = time.perf_counter()
+        if checkpoint_dir and (mode == "refit" or learned):
+            self.save_checkpoint(checkpoint_dir)
+        checkpoint_ms = (time.perf_counter() - t0) * 1000
+        return {
+            "mode": mode,
+            "learned": learned,
+            "update_ms": round(update_ms, 3),
+            "checkpoint_loaded": loaded,
+            "load_ms": round(load_ms, 3),
+            "checkpoint_ms": round(checkpoint_ms, 3),
+            **self.learning_stats()
+        }
+    
+    def forecast(self, horizon: int = SNN_HORIZON_HOURS) -> Dict[str, Any]:
+        """Roll the readout forward `horizon` hours, feeding each prediction back in; the learned reservoir state is restored afterwards"""
+        saved = (self.v.copy(), self.synaptic.copy(), self.last_spiked.copy())
+        predictions = np.empty((horizon, SNN_TARGETS))
+        predictions[0] = self.features @ self.readout
+        state = np.ones(self.size + 1)
+        recorded = None
+        for k in range(1, horizon):
+            values = np.concatenate([predictions[k - 1], self.last_input[SNN_TARGETS:]])
+            counts, steps = self.run_hour(self.channels(values, self.last_hour + k), record=recorded is None)
+            recorded = recorded or (counts, steps)
+            state[:-1] = counts / SNN_STEPS_PER_HOUR
+            predictions[k] = state @ self.readout
+        
+        forecast = np.maximum(predictions * self.std[:SNN_TARGETS] + self.mean[:SNN_TARGETS], 0)
+        counts, steps = recorded if recorded else (np.zeros(self.size), [])
+        self.activity = self.describe_activity(counts)
+        patterns = self.spike_patterns(counts, steps)
+        self.v, self.synaptic, self.last_spiked = saved
+        return {
+            "predicted": {metric: np.round(forecast[:, i], 2).tolist() for i, metric in enumerate(SNN_METRICS[:SNN_TARGETS])},
+            "confidence": round(self.confidence(), 3),
+            "spike_patterns": patterns
+        }
+    
+    def predict(self, history: np.ndarray, hours: np.ndarray, horizon: int = SNN_HORIZON_HOURS) -> Dict[str, Any]:
+        """Refit on `history` and forecast `horizon` hours"""
+        self.fit(history, hours)
+        return self.forecast(horizon)
+    
+    def rolling_mse(self, window: int) -> Optional[float]:
+        recent = self.errors[-window:]
+        recent = recent[~np.isnan(recent)]
+        return float(recent.mean()) if len(recent) else None
+    
+    def confidence(self) -> float:
+        """1 - normalized MSE of the last day's online forecasts, or of the refit's leave-one-out residuals before that"""
+        mse = self.rolling_mse(24)
+        return float(np.clip(1 - (self.loo_mse if mse is None else mse) / self.target_var, 0, 1))
+    
+    def learning_stats(self) -> Dict[str, Any]:
+        """Online sample count, last weight change and a-priori forecast error (normalized MSE) against the refit's"""
+        recent = self.rolling_mse(24)
+        return {
+            "samples": self.samples,
+            "last_hour": datetime.fromtimestamp(self.last_hour * 3600, timezone.utc).isoformat(),
+            "learning_rate": round(self.last_update, 6),
+            "refit_mse": round(self.loo_mse, 4),
+            "rolling_mse_24h": None if recent is None else round(recent, 4),
+            "rolling_mse_168h": None if self.rolling_mse(SNN_ERROR_WINDOW) is None else round(self.rolling_mse(SNN_ERROR_WINDOW), 4),
+            "drift": None if recent is None else round(recent - self.loo_mse, 4)
+        }
+    
+    def save_checkpoint(self, directory: str):
+        """Write the learned state as .npy memmaps in a new version folder, then point meta.json at it"""
+        root = Path(directory)
+        version = self.checkpoint_version + 1
+        folder = root / f"{version:08d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        spiked = np.zeros(self.size, dtype=bool)
+        spiked[self.last_spiked] = True
+        arrays = {
+            "readout": self.readout, "precision": self.precision, "features": self.features,
+            "last_input": self.last_input, "errors": self.errors, "v": self.v, "synaptic": self.synaptic,
+            "spiked": spiked, "mean": self.mean, "std": self.std
+        }
+        for name, value in arrays.items():
+            mapped = np.lib.format.open_memmap(folder / f"{name}.npy", mode="w+", dtype=value.dtype, shape=value.shape)
+            mapped[...] = value
+            mapped.flush()
+            del mapped
+        
+        meta = {
+            "version": version, "seed": self.seed, "size": self.size, "last_hour": self.last_hour,
+            "samples": self.samples, "target_var": self.target_var, "loo_mse": self.loo_mse, "last_update": self.last_update
+        }
+        staging = root / "meta.json.tmp"
+        staging.write_text(json.dumps(meta))
+        os.replace(staging, root / "meta.json")
+        self.checkpoint_version = version
+        for old in root.iterdir():
+            if old.is_dir() and old.name != folder.name:
+                shutil.rmtree(old, ignore_errors=True)
+    
+    def load_checkpoint(self, directory: str) -> bool:
+        """Map the newest checkpoint copy-on-write if it is ahead of this process's state; False if there is none to load"""
+        root = Path(directory)
+        if not (root / "meta.json").exists():
+            return False
+        try:
+            meta = json.loads((root / "meta.json").read_text())
+            if meta["version"] == self.checkpoint_version or meta["seed"] != self.seed or meta["size"] != self.size:
+                return False
+            folder = root / f"{meta['version']:08d}"
+            arrays = {
+                name: np.load(folder / f"{name}.npy", mmap_mode="c")
+                for name in ("readout", "precision", "features", "last_input", "errors", "v", "synaptic", "spiked", "mean", "std")
+            }
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"SNN checkpoint not loaded: {e}")
+            return False
+        
+        self.readout, self.precision, self.features = arrays["readout"], arrays["precision"], arrays["features"]
+        self.last_input, self.errors = np.array(arrays["last_input"]), np.array(arrays["errors"])
+        self.v, self.synaptic = np.array(arrays["v"]), np.array(arrays["synaptic"])
+        self.last_spiked = np.flatnonzero(arrays["spiked"])
+        self.mean, self.std = np.array(arrays["mean"]), np.array(arrays["std"])
+        self.last_hour, self.samples = meta["last_hour"], meta["samples"]
+        self.target_var, self.loo_mse, self.last_update = meta["target_var"], meta["loo_mse"], meta["last_update"]
+        self.checkpoint_version = meta["version"]
+        return True
+    
+    def spike_patterns(self, counts: np.ndarray, steps: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """Per-group probe spike times (ms), firing rate and mean membrane potential (mV) of one simulated hour"""
+        patterns = []
+        for name, neurons in self.groups.items():
+            probe_end = neurons.start + SNN_PROBE_NEURONS
+            spike_times = [
+                round(step * SNN_DT_MS, 1) for step, spiked in enumerate(steps)
+                for _ in range(int(np.count_nonzero((spiked >= neurons.start) & (spiked < probe_end))))
+            ]
+            patterns.append({
+                "neuron_group": name,
+                "spike_times": spike_times,
+                "firing_rate": round(float(counts[neurons].mean()) / SNN_STEPS_PER_HOUR, 4),
+                "membrane_potential": round(-70 + 20 * float(self.v[neurons].mean()), 2)
+            })
+        return patterns
+    
+    def describe_activity(self, counts: np.ndarray) -> Dict[str, Any]:
+        return {
+            "neuron_groups": {
+                name: {"neurons": neurons.stop - neurons.start, "active": int(np.count_nonzero(counts[neurons]))}
+                for name, neurons in self.groups.items()
+            },
+            "total_spikes": int(counts.sum())
+        }
+
+snn_forecaster = SpikingGridForecaster()
+
+def run_snn_forecast(history: np.ndarray, hours: np.ndarray, checkpoint_dir: str = "") -> Dict[str, Any]:
+    """Process-pool entry point: learn unseen hours and forecast on this process's network, with its start time and wall time"""
+    started_at = time.time()
+    t0 = time.perf_counter()
+    learning = snn_forecaster.advance(history, hours, checkpoint_dir)
+    result = snn_forecaster.forecast()
+    result["activity"] = snn_forecaster.activity
+    result["learning"] = learning
+    result["started_at"] = started_at
+    result["inference_ms"] = (time.perf_counter() - t0) * 1000
+    return result
+
+async def fleet_history(hours: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Hourly fleet-average SNN_METRICS (hours x metrics) and epoch hour per row over the last complete hours, stored or synthetic"""
+    now = datetime.now(timezone.utc)
+    current_hour = int(now.timestamp() // 3600)
+    frame = await rollup_store.frame(now - timedelta(hours=hours), now, zone_registry.zones, "1h")
+    if frame is not None:
+        epoch_hours = np.array([int(to_utc_datetime(ts).timestamp() // 3600) for ts in frame["timestamps"]])
+        complete = epoch_hours < current_hour
+        if complete.sum() >= SNN_MIN_HISTORY_HOURS:
+            values = np.column_stack([np.nanmean(frame["columns"][metric], axis=1) for metric in SNN_METRICS])
+            return values[complete], epoch_hours[complete]
+    
+    columns = generate_grid_metrics_columns(hours, len(zone_registry.zones), start_hour=(current_hour - hours) % 24)
+    values = np.column_stack([columns[metric].reshape(hours, -1).mean(axis=1) for metric in SNN_METRICS])
+    return values, np.arange(current_hour - hours, current_hour)
+
+# ==================== SNN SCHEDULER ====================
+# Forecasts run on a fixed cadence in a process pool so neither the event
+# loop nor request latency pays for inference; the API reads the latest one.
+
+SNN_FORECAST_INTERVAL = float(os.environ.get("SNN_FORECAST_INTERVAL", "300"))
+SNN_WORKERS = int(os.environ.get("SNN_WORKERS", "1"))  # 0 runs forecasts in a thread instead
+SNN_FIRST_FORECAST_TIMEOUT = float(os.environ.get("SNN_FIRST_FORECAST_TIMEOUT", "15"))
+
+@dataclass
+class ForecastRecord:
+    version: int
+    prediction: SNNPrediction
+    activity: Dict[str, Any]
+    learning: Dict[str, Any]
+    generated_at: datetime
+    inference_ms: float
+    queue_lag_ms: float
+
+class SNNForecastScheduler:
+    """Runs SNN forecasts every `interval` seconds in a process pool and keeps the latest versioned result"""
+    
+    def __init__(self, interval: float = SNN_FORECAST_INTERVAL, workers: int = SNN_WORKERS):
+        self.interval = interval
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.task: Optional[asyncio.Task] = None
+        self.checkpoint_dir = ""
+        self.latest: Optional[ForecastRecord] = None
+        self.first_forecast: Optional[asyncio.Event] = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped_ticks = 0
+        self.inference_ms_total = 0.0
+        self.inference_ms_max = 0.0
+        self.queue_lag_ms_max = 0.0
+        self.learned_samples = 0
+        self.learn_ms_total = 0.0
+    
+    def start(self):
+        if SNN_CHECKPOINT_DIR:
+            self.checkpoint_dir = str(claim_worker_directory(Path(SNN_CHECKPOINT_DIR)))
+        if self.workers > 0:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.first_forecast = asyncio.Event()
+        self.task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+    
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            scheduled_at = time.time()
+            try:
+                await self.run_once(scheduled_at)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"SNN forecast failed: {e}")
+            next_tick += self.interval
+            now = loop.time()
+            if next_tick < now:  # a forecast overran its slot; skip to the next free one
+                missed = math.ceil((now - next_tick) / self.interval)
+                self.skipped_ticks += missed
+                next_tick += missed * self.interval
+            await asyncio.sleep(next_tick - now)
+    
+    async def run_once(self, scheduled_at: Optional[float] = None) -> ForecastRecord:
+        """Forecast from the current history and publish it as the next version"""
+        scheduled_at = scheduled_at or time.time()
+        history, hours = await fleet_history(SNN_HISTORY_HOURS)
+        if self.executor is not None:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, run_snn_forecast, history, hours, self.checkpoint_dir)
+        else:
+            result = await asyncio.to_thread(run_snn_forecast, history, hours, self.checkpoint_dir)
+        
+        generated_at = datetime.now(timezone.utc)
+        version = self.latest.version + 1 if self.latest else 1
+        record = ForecastRecord(
+            version=version,
+            prediction=SNNPrediction(
+                timestamp=generated_at.isoformat(),
+                predicted_demand=result["predicted"]["grid_demand"],
+                predicted_solar=result["predicted"]["solar_output"],
+                predicted_wind=result["predicted"]["wind_output"],
+                confidence=result["confidence"],
+                spike_patterns=result["spike_patterns"],
+                forecast_version=version,
+                generated_at=generated_at.isoformat()
+            ),
+            activity=result["activity"],
+            learning=result["learning"],
+            generated_at=generated_at,
+            inference_ms=result["inference_ms"],
+            queue_lag_ms=max(0.0, (result["started_at"] - scheduled_at) * 1000)
+        )
+        self.latest = record
+        self.runs += 1
+        self.inference_ms_total += record.inference_ms
+        self.inference_ms_max = max(self.inference_ms_max, record.inference_ms)
+        self.queue_lag_ms_max = max(self.queue_lag_ms_max, record.queue_lag_ms)
+        if record.learning["learned"]:
+            self.learned_samples += record.learning["learned"]
+            self.learn_ms_total += record.learning["update_ms"]
+        if self.first_forecast is not None:
+            self.first_forecast.set()
+        return record
+    
+    async def current(self) -> Optional[ForecastRecord]:
+        """Latest forecast, waiting briefly for the first one after startup"""
+        if self.latest is None and self.first_forecast is not None:
+            try:
+                await asyncio.wait_for(self.first_forecast.wait(), SNN_FIRST_FORECAST_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        return self.latest
+    
+    def age_seconds(self) -> Optional[float]:
+        if self.latest is None:
+            return None
+        return (datetime.now(timezone.utc) - self.latest.generated_at).total_seconds()
+    
+    def stats(self) -> Dict[str, Any]:
+        latest = self.latest
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "workers": self.workers,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_ticks": self.skipped_ticks,
+            "latest_version": latest.version if latest else None,
+            "age_seconds": round(self.age_seconds(), 3) if latest else None,
+            "last_inference_ms": round(latest.inference_ms, 2) if latest else None,
+            "avg_inference_ms": round(self.inference_ms_total / self.runs, 2) if self.runs else None,
+            "max_inference_ms": round(self.inference_ms_max, 2),
+            "last_queue_lag_ms": round(latest.queue_lag_ms, 2) if latest else None,
+            "max_queue_lag_ms": round(self.queue_lag_ms_max, 2),
+            "learned_samples": self.learned_samples,
+            "update_ms_per_sample": round(self.learn_ms_total / self.learned_samples, 3) if self.learned_samples else None,
+            "learning": latest.learning if latest else None
+        }
+
+snn_scheduler = SNNForecastScheduler()
+
+async def neuron_activity_snapshot() -> Dict[str, Any]:
+    """Neuron group activity of the latest forecast's first simulated hour"""
+    latest = snn_scheduler.latest
+    if latest is None:
+        groups = {name: {"neurons": count, "active": 0} for name, count in SNN_GROUPS.items()}
+        activity, state, learning_rate = {"neuron_groups": groups, "total_spikes": 0}, "warming_up", 0.0
+    else:
+        activity, state, learning_rate = latest.activity, "active", latest.learning["learning_rate"]
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        **activity,
+        "network_state": state,
+        # Relative readout weight change of the last online update
+        "learning_rate": learning_rate
+    }
+
+# ==================== GRID SIMULATION ====================
+# Minute-stepped fleet model (demand, solar, wind, Megapack state of charge,
+# grid import/export and islanding) run for many perturbed days at once: each
+# array holds one value per run, so a step is a few dozen NumPy ops whatever
+# the number of runs.
+
+# Headline parameters (shown to users) and the event window (start hour, hours) they apply to
+SCENARIOS = {
+    "peak_ai": {
+        "name": "Peak AI Training Load", "description": "Simulate high GPU cluster demand",
+        "parameters": {"demand_increase": 35, "megapack_discharge": 60, "efficiency_impact": -5},
+        "window": (9, 12)
+    },
+    "solar_peak": {
+        "name": "Solar Peak Production", "description": "Midday solar maximum scenario",
+        "parameters": {"solar_boost": 40, "storage_charge": 25, "efficiency_impact": 10},
+        "window": (10, 6)
+    },
+    "grid_outage": {
+        "name": "Grid Outage Recovery", "description": "Test Megapack backup response",
+        "parameters": {"megapack_discharge": 90, "islanding_mode": True, "recovery_time_sec": 0.2},
+        "window": (18, 4)
+    },
+    "demand_surge": {
+        "name": "Demand Surge", "description": "Sudden 40% demand increase",
+        "parameters": {"demand_increase": 40, "price_spike": 25, "load_shedding": False},
+        "window": (14, 6)
+    },
+    "wind_drop": {
+        "name": "Wind Power Drop", "description": "Wind turbine output reduction",
+        "parameters": {"wind_reduction": 50, "solar_compensation": 15, "storage_support": 30},
+        "window": (0, 24)
+    }
+}
+# Fleet capacities (MW / MWh) across the six zones
+SIM_FLEET = {
+    "demand_mw": 720.0, "solar_mw": 600.0, "wind_mw": 360.0, "grid_import_mw": 400.0,
+    "grid_export_mw": 150.0, "megapack_mwh": 800.0, "megapack_mw": 400.0
+}
+SIM_STEPS_PER_HOUR = 60
+SIM_ROUND_TRIP = 0.9
+SIM_DEFAULT_DISCHARGE = 80  # % of Megapack capacity usable when a scenario sets no megapack_discharge
+SIM_GRID_CHARGE_UNTIL = 6  # hour of day before which Megapacks charge from the grid
+SIM_GRID_CHARGE_TARGET = 0.9
+SIM_RESERVE_MARGIN = 0.05  # spare discharge + import capacity, as a share of demand, for a step to count as stable
+SIM_IMPORT_USD_MWH = (60.0, 140.0)  # off-peak, peak (16:00-21:00)
+SIM_EXPORT_USD_MWH = 30.0
+SIM_SHED_USD_MWH = 1000.0  # controlled load shedding
+SIM_VOLL_USD_MWH = 10000.0  # value of lost load when shedding is not allowed
+SIM_OUTCOMES = ("grid_stability", "cost_usd", "renewable_utilization", "unserved_energy_mwh", "min_soc", "grid_import_mwh")
+SIM_MAX_RUNS = 100_000
+SIM_CHUNK_RUNS = 5000
+SIM_SINGLE_RUNS = 200
+SIM_BASELINE_RUNS = 2000
+SIM_WORKERS = int(os.environ.get("SIM_WORKERS", "0"))  # 0 runs chunks in threads instead of a process pool
+
+def hourly_ar1(sim_rng: np.random.Generator, runs: int, rho: float, sigma: float) -> np.ndarray:
+    """Per-run hourly AR(1) noise (runs x 24) with stationary std `sigma`"""
+    noise = sim_rng.normal(0, sigma, (runs, 24))
+    for h in range(1, 24):
+        noise[:, h] = rho * noise[:, h - 1] + math.sqrt(1 - rho ** 2) * noise[:, h]
+    return noise
+
+def simulate_grid_runs(scenario_id: Optional[str], runs: int, seed: np.random.SeedSequence,
+                       steps_per_hour: int = SIM_STEPS_PER_HOUR) -> Dict[str, np.ndarray]:
+    """Simulate `runs` perturbed days of a scenario (None = baseline); per-run SIM_OUTCOMES and hourly timeline sums"""
+    scenario = SCENARIOS[scenario_id] if scenario_id else {"parameters": {}, "window": (0, 0)}
+    params = scenario["parameters"]
+    sim_rng = np.random.default_rng(seed)
+    fleet = SIM_FLEET
+    steps, dt = 24 * steps_per_hour, 1.0 / steps_per_hour
+    eta = math.sqrt(SIM_ROUND_TRIP)
+    
+    # Monte Carlo perturbations: levels, weather, event timing and size, starting charge
+    demand_level = sim_rng.normal(1, 0.05, runs)
+    demand_noise = hourly_ar1(sim_rng, runs, 0.7, 0.03)
+    cloud = sim_rng.uniform(0.6, 1.0, runs)[:, None] * np.clip(1 + hourly_ar1(sim_rng, runs, 0.6, 0.1), 0, 1.2)
+    wind_noise = np.clip(1 + hourly_ar1(sim_rng, runs, 0.9, 0.15), 0, None)
+    start_hour, window_hours = scenario["window"]
+    if window_hours >= 24:
+        start, end = np.zeros(runs), np.full(runs, steps)
+    else:
+        start = np.floor((start_hour + sim_rng.uniform(-1, 1, runs)) * steps_per_hour)
+        end = start + window_hours * steps_per_hour
+    magnitude = np.clip(sim_rng.normal(1, 0.1, runs), 0.5, 1.5)
+    soc = np.clip(sim_rng.uniform(0.5, 0.9, runs) + params.get("storage_charge", 0) / 100, 0, 1)
+    
+    # Scenario knobs
+    demand_event = params.get("demand_increase", 0) / 100 * magnitude
+    solar_event = (params.get("solar_boost", 0) + params.get("solar_compensation", 0)) / 100 * magnitude
+    wind_event = np.minimum(params.get("wind_reduction", 0) / 100 * magnitude, 1)
+    losses = 1 - params.get("efficiency_impact", 0) / 100
+    floor = 1 - params.get("megapack_discharge", SIM_DEFAULT_DISCHARGE) / 100
+    power = fleet["megapack_mw"] * (1 + params.get("storage_support", 0) / 100)
+    islanding = bool(params.get("islanding_mode", False))
+    recovery_hours = params.get("recovery_time_sec", 0) / 3600
+    price_event = 1 + params.get("price_spike", 0) / 100
+    unserved_price = SIM_SHED_USD_MWH if params.get("load_shedding", True) else SIM_VOLL_USD_MWH
+    
+    stable = np.zeros(runs)
+    cost = np.zeros(runs)
+    unserved_energy = np.zeros(runs)
+    imported = np.zeros(runs)
+    renewable_used = np.zeros(runs)
+    renewable_available = np.zeros(runs)
+    min_soc = soc.copy()
+    timeline = {name: np.zeros(24) for name in ("soc", "unserved_mwh", "grid_import_mwh")}
+    
+    for t in range(steps):
+        h = t // steps_per_hour
+        hour = t * dt
+        active = (t >= start) & (t < end)
+        demand = (fleet["demand_mw"] * (math.sin(2 * math.pi * hour / 24 - math.pi / 2) * 0.3 + 1) * losses
+                  * demand_level * (1 + demand_noise[:, h]) * (1 + demand_event * active))
+        solar = fleet["solar_mw"] * max(0.0, math.sin(math.pi * (hour - 6) / 12)) * cloud[:, h] * (1 + solar_event * active)
+        wind = fleet["wind_mw"] * wind_noise[:, h] * (1 - wind_event * active)
+        import_cap = fleet["grid_import_mw"] * ~active if islanding else fleet["grid_import_mw"]
+        export_cap = fleet["grid_export_mw"] * ~active if islanding else fleet["grid_export_mw"]
+        
+        net = demand - solar - wind
+        deficit, surplus = np.maximum(net, 0), np.maximum(-net, 0)
+        discharge_cap = np.clip((soc - floor) * fleet["megapack_mwh"] * eta / dt, 0, power)
+        charge_cap = np.clip((1 - soc) * fleet["megapack_mwh"] / (eta * dt), 0, power)
+        peak = 16 <= hour < 21
+        if peak:  # Megapacks shave the evening peak; otherwise the grid goes first and storage covers the rest
+            discharge = np.minimum(deficit, discharge_cap)
+            grid_in = np.minimum(deficit - discharge, import_cap)
+        else:
+            grid_in = np.minimum(deficit, import_cap)
+            discharge = np.minimum(deficit - grid_in, discharge_cap)
+        charge = np.minimum(surplus, charge_cap)
+        grid_out = np.minimum(surplus - charge, export_cap)
+        curtailed = surplus - charge - grid_out
+        unserved = (deficit - discharge - grid_in) * dt
+        if islanding and recovery_hours:
+            unserved += demand * recovery_hours * (t == start)  # load dropped while switching to island mode
+        if hour < SIM_GRID_CHARGE_UNTIL:  # top up overnight from spare import capacity
+            target = np.clip((SIM_GRID_CHARGE_TARGET - soc) * fleet["megapack_mwh"] / (eta * dt), 0, None)
+            grid_charge = np.minimum(np.minimum(np.maximum(import_cap - grid_in, 0), charge_cap - charge), target)
+            charge = charge + grid_charge
+            grid_in = grid_in + grid_charge
+        soc = soc + (charge * eta - discharge / eta) * dt / fleet["megapack_mwh"]
+        
+        headroom = (discharge_cap - discharge) + np.maximum(import_cap - grid_in, 0)
+        stable += (unserved <= 1e-9) & (headroom >= SIM_RESERVE_MARGIN * demand)
+        price = SIM_IMPORT_USD_MWH[peak] * np.where(active, price_event, 1.0)
+        cost += (grid_in * price - grid_out * SIM_EXPORT_USD_MWH) * dt + unserved * unserved_price
+        unserved_energy += unserved
+        imported += grid_in * dt
+        renewable_available += (solar + wind) * dt
+        renewable_used += (solar + wind - curtailed) * dt
+        np.minimum(min_soc, soc, out=min_soc)
+        if t % steps_per_hour == 0:
+            timeline["soc"][h] += soc.sum()
+        timeline["unserved_mwh"][h] += unserved.sum()
+        timeline["grid_import_mwh"][h] += grid_in.sum() * dt
+    
+    return {
+        "grid_stability": stable / steps,
+        "cost_usd": cost,
+        "renewable_utilization": renewable_used / np.maximum(renewable_available, 1e-9),
+        "unserved_energy_mwh": unserved_energy,
+        "min_soc": min_soc,
+        "grid_import_mwh": imported,
+        **{f"timeline_{name}": values for name, values in timeline.items()}
+    }
+
+simulation_pool: Optional[ProcessPoolExecutor] = None
+baseline_costs: Dict[int, float] = {}
+baseline_fills: Dict[int, asyncio.Task] = {}  # the one in-flight baseline simulation per steps_per_hour
+
+async def run_simulation(scenario_id: Optional[str], runs: int, seed: Optional[int],
+                         steps_per_hour: int = SIM_STEPS_PER_HOUR,
+                         on_chunk: Optional[Callable[[int], None]] = None) -> Tuple[Dict[str, np.ndarray], int]:
+    """Run `runs` days in SIM_CHUNK_RUNS chunks (process pool or threads); merged outcomes and the seed used"""
+    sequence = np.random.SeedSequence(seed)
+    chunks = [SIM_CHUNK_RUNS] * (runs // SIM_CHUNK_RUNS) + ([runs % SIM_CHUNK_RUNS] if runs % SIM_CHUNK_RUNS else [])
+    loop = asyncio.get_running_loop()
+    
+    async def run_chunk(size: int, child: np.random.SeedSequence) -> Dict[str, np.ndarray]:
+        if simulation_pool is not None:
+            part = await loop.run_in_executor(simulation_pool, simulate_grid_runs, scenario_id, size, child, steps_per_hour)
+        else:
+            part = await asyncio.to_thread(simulate_grid_runs, scenario_id, size, child, steps_per_hour)
+        if on_chunk:
+            on_chunk(size)
+        return part
+    
+    parts = await asyncio.gather(*(run_chunk(size, child) for size, child in zip(chunks, sequence.spawn(len(chunks)))))
+    merged = {name: np.concatenate([part[name] for part in parts]) for name in SIM_OUTCOMES}
+    merged.update({name: sum(part[name] for part in parts) / runs for name in parts[0] if name.startswith("timeline_")})
+    return merged, sequence.entropy
+
+async def fill_baseline_cost(steps_per_hour: int):
+    outcomes, _ = await run_simulation(None, SIM_BASELINE_RUNS, 0, steps_per_hour)
+    baseline_costs[steps_per_hour] = float(outcomes["cost_usd"].mean())
+
+async def baseline_cost(steps_per_hour: int) -> float:
+    """Mean daily cost without any scenario, the reference for cost_impact_usd; concurrent first callers share one simulation"""
+    if steps_per_hour not in baseline_costs:
+        fill = baseline_fills.get(steps_per_hour)
+        if fill is None:
+            fill = baseline_fills[steps_per_hour] = asyncio.create_task(fill_baseline_cost(steps_per_hour))
+            fill.add_done_callback(lambda _: baseline_fills.pop(steps_per_hour, None))
+        # Shielded so a cancelled caller leaves the simulation running for the others
+        await asyncio.shield(fill)
+    return baseline_costs[steps_per_hour]
+
+def distribution(values: np.ndarray, digits: int = 3) -> Dict[str, float]:
+    p5, p50, p95 = np.percentile(values, [5, 50, 95])
+    return {
+        "p5": round(float(p5), digits), "p50": round(float(p50), digits),
+        "p95": round(float(p95), digits), "mean": round(float(values.mean()), digits)
+    }
+
+async def scenario_outcomes(scenario_id: str, runs: int, seed: Optional[int], steps_per_hour: int,
+                            on_chunk: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """Simulate one scenario and summarize each outcome as p5/p50/p95/mean across runs"""
+    outcomes, seed_used = await run_simulation(scenario_id, runs, seed, steps_per_hour, on_chunk)
+    outcomes["cost_impact_usd"] = outcomes.pop("cost_usd") - await baseline_cost(steps_per_hour)
+    return {
+        "scenario_id": scenario_id,
+        "parameters": SCENARIOS[scenario_id]["parameters"],
+        "runs": runs,
+        "seed": seed_used,
+        "distributions": {
+            name: distribution(outcomes[name], 2 if name.endswith(("_usd", "_mwh")) else 3)
+            for name in ("grid_stability", "cost_impact_usd", "renewable_utilization", "unserved_energy_mwh", "min_soc", "grid_import_mwh")
+        },
+        "timeline": {
+            "soc": np.round(outcomes["timeline_soc"], 3).tolist(),
+            "unserved_mwh": np.round(outcomes["timeline_unserved_mwh"], 2).tolist(),
+            "grid_import_mwh": np.round(outcomes["timeline_grid_import_mwh"], 2).tolist()
+        }
+    }
+
+def batch_scenario_ids(request: ScenarioBatchRequest) -> List[str]:
+    """Requested scenario ids (all by default); 404 if any is unknown"""
+    scenario_ids = request.scenario_ids or list(SCENARIOS)
+    unknown = [scenario_id for scenario_id in scenario_ids if scenario_id not in SCENARIOS]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Scenario not found: {', '.join(unknown)}")
+    return scenario_ids
+
+async def scenario_batch_result(request: ScenarioBatchRequest,
+                                on_chunk: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """Monte Carlo sweep of the requested scenarios, one after another"""
+    start = time.perf_counter()
+    results = [
+        await scenario_outcomes(scenario_id, request.runs, request.seed, request.steps_per_hour, on_chunk)
+        for scenario_id in batch_scenario_ids(request)
+    ]
+    return {
+        "runs": request.runs,
+        "steps_per_hour": request.steps_per_hour,
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+# ==================== ENERGY LEDGER ====================
+# Append-only record of energy transfers. Transactions are fixed-size binary
+# records in rotating segment files; every LEDGER_BLOCK_TXS of them (or whatever
+# is pending after LEDGER_BLOCK_INTERVAL seconds) are sealed into a block whose
+# header carries their Merkle root and the previous block's hash, so a single
+# transaction is proven with a log2(block size) path and tampering with any
+# record breaks its block's root and every later link.
+
+LEDGER_DIR = Path(os.environ.get("LEDGER_DIR", str(ROOT_DIR / "ledger")))
+LEDGER_BLOCK_TXS = int(os.environ.get("LEDGER_BLOCK_TXS", "1024"))
+LEDGER_SEGMENT_TXS = int(os.environ.get("LEDGER_SEGMENT_TXS", str(1 << 20)))
+LEDGER_BLOCK_INTERVAL = float(os.environ.get("LEDGER_BLOCK_INTERVAL", "60"))
+LEDGER_FEED_INTERVAL = float(os.environ.get("LEDGER_FEED_INTERVAL", "5"))  # simulated transfers; 0 disables
+LEDGER_BACKFILL_TXS = 2000  # simulated week of transfers written into an empty ledger
+LEDGER_VERIFIED_CACHE = 4096  # block verification results kept for transaction listings
+LEDGER_PAGE_SCAN = 4096  # posting-list entries intersected per step when paging with filters
+LEDGER_VERIFY_WORKERS = int(os.environ.get("LEDGER_VERIFY_WORKERS", "0"))  # 0 verifies in threads instead of processes
+LEDGER_VERIFY_CHUNK_BLOCKS = 256  # blocks per verification task
+
+LEDGER_ENERGY_TYPES = ("solar", "wind", "hydro", "geothermal", "grid")
+LEDGER_RENEWABLE_TYPES = LEDGER_ENERGY_TYPES[:4]
+LEDGER_SOURCES = ("GigaFactory_1", "GigaFactory_2", "Solar_Farm_A", "Wind_Farm_B", "Hydro_Plant_C")
+LEDGER_DESTINATIONS = ("Grid_Main", "Megapack_Bank_1", "Megapack_Bank_2", "Industrial_Zone", "Residential_Zone")
+LEDGER_INDEXED_COLUMNS = {"energy_type": LEDGER_ENERGY_TYPES, "source": LEDGER_SOURCES, "destination": LEDGER_DESTINATIONS}
+
+# 24-byte transaction record; the leaf hash covers exactly these bytes
+LEDGER_TX_DTYPE = np.dtype([
+    ("timestamp_ms", "<i8"), ("amount_kwh", "<f8"),
+    ("energy_type", "u1"), ("source", "u1"), ("destination", "u1"), ("reserved", "u1", 5)
+])
+# 136-byte block header; block_hash is sha256 over every field before it
+LEDGER_BLOCK_DTYPE = np.dtype([
+    ("height", "<u8"), ("first_tx", "<u8"), ("tx_count", "<u4"), ("reserved", "<u4"), ("sealed_at_ms", "<i8"),
+    ("prev_hash", "u1", 32), ("merkle_root", "u1", 32), ("block_hash", "u1", 32)
+])
+LEDGER_HEADER_BYTES = LEDGER_BLOCK_DTYPE.itemsize - 32
+
+class LedgerTransfer(BaseModel):
+    energy_type: str
+    amount_kwh: float = Field(gt=0)
+    source: str
+    destination: str
+    timestamp: Optional[datetime] = None  # defaults to the time of append
+
+def ledger_leaf_hashes(records: np.ndarray) -> List[bytes]:
+    """Domain-separated sha256 of each raw transaction record"""
+    raw = records.tobytes()
+    size = LEDGER_TX_DTYPE.itemsize
+    sha256 = hashlib.sha256
+    return [sha256(b"\x00" + raw[i:i + size]).digest() for i in range(0, len(raw), size)]
+
+def merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """Every level of the Merkle tree, leaves first; an odd last node is promoted unchanged"""
+    levels = [leaves]
+    sha256 = hashlib.sha256
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+def merkle_path(levels: List[List[bytes]], index: int) -> List[Dict[str, str]]:
+    """Sibling hashes from leaf `index` up to the root"""
+    path = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append({"position": "left" if sibling < index else "right", "hash": level[sibling].hex()})
+        index //= 2
+    return path
+
+def merkle_root_from_path(leaf: bytes, path: List[Dict[str, str]]) -> bytes:
+    """Fold a Merkle path back up to the root it proves"""
+    node = leaf
+    for step in path:
+        sibling = bytes.fromhex(step["hash"])
+        pair = sibling + node if step["position"] == "left" else node + sibling
+        node = hashlib.sha256(b"\x01" + pair).digest()
+    return node
+
+def ledger_block_hash(header: np.ndarray) -> bytes:
+    return hashlib.sha256(header.tobytes()[:LEDGER_HEADER_BYTES]).digest()
+
+def ledger_segment_path(directory: Path, index: int) -> Path:
+    return directory / f"tx-{index:06d}.seg"
+
+def ledger_block_valid(header: np.void, height: int, previous: bytes, records: np.ndarray) -> bool:
+    """Whether a block header matches its position, its predecessor's hash and the records it seals"""
+    return (
+        int(header["height"]) == height
+        and header["prev_hash"].tobytes() == previous
+        and 0 < len(records) == int(header["tx_count"])
+        and header["merkle_root"].tobytes() == merkle_levels(ledger_leaf_hashes(records))[-1][0]
+        and header["block_hash"].tobytes() == ledger_block_hash(header)
+    )
+
+def verify_ledger_blocks(directory: str, segment_txs: int, start: int, end: int) -> Optional[int]:
+    """First invalid height in blocks [start, end), or None; picklable entry point for verification workers.
+    
+    Headers and records are read through memory maps of the ledger files, so
+    workers share the page cache and nothing but the range crosses processes.
+    """
+    directory = Path(directory)
+    headers = np.memmap(directory / "blocks.seg", dtype=LEDGER_BLOCK_DTYPE, mode="r", shape=(end,))
+    segments: Dict[int, np.memmap] = {}
+    
+    def records(first: int, count: int) -> np.ndarray:
+        parts = []
+        while count > 0:
+            index, position = divmod(first, segment_txs)
+            if index not in segments:
+                path = ledger_segment_path(directory, index)
+                segments[index] = np.memmap(path, dtype=LEDGER_TX_DTYPE, mode="r",
+                                            shape=(path.stat().st_size // LEDGER_TX_DTYPE.itemsize,))
+            take = min(count, segment_txs - position)
+            parts.append(segments[index][position:position + take])
+            first += take
+            count -= take
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+    
+    previous = headers[start - 1]["block_hash"].tobytes() if start else bytes(32)
+    for height in range(start, end):
+        header = headers[height]
+        if not ledger_block_valid(header, height, previous, records(int(header["first_tx"]), int(header["tx_count"]))):
+            return height
+        previous = header["block_hash"].tobytes()
+    return None
+
+def generate_ledger_transfers(count: int, start_ms: int, end_ms: int) -> np.ndarray:
+    """Simulated transfer records with timestamps spread evenly over [start_ms, end_ms]"""
+    records = np.zeros(count, dtype=LEDGER_TX_DTYPE)
+    records["timestamp_ms"] = np.linspace(start_ms, end_ms, count, dtype=np.int64)
+    records["amount_kwh"] = np.round(rng.uniform(50, 500, count), 2)
+    records["energy_type"] = rng.choice(len(LEDGER_ENERGY_TYPES), count, p=[0.34, 0.27, 0.17, 0.1, 0.12])
+    records["source"] = rng.integers(0, len(LEDGER_SOURCES), count)
+    records["destination"] = rng.integers(0, len(LEDGER_DESTINATIONS), count)
+    return records
+
+class EnergyLedger:
+    """Segment-file transaction log sealed into Merkle-rooted, hash-chained blocks.
+    
+    Timestamps never decrease along the log, so sequence order is time order
+    and pages are keyset-paginated by (timestamp, sequence). Each value of an
+    indexed column has an append-only posting list of its sequence numbers.
+    """
+    
+    def __init__(self, directory: Path, block_txs: int = LEDGER_BLOCK_TXS, segment_txs: int = LEDGER_SEGMENT_TXS):
+        self.directory = Path(directory)
+        self.block_txs = block_txs
+        self.segment_txs = segment_txs
+        self.lock = threading.RLock()
+        self.tx_count = 0  # records on disk
+        self.sealed = 0  # records covered by blocks
+        self.height = 0  # blocks on disk
+        self.tip_hash = bytes(32)
+        self.totals = np.zeros(len(LEDGER_ENERGY_TYPES))
+        self.pending_since: Optional[float] = None
+        self.segment: Optional[io.BufferedWriter] = None
+        self.segment_index = -1
+        self.blocks_file: Optional[io.BufferedWriter] = None
+        self.block_index: Optional[np.ndarray] = None  # first_tx of every block, for locating a transaction
+        self.verified: OrderedDict = OrderedDict()
+        self.failed_blocks: Set[int] = set()
+        self.verified_through = 0  # blocks [0, verified_through) passed a full or incremental audit
+        self.last_timestamp_ms = 0
+        self.indexed_through = 0  # records reflected in posting lists and totals
+        self.posting_counts = {column: np.zeros(len(names), dtype=np.int64) for column, names in LEDGER_INDEXED_COLUMNS.items()}
+        self.posting_files: Dict[Tuple[str, int], io.BufferedWriter] = {}
+        self.append_seconds = 0.0
+        self.appended = 0
+    
+    @property
+    def blocks_path(self) -> Path:
+        return self.directory / "blocks.seg"
+    
+    def segment_path(self, index: int) -> Path:
+        return ledger_segment_path(self.directory, index)
+    
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.directory / "verified.json"
+    
+    @property
+    def index_dir(self) -> Path:
+        return self.directory / "index"
+    
+    def posting_path(self, column: str, code: int) -> Path:
+        return self.index_dir / f"{column}-{code:03d}.idx"
+    
+    def open(self):
+        """Recover counters from disk, dropping torn trailing records"""
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tx_size = LEDGER_TX_DTYPE.itemsize
+            segments = sorted(self.directory.glob("tx-*.seg"))
+            self.tx_count = 0
+            for path in segments:
+                count = path.stat().st_size // tx_size
+                if path.stat().st_size % tx_size:
+                    os.truncate(path, count * tx_size)
+                self.tx_count += count
+            self.last_timestamp_ms = int(self.read(self.tx_count - 1, 1)["timestamp_ms"][0]) if self.tx_count else 0
+            self._recover_index()
+            
+            block_size = LEDGER_BLOCK_DTYPE.itemsize
+            size = self.blocks_path.stat().st_size if self.blocks_path.exists() else 0
+            if size % block_size:
+                os.truncate(self.blocks_path, size - size % block_size)
+            self.height = size // block_size
+            self.sealed, self.tip_hash = 0, bytes(32)
+            if self.height:
+                last = self.block(self.height - 1)
+                self.sealed = int(last["first_tx"]) + int(last["tx_count"])
+                self.tip_hash = last["block_hash"].tobytes()
+            if self.sealed > self.tx_count:
+                raise RuntimeError(f"Ledger blocks cover {self.sealed} transactions but only {self.tx_count} are on disk")
+            self.pending_since = time.monotonic() if self.tx_count > self.sealed else None
+            self._load_block_index()
+            self._load_checkpoint()
+            self.blocks_file = open(self.blocks_path, "ab")
+    
+    def close(self):
+        with self.lock:
+            for handle in (self.segment, self.blocks_file, *self.posting_files.values()):
+                if handle is not None:
+                    handle.close()
+            self.segment, self.blocks_file, self.segment_index = None, None, -1
+            self.posting_files.clear()
+    
+    def _recover_index(self):
+        """Load the persisted counters and posting lists, then index records appended after them"""
+        self.index_dir.mkdir(exist_ok=True)
+        meta_path = self.index_dir / "meta.json"
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        self.indexed_through = meta.get("indexed_through", 0)
+        if self.indexed_through > self.tx_count:  # records the index saw are gone; rebuild it
+            self.indexed_through = 0
+        self.totals[:] = meta["totals"] if self.indexed_through else 0
+        for column, names in LEDGER_INDEXED_COLUMNS.items():
+            for code in range(len(names)):
+                path = self.posting_path(column, code)
+                count = path.stat().st_size // 8 if path.exists() else 0
+                if count:
+                    postings = np.memmap(path, dtype="<i8", mode="r", shape=(count,))
+                    count = int(np.searchsorted(postings, self.indexed_through))
+                    del postings
+                if path.exists():
+                    os.truncate(path, count * 8)
+                self.posting_counts[column][code] = count
+        start = self.indexed_through
+        while start < self.tx_count:
+            count = min(self.segment_txs, self.tx_count - start)
+            self._index(self.read(start, count), start)
+            start += count
+        self._write_index_meta()
+    
+    def _index(self, records: np.ndarray, first: int):
+        """Add records starting at sequence `first` to the posting lists and running totals"""
+        sequences = np.arange(first, first + len(records), dtype="<i8")
+        for column in LEDGER_INDEXED_COLUMNS:
+            codes = records[column]
+            for code in np.unique(codes).tolist():
+                handle = self.posting_files.get((column, code))
+                if handle is None:
+                    handle = self.posting_files[(column, code)] = open(self.posting_path(column, code), "ab")
+                selected = sequences[codes == code]
+                handle.write(selected.tobytes())
+                handle.flush()
+                self.posting_counts[column][code] += len(selected)
+        self.totals += np.bincount(records["energy_type"], weights=records["amount_kwh"],
+                                   minlength=len(LEDGER_ENERGY_TYPES))[:len(LEDGER_ENERGY_TYPES)]
+        self.indexed_through = first + len(records)
+    
+    def _write_index_meta(self):
+        path = self.index_dir / "meta.json"
+        staging = path.with_suffix(".tmp")
+        staging.write_text(json.dumps({"indexed_through": self.indexed_through, "totals": self.totals.tolist()}))
+        os.replace(staging, path)
+    
+    def _load_block_index(self):
+        if self.height:
+            headers = np.memmap(self.blocks_path, dtype=LEDGER_BLOCK_DTYPE, mode="r", shape=(self.height,))
+            self.block_index = np.array(headers["first_tx"], dtype=np.int64)
+            del headers
+        else:
+            self.block_index = np.zeros(0, dtype=np.int64)
+    
+    def append(self, records: np.ndarray) -> int:
+        """Append transaction records, sealing every full block; returns the first sequence number"""
+        start = time.perf_counter()
+        with self.lock:
+            timestamps = records["timestamp_ms"]
+            if len(records) and (timestamps[0] < self.last_timestamp_ms or np.any(np.diff(timestamps) < 0)):
+                raise ValueError("Ledger timestamps must not decrease")
+            first = self.tx_count
+            offset = 0
+            while offset < len(records):
+                segment_index, position = divmod(self.tx_count, self.segment_txs)
+                if segment_index != self.segment_index:
+                    if self.segment is not None:
+                        self.segment.close()
+                    self.segment = open(self.segment_path(segment_index), "ab")
+                    self.segment_index = segment_index
+                chunk = records[offset:offset + self.segment_txs - position]
+                self.segment.write(chunk.tobytes())
+                offset += len(chunk)
+                self.tx_count += len(chunk)
+            self.segment.flush()
+            if len(records):
+                self.last_timestamp_ms = int(timestamps[-1])
+                self._index(records, first)
+                self._write_index_meta()
+            if self.pending_since is None and len(records):
+                self.pending_since = time.monotonic()
+            while self.tx_count - self.sealed >= self.block_txs:
+                self._seal(self.block_txs)
+            self.appended += len(records)
+            self.append_seconds += time.perf_counter() - start
+            return first
+    
+    def seal_pending(self, max_age: float = 0.0) -> bool:
+        """Seal pending transactions into a short block once the oldest has waited `max_age` seconds"""
+        with self.lock:
+            if self.tx_count == self.sealed or time.monotonic() - self.pending_since < max_age:
+                return False
+            self._seal(self.tx_count - self.sealed)
+            return True
+    
+    def _seal(self, count: int):
+        if self.segment is not None:
+            self.segment.flush()
+        levels = merkle_levels(ledger_leaf_hashes(self.read(self.sealed, count)))
+        header = np.zeros(1, dtype=LEDGER_BLOCK_DTYPE)
+        header["height"] = self.height
+        header["first_tx"] = self.sealed
+        header["tx_count"] = count
+        header["sealed_at_ms"] = int(time.time() * 1000)
+        header["prev_hash"] = np.frombuffer(self.tip_hash, dtype=np.uint8)
+        header["merkle_root"] = np.frombuffer(levels[-1][0], dtype=np.uint8)
+        header["block_hash"] = np.frombuffer(ledger_block_hash(header), dtype=np.uint8)
+        self.blocks_file.write(header.tobytes())
+        self.blocks_file.flush()
+        self.block_index = np.append(self.block_index, self.sealed)
+        self.tip_hash = header["block_hash"][0].tobytes()
+        self.sealed += count
+        self.height += 1
+        self.pending_since = time.monotonic() if self.tx_count > self.sealed else None
+    
+    def read(self, start: int, count: int) -> np.ndarray:
+        """Transaction records [start, start + count), across segment boundaries"""
+        if self.segment is not None:
+            self.segment.flush()
+        parts = []
+        while count > 0:
+            segment_index, position = divmod(start, self.segment_txs)
+            take = min(count, self.segment_txs - position)
+            parts.append(np.fromfile(self.segment_path(segment_index), dtype=LEDGER_TX_DTYPE,
+                                     count=take, offset=position * LEDGER_TX_DTYPE.itemsize))
+            start += take
+            count -= take
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=LEDGER_TX_DTYPE)
+    
+    def records_at(self, sequences: List[int]) -> np.ndarray:
+        """Transaction records at arbitrary sequence numbers, in the given order"""
+        if self.segment is not None:
+            self.segment.flush()
+        sequences = np.asarray(sequences, dtype=np.int64)
+        records = np.zeros(len(sequences), dtype=LEDGER_TX_DTYPE)
+        segments = sequences // self.segment_txs
+        for segment_index in np.unique(segments).tolist():
+            selected = segments == segment_index
+            first = segment_index * self.segment_txs
+            mapped = np.memmap(self.segment_path(segment_index), dtype=LEDGER_TX_DTYPE, mode="r",
+                               shape=(min(self.segment_txs, self.tx_count - first),))
+            records[selected] = mapped[sequences[selected] - first]
+            del mapped
+        return records
+    
+    def timestamp_of(self, sequence: int) -> int:
+        return int(self.read(sequence, 1)["timestamp_ms"][0])
+    
+    def sequence_at(self, timestamp_ms: int) -> int:
+        """First sequence whose timestamp is at or after `timestamp_ms` (binary search over the log)"""
+        return bisect.bisect_left(range(self.tx_count), timestamp_ms, key=self.timestamp_of)
+    
+    def block(self, height: int) -> np.void:
+        return np.fromfile(self.blocks_path, dtype=LEDGER_BLOCK_DTYPE, count=1,
+                           offset=height * LEDGER_BLOCK_DTYPE.itemsize)[0]
+    
+    def height_of(self, sequence: int) -> int:
+        """Height of the block holding a sealed transaction"""
+        return int(np.searchsorted(self.block_index, sequence, side="right")) - 1
+    
+    def verify_block(self, height: int, previous: Optional[bytes] = None) -> bool:
+        """Recompute a block's Merkle root and hash and check its link to the previous block"""
+        header = self.block(height)
+        if previous is None:
+            previous = bytes(32) if height == 0 else self.block(height - 1)["block_hash"].tobytes()
+        return ledger_block_valid(header, height, previous, self.read(int(header["first_tx"]), int(header["tx_count"])))
+    
+    def block_verified(self, height: int) -> bool:
+        """Cached `verify_block`; sealed blocks never change, so a result stays valid"""
+        if height < self.verified_through:
+            return True
+        if height in self.verified:
+            self.verified.move_to_end(height)
+            return self.verified[height]
+        result = self.verify_block(height)
+        self.verified[height] = result
+        if not result:
+            self.failed_blocks.add(height)
+        if len(self.verified) > LEDGER_VERIFIED_CACHE:
+            self.verified.popitem(last=False)
+        return result
+    
+    def _load_checkpoint(self):
+        """Verified prefix from the last audit, if its anchor block is still the one on disk"""
+        self.verified_through = 0
+        if not self.checkpoint_path.exists():
+            return
+        checkpoint = json.loads(self.checkpoint_path.read_text())
+        height = checkpoint["verified_through"]
+        if 0 < height <= self.height and self.block(height - 1)["block_hash"].tobytes().hex() == checkpoint["block_hash"]:
+            self.verified_through = height
+        else:
+            logger.warning(f"Ledger verification checkpoint at block {height} no longer matches the chain; ignoring it")
+    
+    def mark_verified(self, height: int, rewind: bool = False):
+        """Persist that blocks [0, height) have been verified; `rewind` moves the checkpoint back"""
+        with self.lock:
+            if height == self.verified_through or (height < self.verified_through and not rewind):
+                return
+            self.verified_through = height
+            if height == 0:
+                self.checkpoint_path.unlink(missing_ok=True)
+                return
+            staging = self.checkpoint_path.with_suffix(".tmp")
+            staging.write_text(json.dumps({
+                "verified_through": height,
+                "block_hash": self.block(height - 1)["block_hash"].tobytes().hex(),
+                "verified_at": datetime.now(timezone.utc).isoformat()
+            }))
+            os.replace(staging, self.checkpoint_path)
+    
+    def postings(self, column: str, code: int) -> np.ndarray:
+        """Ascending sequence numbers whose `column` holds `code`"""
+        count = int(self.posting_counts[column][code])
+        if not count:
+            return np.zeros(0, dtype="<i8")
+        return np.memmap(self.posting_path(column, code), dtype="<i8", mode="r", shape=(count,))
+    
+    def matching(self, low: int, high: int, filters: Dict[str, int], limit: int) -> List[int]:
+        """Up to `limit` sequences in [low, high) matching every filter, newest first.
+        
+        Walks the shortest posting list backwards and intersects each step with
+        the same key range of the others, so cost follows the page, not its depth.
+        """
+        if not filters:
+            return list(range(high - 1, max(low, high - limit) - 1, -1))
+        lists = [self.postings(column, code) for column, code in filters.items()]
+        bounds = [(int(np.searchsorted(p, low)), int(np.searchsorted(p, high))) for p in lists]
+        driver = min(range(len(lists)), key=lambda i: bounds[i][1] - bounds[i][0])
+        start, end = bounds[driver]
+        found = []
+        while end > start and len(found) < limit:
+            chunk = np.asarray(lists[driver][max(start, end - LEDGER_PAGE_SCAN):end])
+            end -= len(chunk)
+            for i, other in enumerate(lists):
+                if i != driver and len(chunk):
+                    window = other[np.searchsorted(other, chunk[0]):np.searchsorted(other, chunk[-1], side="right")]
+                    chunk = np.intersect1d(chunk, window, assume_unique=True)
+            found.extend(chunk[::-1][:limit - len(found)].tolist())
+        return found
+    
+    def block_range(self, height: int) -> Tuple[int, int]:
+        first = int(self.block_index[height])
+        return first, int(self.block_index[height + 1]) if height + 1 < self.height else self.sealed
+    
+    def query(self, limit: int, before: Optional[int] = None, filters: Optional[Dict[str, int]] = None,
+              verified: Optional[bool] = None, start_ms: Optional[int] = None,
+              end_ms: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Newest-first page of transactions before sequence `before`, and the cursor of the next page.
+        
+        verified=False covers pending transactions and blocks that have failed
+        verification so far; it does not re-verify the whole chain.
+        """
+        with self.lock:
+            low = self.sequence_at(start_ms) if start_ms is not None else 0
+            high = self.tx_count if before is None else min(before, self.tx_count)
+            if end_ms is not None:
+                high = min(high, self.sequence_at(end_ms + 1))
+            if verified is True:
+                ranges = [(low, min(high, self.sealed))]
+            elif verified is False:
+                ranges = [(max(low, self.sealed), high)] + [
+                    (max(low, first), min(high, end))
+                    for first, end in (self.block_range(h) for h in sorted(self.failed_blocks, reverse=True))
+                ]
+            else:
+                ranges = [(low, high)]
+            
+            sequences = []
+            for range_low, range_high in ranges:
+                while range_low < range_high and len(sequences) <= limit:
+                    batch = self.matching(range_low, range_high, filters or {}, limit + 1 - len(sequences))
+                    if not batch:
+                        break
+                    range_high = batch[-1]
+                    if verified:
+                        batch = [sequence for sequence in batch if self.block_verified(self.height_of(sequence))]
+                    sequences.extend(batch)
+            next_sequence = sequences[limit - 1] if len(sequences) > limit else None
+            sequences = sequences[:limit]
+            records = self.records_at(sequences)
+            rows = self.rows(sequences, records)
+            cursor = f"{records['timestamp_ms'][-1]}:{next_sequence}" if next_sequence is not None else None
+            return rows, cursor
+    
+    def cursor_sequence(self, cursor: str) -> int:
+        """Sequence encoded in a `timestamp:sequence` page cursor; ValueError if it names no transaction"""
+        timestamp, _, sequence = cursor.partition(":")
+        sequence = int(sequence)
+        if not 0 <= sequence < self.tx_count or self.timestamp_of(sequence) != int(timestamp):
+            raise ValueError("Invalid cursor")
+        return sequence
+    
+    def rows(self, sequences: List[int], records: np.ndarray) -> List[Dict[str, Any]]:
+        """BlockchainTransaction-shaped dicts for the given records"""
+        leaves = ledger_leaf_hashes(records)
+        rows = []
+        for sequence, record, leaf in zip(sequences, records, leaves):
+            sealed = sequence < self.sealed
+            height = self.height_of(sequence) if sealed else self.height
+            rows.append({
+                "id": str(sequence),
+                "tx_hash": "0x" + leaf.hex(),
+                "timestamp": datetime.fromtimestamp(int(record["timestamp_ms"]) / 1000, timezone.utc).isoformat(),
+                "energy_type": LEDGER_ENERGY_TYPES[record["energy_type"]],
+                "amount_kwh": round(float(record["amount_kwh"]), 2),
+                "source": LEDGER_SOURCES[record["source"]],
+                "destination": LEDGER_DESTINATIONS[record["destination"]],
+                "verified": sealed and self.block_verified(height),
+                "block_number": height
+            })
+        return rows
+    
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        return self.query(limit)[0]
+    
+    def proof(self, sequence: int) -> Optional[Dict[str, Any]]:
+        """Merkle inclusion proof for a sealed transaction; None while it is still pending"""
+        with self.lock:
+            if sequence >= self.sealed:
+                return None
+            height = self.height_of(sequence)
+            header = self.block(height)
+        first_tx = int(header["first_tx"])
+        leaves = ledger_leaf_hashes(self.read(first_tx, int(header["tx_count"])))
+        levels = merkle_levels(leaves)
+        leaf = leaves[sequence - first_tx]
+        path = merkle_path(levels, sequence - first_tx)
+        return {
+            "sequence": sequence,
+            "tx_hash": "0x" + leaf.hex(),
+            "leaf_index": sequence - first_tx,
+            "path": path,
+            "block": ledger_block_dict(header),
+            "valid": merkle_root_from_path(leaf, path) == header["merkle_root"].tobytes()
+                     and ledger_block_hash(header) == header["block_hash"].tobytes()
+        }
+    
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            total = float(self.totals.sum())
+            renewable = float(self.totals[:len(LEDGER_RENEWABLE_TYPES)].sum())
+            # Blocks [0, verified_through) hold every transaction before the next block's first one
+            verified = int(self.block_index[self.verified_through]) if self.verified_through < self.height else self.sealed
+            return {
+                "total_tracked_kwh": round(total, 2),
+                "verified_transactions": verified,
+                "sealed_transactions": self.sealed,
+                "pending_transactions": self.tx_count - self.sealed,
+                "renewable_percentage": round(100 * renewable / total, 2) if total else 0.0,
+                "by_source": {
+                    name: round(100 * float(self.totals[i]) / total, 1) if total else 0.0
+                    for i, name in enumerate(LEDGER_RENEWABLE_TYPES)
+                },
+                "last_block": max(self.height - 1, 0),
+                "verified_through_block": self.verified_through - 1,
+                "tip_hash": "0x" + self.tip_hash.hex(),
+                "append_tx_per_second": round(self.appended / self.append_seconds) if self.append_seconds else None
+            }
+
+def ledger_block_dict(header: np.void) -> Dict[str, Any]:
+    return {
+        "height": int(header["height"]),
+        "first_tx": int(header["first_tx"]),
+        "tx_count": int(header["tx_count"]),
+        "sealed_at": datetime.fromtimestamp(int(header["sealed_at_ms"]) / 1000, timezone.utc).isoformat(),
+        "prev_hash": header["prev_hash"].tobytes().hex(),
+        "merkle_root": header["merkle_root"].tobytes().hex(),
+        "block_hash": header["block_hash"].tobytes().hex()
+    }
+
+def ledger_code(column: str, value: str) -> int:
+    """Stored code of a named energy type, source or destination; 400 on names the ledger has no code for"""
+    names = LEDGER_INDEXED_COLUMNS[column]
+    if value not in names:
+        raise HTTPException(status_code=400, detail=f"Unknown {column} '{value}'. Use one of: {', '.join(names)}")
+    return names.index(value)
+
+def ledger_records(transfers: List[LedgerTransfer], not_before_ms: int = 0) -> np.ndarray:
+    """Encode API transfers as ledger records in timestamp order; untimed transfers are stamped now"""
+    records = np.zeros(len(transfers), dtype=LEDGER_TX_DTYPE)
+    now_ms = max(int(time.time() * 1000), not_before_ms)
+    for i, transfer in enumerate(transfers):
+        for column in LEDGER_INDEXED_COLUMNS:
+            records[column][i] = ledger_code(column, getattr(transfer, column))
+        records["timestamp_ms"][i] = int(to_utc_datetime(transfer.timestamp).timestamp() * 1000) if transfer.timestamp else now_ms
+        records["amount_kwh"][i] = transfer.amount_kwh
+    return records[np.argsort(records["timestamp_ms"], kind="stable")]
+
+energy_ledger = EnergyLedger(LEDGER_DIR)
+ledger_verify_pool: Optional[ProcessPoolExecutor] = None
+
+async def verify_ledger(ledger: EnergyLedger, start: int = 0, end: Optional[int] = None, incremental: bool = False,
+                        on_chunk: Optional[Callable[[int], None]] = None,
+                        pool: Optional[ProcessPoolExecutor] = None, checkpoint: bool = True) -> Dict[str, Any]:
+    """Verify blocks [start, end) in LEDGER_VERIFY_CHUNK_BLOCKS ranges (process pool or threads).
+    
+    incremental=True starts from the persisted checkpoint, trusting the prefix
+    its anchor hash commits to; a clean run from at or below the checkpoint
+    moves it forward, unless `checkpoint` is False.
+    """
+    pool = pool or ledger_verify_pool
+    began = time.perf_counter()
+    with ledger.lock:
+        end = ledger.height if end is None else min(end, ledger.height)
+        if incremental:
+            start = max(start, ledger.verified_through)
+        verified_through = ledger.verified_through
+    loop = asyncio.get_running_loop()
+    
+    async def run_range(low: int, high: int) -> Optional[int]:
+        args = (str(ledger.directory), ledger.segment_txs, low, high)
+        if pool is not None:
+            invalid = await loop.run_in_executor(pool, verify_ledger_blocks, *args)
+        else:
+            invalid = await asyncio.to_thread(verify_ledger_blocks, *args)
+        if on_chunk:
+            on_chunk(high - low)
+        return invalid
+    
+    ranges = [(low, min(low + LEDGER_VERIFY_CHUNK_BLOCKS, end)) for low in range(start, end, LEDGER_VERIFY_CHUNK_BLOCKS)]
+    failures = [height for height in await asyncio.gather(*(run_range(*r) for r in ranges)) if height is not None]
+    first_invalid = min(failures) if failures else None
+    with ledger.lock:
+        ledger.failed_blocks.update(failures)
+        ledger.verified.update((height, False) for height in failures)
+    if checkpoint and first_invalid is not None and first_invalid < verified_through:
+        ledger.mark_verified(first_invalid, rewind=True)
+    elif checkpoint and start <= verified_through:
+        ledger.mark_verified(first_invalid if first_invalid is not None else end)
+    
+    elapsed = time.perf_counter() - began
+    return {
+        "start": start,
+        "end": end,
+        "incremental": incremental,
+        "workers": pool._max_workers if pool is not None else 0,
+        "blocks_checked": end - start,
+        "valid": first_invalid is None,
+        "first_invalid_block": first_invalid,
+        "verified_through_block": ledger.verified_through - 1,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "blocks_per_second": round((end - start) / elapsed) if end > start and elapsed > 0 else None
+    }
+
+def blockchain_summary_snapshot() -> Dict[str, Any]:
+    """Current blockchain tracking summary, computed from the ledger"""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        **energy_ledger.summary()
+    }
+
+class LedgerFeed:
+    """Writes simulated transfers into the ledger and seals blocks that have waited LEDGER_BLOCK_INTERVAL;
+    on start it audits the blocks appended since the last verification checkpoint"""
+    
+    def __init__(self, ledger: EnergyLedger, interval: float = LEDGER_FEED_INTERVAL):
+        self.ledger = ledger
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.audit: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        self.ledger.directory = claim_worker_directory(self.ledger.directory)
+        await asyncio.to_thread(self.ledger.open)
+        if self.ledger.tx_count == 0 and self.interval > 0:
+            now_ms = int(time.time() * 1000)
+            backfill = generate_ledger_transfers(LEDGER_BACKFILL_TXS, now_ms - 7 * 86400 * 1000, now_ms)
+            await asyncio.to_thread(self.ledger.append, backfill)
+            await asyncio.to_thread(self.ledger.seal_pending)
+        self.audit = asyncio.create_task(self._audit())
+        self.task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        for task in (self.audit, self.task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.task = self.audit = None
+        self.ledger.close()
+    
+    async def _audit(self):
+        try:
+            result = await verify_ledger(self.ledger, incremental=True)
+        except Exception as e:
+            logger.error(f"Ledger audit failed: {e}")
+            return
+        if result["valid"]:
+            logger.info(f"Ledger verified through block {result['verified_through_block']} "
+                        f"({result['blocks_checked']} new blocks in {result['elapsed_ms']} ms)")
+        else:
+            logger.error(f"Ledger block {result['first_invalid_block']} failed verification")
+    
+    async def _loop(self):
+        tick = self.interval if self.interval > 0 else LEDGER_BLOCK_INTERVAL
+        while True:
+            await asyncio.sleep(min(tick, LEDGER_BLOCK_INTERVAL))
+            try:
+                if self.interval > 0:
+                    now_ms = int(time.time() * 1000)
+                    await asyncio.to_thread(self.ledger.append, generate_ledger_transfers(random.randint(1, 3), now_ms, now_ms))
+                await asyncio.to_thread(self.ledger.seal_pending, LEDGER_BLOCK_INTERVAL)
+            except Exception as e:
+                logger.error(f"Ledger feed failed: {e}")
+
+ledger_feed = LedgerFeed(energy_ledger)
+
+# ==================== QUERY PIPELINES ====================
+
+DATE_RANGE_HOURS = {"1h": 1, "24h": 24, "7d": 168, "30d": 720}
+QUERY_MAX_BUCKETS = 48
+
+def efficiency_query_field(request: QueryRequest) -> Tuple[str, str]:
+    """Field an efficiency query averages per zone and the result key reporting it"""
+    field = request.metric or "efficiency_ratio"
+    return field, "avg_efficiency" if field == "efficiency_ratio" else f"avg_{field}"
+
+def compile_query_pipeline(request: QueryRequest, start: datetime, end: datetime, hours: int) -> Optional[List[Dict[str, Any]]]:
+    """Compile a QueryRequest into an aggregation pipeline over the grid_metrics collection"""
+    match = {"timestamp": {"$gte": start, "$lt": end}}
+    if request.zone:
+        match["zone"] = request.zone
+    elif request.query_type == "zone":
+        match["zone"] = zone_registry.zones[0]
+    
+    # Hours since `start`, bucketed so long ranges come back as at most QUERY_MAX_BUCKETS rows
+    hour_offset = {"$floor": {"$divide": [{"$subtract": ["$timestamp", start]}, 3600 * 1000]}}
+    bucket_hours = max(1, math.ceil(hours / QUERY_MAX_BUCKETS))
+    boundaries = list(range(0, hours, bucket_hours)) + [hours]
+    
+    if request.query_type == "efficiency":
+        field, key = efficiency_query_field(request)
+        return [
+            {"$match": match},
+            {"$group": {"_id": "$zone", "value": {"$avg": f"${field}"}}},
+            {"$sort": {"_id": 1}},
+            {"$project": {"_id": 0, "zone": "$_id", key: "$value"}}
+        ]
+    
+    if request.query_type == "demand":
+        field = request.metric or "grid_demand"
+        return [
+            {"$match": match},
+            {"$group": {"_id": {"zone": "$zone", "hour": hour_offset}, "value": {"$avg": f"${field}"}}},
+            {"$group": {"_id": "$_id.hour", "value": {"$sum": "$value"}}},
+            {"$bucket": {"groupBy": "$_id", "boundaries": boundaries, "output": {"value": {"$avg": "$value"}}}},
+            {"$project": {"_id": 0, "hour": "$_id", "demand_mw": "$value"}}
+        ]
+    
+    if request.query_type == "renewable":
+        return [
+            {"$match": match},
+            {"$group": {
+                "_id": "$zone",
+                "solar": {"$avg": "$solar_output"},
+                "wind": {"$avg": "$wind_output"},
+                "demand": {"$avg": "$grid_demand"}
+            }},
+            {"$group": {"_id": None, "solar": {"$sum": "$solar"}, "wind": {"$sum": "$wind"}, "demand": {"$sum": "$demand"}}},
+            {"$project": {"_id": 0, "solar": {"$multiply": ["$solar", hours]}, "wind": {"$multiply": ["$wind", hours]}, "demand": {"$multiply": ["$demand", hours]}}}
+        ]
+    
+    if request.query_type == "zone":
+        field = request.metric or "grid_demand"
+        return [
+            {"$match": match},
+            {"$bucket": {"groupBy": hour_offset, "boundaries": boundaries, "output": {"value": {"$avg": f"${field}"}}}},
+            {"$project": {"_id": 0, "hour": "$_id", "power": "$value"}}
+        ]
+    
+    return None
+
+def shape_query_results(request: QueryRequest, rows: List[Dict[str, Any]], start: datetime, hours: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Turn (already grouped) pipeline rows into the QueryResponse results and aggregations"""
+    if request.query_type == "efficiency":
+        field, key = efficiency_query_field(request)
+        digits = 3 if field == "efficiency_ratio" else 2
+        results = [{"zone": row["zone"], key: round(row[key], digits)} for row in rows]
+        best = max(results, key=lambda row: row[key])
+        worst = min(results, key=lambda row: row[key])
+        overall = sum(row[key] for row in results) / len(results)
+        return results, {"overall_avg": round(overall, digits), "best_zone": best["zone"], "worst_zone": worst["zone"]}
+    
+    if request.query_type == "demand":
+        results = [{"hour": row["hour"], "demand_mw": round(row["demand_mw"], 2)} for row in rows]
+        demand = [row["demand_mw"] for row in results]
+        return results, {
+            "peak_demand": round(max(demand), 2),
+            "min_demand": round(min(demand), 2),
+            "avg_demand": round(sum(demand) / len(demand), 2)
+        }
+    
+    if request.query_type == "renewable":
+        totals = rows[0]
+        results = [{"source": src, "output_kwh": round(totals[src], 2)} for src in ("solar", "wind")]
+        renewable = totals["solar"] + totals["wind"]
+        ratio = renewable / totals["demand"] if totals["demand"] else 0
+        return results, {"total_renewable": round(renewable, 2), "renewable_ratio": round(ratio, 2)}
+    
+    results = [
+        {"timestamp": (start + timedelta(hours=row["hour"])).isoformat(), "power": round(row["power"], 2)}
+        for row in rows
+    ]
+    power = [row["power"] for row in results]
+    return results, {
+        "zone": request.zone or zone_registry.zones[0],
+        "avg_power": round(sum(power) / len(power), 2),
+        "peak_power": round(max(power), 2)
+    }
+
+def simulate_query_results(request: QueryRequest, hours: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Simulated query results used while the requested range holds no stored readings"""
+    if request.query_type == "efficiency":
+        field, key = efficiency_query_field(request)
+        digits = 3 if field == "efficiency_ratio" else 2
+        zones = zone_registry.default_site.zones
+        averages = np.round(generate_grid_metrics_columns(24, len(zones))[field].reshape(24, -1).mean(axis=0), digits)
+        results = [{"zone": zone, key: value} for zone, value in zip(zones, averages.tolist())]
+        aggregations = {
+            "overall_avg": round(float(averages.mean()), digits),
+            "best_zone": zones[int(averages.argmax())],
+            "worst_zone": zones[int(averages.argmin())]
+        }
+    
+    elif request.query_type == "demand":
+        results = [
+            {"hour": i, "demand_mw": round(400 + random.gauss(0, 50), 2)}
+            for i in range(min(hours, 48))
+        ]
+        aggregations = {"peak_demand": round(550, 2), "min_demand": round(250, 2), "avg_demand": round(400, 2)}
+    
+    elif request.query_type == "renewable":
+        results = [
+            {"source": src, "output_kwh": round(random.uniform(1000, 5000), 2)}
+            for src in ["solar", "wind", "hydro", "geothermal"]
+        ]
+        aggregations = {"total_renewable": round(sum(r["output_kwh"] for r in results), 2), "renewable_ratio": round(0.87, 2)}
+    
+    else:
+        zone = request.zone or zone_registry.zones[0]
+        results = [
+            {"timestamp": (datetime.now(timezone.utc) - timedelta(hours=i)).isoformat(), 
+             "power": round(100 + random.gauss(0, 20), 2)}
+            for i in range(min(hours, 48))
+        ]
+        aggregations = {"zone": zone, "avg_power": round(100, 2), "peak_power": round(140, 2)}
+    
+    return results, aggregations
+
+# ==================== SHARED STATE ====================
+# Snapshot bodies and realtime fan-out shared by every worker process. With
+# SHARED_STATE_URL=redis://host:6379/0, a cluster of uvicorn/gunicorn
+# workers computes each snapshot once and fans realtime messages out through
+# Redis pub/sub; without it the in-process stand-in gives one worker the
+# same behaviour.
+
+SHARED_STATE_URL = os.environ.get("SHARED_STATE_URL", "")
+SHARED_STATE_PREFIX = os.environ.get("SHARED_STATE_PREFIX", "energy_morph:")
+# Seconds a worker waits for another worker's snapshot fill before computing it itself
+SHARED_FILL_WAIT = float(os.environ.get("SHARED_FILL_WAIT", "2.0"))
+SHARED_POLL_INTERVAL = 0.01
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+class InMemorySharedState:
+    """Process-local stand-in for RedisSharedState: expiring values, owned leases and pub/sub"""
+    
+    def __init__(self, max_values: int = 4096):
+        self.max_values = max_values
+        self.values: Dict[str, Tuple[bytes, float]] = {}
+        self.channels: Dict[str, Set[asyncio.Queue]] = {}
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self.values.get(key)
+        if item is None or item[1] <= time.monotonic():
+            return None
+        return item[0]
+    
+    async def set(self, key: str, value: bytes, ttl: float):
+        now = time.monotonic()
+        if len(self.values) >= self.max_values:
+            self.values = {k: item for k, item in self.values.items() if item[1] > now}
+        self.values[key] = (value, now + ttl)
+    
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease `key` for `owner`; False while someone else holds it"""
+        holder = await self.get(key)
+        if holder is not None and holder != owner.encode():
+            return False
+        await self.set(key, owner.encode(), ttl)
+        return True
+    
+    async def release(self, key: str, owner: str):
+        if await self.get(key) == owner.encode():
+            self.values.pop(key, None)
+    
+    async def publish(self, channel: str, message: bytes) -> int:
+        queues = self.channels.get(channel, ())
+        for queue in queues:
+            queue.put_nowait((channel, message))
+        return len(queues)
+    
+    async def listen(self, channels: List[str]) -> AsyncIterator[Tuple[str, bytes]]:
+        """(channel, message) for every message published to `channels` from now on"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for channel in channels:
+            self.channels.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            for channel in channels:
+                self.channels[channel].discard(queue)
+    
+    async def close(self):
+        pass
+
+class RedisSharedState:
+    """Shared state in Redis: keys under SHARED_STATE_PREFIX, leases via SET NX PX, fan-out via PUBLISH"""
+    
+    # Extend or drop a lease only if `owner` still holds it
+    RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    
+    def __init__(self, url: str, prefix: str = SHARED_STATE_PREFIX):
+        self.redis = aioredis.from_url(url)
+        self.prefix = prefix
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(self.prefix + key)
+    
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.redis.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+    
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        px = max(1, int(ttl * 1000))
+        if await self.redis.set(self.prefix + key, owner, nx=True, px=px):
+            return True
+        return bool(await self.redis.eval(self.RENEW_SCRIPT, 1, self.prefix + key, owner, px))
+    
+    async def release(self, key: str, owner: str):
+        await self.redis.eval(self.RELEASE_SCRIPT, 1, self.prefix + key, owner)
+    
+    async def publish(self, channel: str, message: bytes) -> int:
+        return await self.redis.publish(self.prefix + channel, message)
+    
+    async def listen(self, channels: List[str]) -> AsyncIterator[Tuple[str, bytes]]:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(*(self.prefix + channel for channel in channels))
+        try:
+            async for message in pubsub.listen():
+                yield message["channel"].decode().removeprefix(self.prefix), message["data"]
+        finally:
+            await pubsub.aclose()
+    
+    async def close(self):
+        await self.redis.aclose()
+
+def open_shared_state(url: str = SHARED_STATE_URL):
+    if not url:
+        return InMemorySharedState()
+    if aioredis is None:
+        raise RuntimeError("SHARED_STATE_URL is set but the redis package is not installed")
+    return RedisSharedState(url)
+
+shared_state = open_shared_state()
+
+# ==================== SNAPSHOT CACHE ====================
+
+# Seconds a computed snapshot is served before it is recomputed
+CACHE_TTL_SECONDS = {
+    "grid_realtime": 2.0,
+    "heatmap_realtime": 2.0,
+    "neuron_activity": 5.0,
+    "blockchain_summary": 5.0,
+    "kpi_summary": 15.0,
+    "grid_metrics": 60.0,
+    "heatmap_data": 60.0
+}
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "256"))
+
+def json_body(value: Any) -> bytes:
+    if FAST_RESPONSES:
+        return fast_json_dumps(value)
+    return json.dumps(jsonable_encoder(value), separators=(",", ":")).encode()
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    expires_at: float
+
+class SnapshotCache:
+    """Serialized endpoint snapshots with per-key TTL, single-flight fills and LRU eviction.
+    
+    Misses go to the shared store next, where one worker fills each key under
+    a lease while the others wait for its result.
+    """
+    
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, shared=None, owner: str = WORKER_ID):
+        self.max_entries = max_entries
+        self.shared = shared
+        self.owner = owner
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+    
+    async def get(self, key: str, ttl: float, compute: Callable[[], Any], encode: Callable[[Any], bytes] = json_body) -> CacheEntry:
+        """Cached entry for `key`, computing and encoding it at most once across concurrent callers"""
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        
+        if key in self.inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self.inflight[key])
+        
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            entry = await self.fill(key, ttl, compute, encode)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't log it as unretrieved
+            raise
+        finally:
+            del self.inflight[key]
+    
+    async def fill(self, key: str, ttl: float, compute: Callable[[], Any], encode: Callable[[Any], bytes]) -> CacheEntry:
+        """Entry from the shared store, else computed here (or by whichever worker holds the fill lease)"""
+        if self.shared is None or ttl <= 0:
+            return await self.compute(ttl, compute, encode)
+        try:
+            entry = await self.read_shared(key)
+            if entry is None and not await self.shared.acquire(f"fill:{key}", self.owner, SHARED_FILL_WAIT):
+                deadline = time.monotonic() + SHARED_FILL_WAIT
+                while entry is None and time.monotonic() < deadline:
+                    await asyncio.sleep(SHARED_POLL_INTERVAL)
+                    entry = await self.read_shared(key)
+            if entry is not None:
+                self.shared_hits += 1
+                return entry
+        except (RedisError, OSError) as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared cache read of {key} failed, computing locally: {e}")
+            return await self.compute(ttl, compute, encode)
+        
+        entry = await self.compute(ttl, compute, encode)
+        try:
+            expires = f"{time.time() + ttl:.3f} {entry.etag}\n".encode()
+            await self.shared.set(f"snapshot:{key}", expires + entry.body, ttl)
+            await self.shared.release(f"fill:{key}", self.owner)
+        except (RedisError, OSError) as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared cache write of {key} failed: {e}")
+        return entry
+    
+    async def read_shared(self, key: str) -> Optional[CacheEntry]:
+        raw = await self.shared.get(f"snapshot:{key}")
+        if raw is None:
+            return None
+        header, _, body = raw.partition(b"\n")
+        expires, etag = header.decode().split(" ", 1)
+        remaining = float(expires) - time.time()
+        return CacheEntry(body=body, etag=etag, expires_at=time.monotonic() + remaining) if remaining > 0 else None
+    
+    @staticmethod
+    async def compute(ttl: float, compute: Callable[[], Any], encode: Callable[[Any], bytes]) -> CacheEntry:
+        value = compute()
+        if asyncio.iscoroutine(value):
+            value = await value
+        body = encode(value)
+        return CacheEntry(
+            body=body,
+            etag='"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"',
+            expires_at=time.monotonic() + ttl
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "shared_backend": type(self.shared).__name__ if self.shared is not None else None,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+            "worker": self.owner
+        }
+
+# In a single process the local tier already is the whole cache
+snapshot_cache = SnapshotCache(shared=shared_state if SHARED_STATE_URL else None)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in header.split(","))
+
+async def cached_response(
+    request: Request, key: str, ttl_name: str, compute: Callable[[], Any],
+    encode: Callable[[Any], bytes] = json_body, media_type: str = "application/json",
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Serve a cached snapshot with ETag / Cache-Control, answering 304 when the client's copy is current"""
+    entry = await snapshot_cache.get(key, CACHE_TTL_SECONDS[ttl_name], compute, encode)
+    max_age = max(0, int(entry.expires_at - time.monotonic()))
+    headers = {**(headers or {}), "ETag": entry.etag, "Cache-Control": f"public, max-age={max_age}", "Vary": "Accept"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=media_type, headers=headers)
+
+# ==================== REALTIME STREAMING ====================
+
+STREAM_SEND_TIMEOUT = float(os.environ.get("STREAM_SEND_TIMEOUT", "10"))
+
+class StreamSubscriber:
+    """One WebSocket client; holds only the newest unsent message per topic"""
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.topics: Set[str] = set()
+        self.pending: Dict[str, str] = {}
+        self.ready = asyncio.Event()
+        self.dropped = 0
+    
+    def offer(self, topic: str, message: str):
+        # A slow client never queues more than one snapshot per topic: an
+        # unsent snapshot is replaced by the newer one instead of piling up.
+        if topic in self.pending:
+            self.dropped += 1
+        self.pending[topic] = message
+        self.ready.set()
+    
+    async def drain(self):
+        """Send pending messages; a send stalled past STREAM_SEND_TIMEOUT closes the socket"""
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                pending, self.pending = self.pending, {}
+                for message in pending.values():
+                    await asyncio.wait_for(self.websocket.send_text(message), STREAM_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Closing stalled stream client after {self.dropped} coalesced snapshots")
+            await self.websocket.close(code=1013)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+class RealtimeHub:
+    """Computes each topic's snapshot once per cluster tick and fans it out to every subscriber.
+    
+    Topics map to (cache key, builder, interval); snapshots come from the
+    shared SnapshotCache so streamed and REST clients see the same data. The
+    worker holding a topic's producer lease publishes it on the shared store
+    and every worker, the leader included, relays it to its own sockets.
+    """
+    
+    def __init__(self, topics: Dict[str, Tuple[str, Callable[[], Any], float]], shared=None):
+        self.topics = topics
+        self.shared = shared if shared is not None else InMemorySharedState()
+        self.subscribers: Dict[str, Set[StreamSubscriber]] = {topic: set() for topic in topics}
+        self.producers: Dict[str, asyncio.Task] = {}
+        self.listener: Optional[asyncio.Task] = None
+        self.leading: Set[str] = set()
+        self.latest: Dict[str, str] = {}
+    
+    def subscribe(self, subscriber: StreamSubscriber, topic: str):
+        self.subscribers[topic].add(subscriber)
+        subscriber.topics.add(topic)
+        if topic in self.latest:
+            subscriber.offer(topic, self.latest[topic])
+        if self.listener is None:
+            self.listener = asyncio.create_task(self._listen())
+        if topic not in self.producers:
+            self.producers[topic] = asyncio.create_task(self._produce(topic))
+    
+    def unsubscribe(self, subscriber: StreamSubscriber, topic: str):
+        self.subscribers[topic].discard(subscriber)
+        subscriber.topics.discard(topic)
+        subscriber.pending.pop(topic, None)
+        if not self.subscribers[topic] and topic in self.producers:
+            self.producers.pop(topic).cancel()
+            self.latest.pop(topic, None)
+    
+    def disconnect(self, subscriber: StreamSubscriber):
+        for topic in list(subscriber.topics):
+            self.unsubscribe(subscriber, topic)
+    
+    def deliver(self, topic: str, body: bytes):
+        """Hand a snapshot to this worker's subscribers"""
+        if not self.subscribers[topic]:
+            return
+        message = f'{{"topic":{json.dumps(topic)},"data":{body.decode()}}}'
+        self.latest[topic] = message
+        for subscriber in list(self.subscribers[topic]):
+            subscriber.offer(topic, message)
+    
+    async def _produce(self, topic: str):
+        key, build, interval = self.topics[topic]
+        ttl = CACHE_TTL_SECONDS[key.split(":")[0]]
+        lease = f"producer:{topic}"
+        try:
+            while True:
+                try:
+                    if await self.shared.acquire(lease, WORKER_ID, interval * 2 + 1):
+                        self.leading.add(topic)
+                        entry = await snapshot_cache.get(key, ttl, build)
+                        await self.shared.publish(f"realtime:{topic}", entry.body)
+                    else:
+                        self.leading.discard(topic)
+                        if topic not in self.latest:
+                            # New subscribers here get the current snapshot without waiting for the leader's next tick
+                            self.deliver(topic, (await snapshot_cache.get(key, ttl, build)).body)
+                except (RedisError, OSError) as e:
+                    logger.warning(f"Shared store unavailable, producing {topic} locally: {e}")
+                    self.deliver(topic, (await snapshot_cache.get(key, ttl, build)).body)
+                except Exception as e:
+                    logger.error(f"Realtime producer for {topic} failed: {e}")
+                await asyncio.sleep(interval)
+        finally:
+            if topic in self.leading:
+                self.leading.discard(topic)
+                asyncio.create_task(self._release(lease))
+    
+    async def _release(self, lease: str):
+        try:
+            await self.shared.release(lease, WORKER_ID)
+        except (RedisError, OSError):
+            pass  # the lease expires on its own
+    
+    async def _listen(self):
+        channels = [f"realtime:{topic}" for topic in self.topics]
+        while True:
+            try:
+                async for channel, body in self.shared.listen(channels):
+                    self.deliver(channel.removeprefix("realtime:"), body)
+            except (RedisError, OSError) as e:
+                logger.warning(f"Realtime subscription to the shared store dropped, retrying: {e}")
+                await asyncio.sleep(1)
+    
+    async def stop(self):
+        for task in self.producers.values():
+            task.cancel()
+        self.producers.clear()
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            topic: {"subscribers": len(subscribers), "producing": topic in self.producers, "leading": topic in self.leading}
+            for topic, subscribers in self.subscribers.items()
+        }
+
+def site_topics() -> Dict[str, Tuple[str, Callable[[], Any], float]]:
+    """"grid:<site>" and "heatmap:<site>" topics carrying each site's first page of zones; "grid" and "heatmap" follow the default site"""
+    topics = {}
+    for site in zone_registry.sites.values():
+        positions = site.positions[:ZONE_PAGE_SIZE]
+        scope = zone_scope(site, positions, len(site.zones))
+        topics[f"grid:{site.id}"] = (f"grid_realtime:{scope}", lambda site=site, positions=positions: realtime_grid_snapshot(site, positions), 5.0)
+        topics[f"heatmap:{site.id}"] = (f"heatmap_realtime:{scope}", lambda site=site, positions=positions: realtime_heatmap_snapshot(site, positions), 5.0)
+    topics["grid"] = topics[f"grid:{zone_registry.default_site.id}"]
+    topics["heatmap"] = topics[f"heatmap:{zone_registry.default_site.id}"]
+    return topics
+
+realtime_hub = RealtimeHub({
+    **site_topics(),
+    "neurons": ("neuron_activity", neuron_activity_snapshot, 10.0),
+    "blockchain": ("blockchain_summary", blockchain_summary_snapshot, 15.0)
+}, shared=shared_state)
+
+# ==================== COLUMNAR FORMATS ====================
+# Arrow IPC / Parquet bodies are built straight from the column arrays, and
+# heatmaps can also be fetched as raw float32 matrices.
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+RESPONSE_FORMATS = {
+    "json": "application/json",
+    "arrow": ARROW_MEDIA_TYPE,
+    "parquet": PARQUET_MEDIA_TYPE,
+    "f32": "application/octet-stream"
+}
+PARQUET_COMPRESSION = os.environ.get("PARQUET_COMPRESSION", "zstd")
+
+def negotiate_format(request: Request, requested: Optional[str], allowed: Tuple[str, ...]) -> str:
+    """Response format from `format=`, else the first allowed media type named in Accept, else json"""
+    if requested is None:
+        accept = request.headers.get("accept", "")
+        requested = next((name for name in allowed if name != "json" and RESPONSE_FORMATS[name] in accept), "json")
+    if requested not in allowed:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {requested} (expected one of {', '.join(allowed)})")
+    if requested in ("arrow", "parquet") and pa is None:
+        raise HTTPException(status_code=501, detail=f"{requested} output requires pyarrow")
+    return requested
+
+def arrow_timestamps(timestamps: List[str]) -> "pa.Array":
+    return pa.array(timestamps, pa.string()).cast(pa.timestamp("us", tz="UTC"))
+
+def arrow_zones(zones: List[str], names: List[str]) -> "pa.DictionaryArray":
+    """Dictionary-encode `zones` against a fixed dictionary so every batch shares it"""
+    dictionary = pa.array(names, pa.string())
+    return pa.DictionaryArray.from_arrays(pc.index_in(pa.array(zones, pa.string()), value_set=dictionary).cast(pa.int32()), dictionary)
+
+def metrics_arrow_schema() -> "pa.Schema":
+    return pa.schema(
+        [("timestamp", pa.timestamp("us", tz="UTC")), ("zone", pa.dictionary(pa.int32(), pa.string()))]
+        + [(field, pa.float64()) for field in GRID_METRIC_FIELDS]
+    )
+
+def metrics_record_batch(table: Dict[str, Any]) -> "pa.RecordBatch":
+    """Record batch from a grid metrics column table"""
+    return pa.record_batch(
+        [arrow_timestamps(table["timestamp"]), arrow_zones(table["zone"], zone_registry.zones)]
+        + [pa.array(np.asarray(table[field], dtype=np.float64)) for field in GRID_METRIC_FIELDS],
+        schema=metrics_arrow_schema()
+    )
+
+def heatmap_record_batch(data: Dict[str, Any]) -> "pa.RecordBatch":
+    """Long-format (timestamp, zone, power, efficiency) batch from zone x hour heatmap matrices"""
+    zones, hours = data["power_values"].shape
+    return pa.record_batch({
+        "timestamp": arrow_timestamps(data["timestamps"] * zones),
+        "zone": pa.DictionaryArray.from_arrays(np.repeat(np.arange(zones, dtype=np.int32), hours), pa.array(data["zones"], pa.string())),
+        "power": pa.array(data["power_values"].ravel().astype(np.float64), from_pandas=True),  # NaN -> null
+        "efficiency": pa.array(data["efficiency_values"].ravel().astype(np.float64), from_pandas=True)
+    })
+
+def encode_arrow(batch: "pa.RecordBatch") -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+def encode_parquet(batch: "pa.RecordBatch") -> bytes:
+    sink = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_batches([batch]), sink, compression=PARQUET_COMPRESSION)
+    return sink.getvalue().to_pybytes()
+
+COLUMNAR_ENCODERS = {"arrow": encode_arrow, "parquet": encode_parquet}
+
+def encode_heatmap_f32(data: Dict[str, Any]) -> bytes:
+    """uint32 LE header length, JSON header padded to 4 bytes, then power and efficiency as float32 LE zone x hour matrices (NaN: no readings)"""
+    header = json.dumps({
+        "zones": data["zones"],
+        "timestamps": data["timestamps"],
+        "shape": list(data["power_values"].shape),
+        "dtype": "<f4",
+        "fields": ["power_values", "efficiency_values"]
+    }, separators=(",", ":")).encode()
+    header += b" " * (-len(header) % 4)
+    return (
+        len(header).to_bytes(4, "little") + header
+        + np.ascontiguousarray(data["power_values"], dtype="<f4").tobytes()
+        + np.ascontiguousarray(data["efficiency_values"], dtype="<f4").tobytes()
+    )
+
+class ChunkSink:
+    """Write-only file object for Arrow/Parquet writers; `drain()` hands back what was written since the last drain"""
+    
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+# ==================== EXPORT ====================
+# Exports are streamed in bounded chunks so a months-long, minute-resolution
+# download never holds more than EXPORT_CHUNK_ROWS rows in memory at once.
+
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "20000"))
+EXPORT_MAX_DAYS = int(os.environ.get("EXPORT_MAX_DAYS", "366"))
+EXPORT_RESOLUTIONS = {"minute": "1m", "hour": "1h", "day": "1d"}
+EXPORT_COLUMNS = ("timestamp", "zone") + GRID_METRIC_FIELDS
+EXPORT_EXTENSIONS = {"csv": "csv", "arrow": "arrows", "parquet": "parquet"}
+
+def rollup_export_table(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Bucket averages of a chunk of rollup documents as a column table"""
+    counts = np.array([doc["count"] for doc in docs])
+    table = {
+        field: np.round(np.array([doc[field]["sum"] for doc in docs]) / counts, 3 if field == "efficiency_ratio" else 2)
+        for field in GRID_METRIC_FIELDS
+    }
+    table["timestamp"] = [to_utc_datetime(doc["bucket"]).isoformat() for doc in docs]
+    table["zone"] = [doc["zone"] for doc in docs]
+    return table
+
+def synthetic_export_tables(start: datetime, end: datetime, zones: List[str], step_seconds: int) -> Iterator[Dict[str, Any]]:
+    """Generated metrics for every step in [start, end), EXPORT_CHUNK_ROWS rows at a time"""
+    start = datetime.fromtimestamp(start.timestamp() // step_seconds * step_seconds, timezone.utc)
+    total = int((end - start).total_seconds() // step_seconds)
+    steps_per_chunk = max(1, EXPORT_CHUNK_ROWS // len(zones))
+    for offset in range(0, total, steps_per_chunk):
+        steps = min(steps_per_chunk, total - offset)
+        first = start + timedelta(seconds=offset * step_seconds)
+        table = generate_grid_metrics_columns(
+            steps, len(zones), step_hours=step_seconds / 3600, start_hour=first.hour + first.minute / 60
+        )
+        stamps = [(first + timedelta(seconds=i * step_seconds)).isoformat() for i in range(steps)]
+        table["timestamp"] = [ts for ts in stamps for _ in zones]
+        table["zone"] = zones * steps
+        yield table
+
+async def metrics_export_tables(start: datetime, end: datetime, zones: List[str], tier: str,
+                                progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Grid metric column tables from the rollup tier, or generated data when nothing is stored; `progress` sees each table"""
+    if await rollup_store.has_data(start, end, zones, tier):
+        tables = (rollup_export_table(docs) async for docs in rollup_store.iter_documents(start, end, zones, tier, EXPORT_CHUNK_ROWS))
+    else:
+        tables = synthetic_export_tables(start, end, zones, ROLLUP_TIERS[tier])
+        tables = (table async for table in iterate_in_thread(tables))
+    async for table in tables:
+        if progress:
+            progress(table)
+        yield table
+
+async def iterate_in_thread(items: Iterator[Any]) -> AsyncIterator[Any]:
+    """Advance a CPU-bound iterator off the event loop"""
+    while (item := await asyncio.to_thread(next, items, None)) is not None:
+        yield item
+
+def csv_chunk(table: Dict[str, Any]) -> str:
+    """Format one column table as CSV rows"""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(
+        zip(table["timestamp"], table["zone"], *(table[field].tolist() for field in GRID_METRIC_FIELDS))
+    )
+    return buffer.getvalue()
+
+async def metrics_csv_chunks(start: datetime, end: datetime, zones: List[str], tier: str,
+                             progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> AsyncIterator[str]:
+    yield ",".join(EXPORT_COLUMNS) + "\n"
+    async for table in metrics_export_tables(start, end, zones, tier, progress):
+        yield csv_chunk(table)
+
+async def metrics_columnar_chunks(start: datetime, end: datetime, zones: List[str], tier: str, output: str,
+                                  progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> AsyncIterator[bytes]:
+    """Arrow IPC stream (one batch per chunk) or Parquet file (one row group per chunk)"""
+    sink = ChunkSink()
+    schema = metrics_arrow_schema()
+    if output == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    else:
+        writer = pq.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION)
+    async for table in metrics_export_tables(start, end, zones, tier, progress):
+        writer.write_batch(metrics_record_batch(table))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+@dataclass
+class ExportPlan:
+    start: datetime
+    end: datetime
+    zones: List[str]
+    tier: str
+    output: str
+    compress: bool
+    filename: str
+    media_type: str
+    
+    def chunks(self, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> AsyncIterator[Any]:
+        if self.output == "csv":
+            chunks = metrics_csv_chunks(self.start, self.end, self.zones, self.tier, progress)
+        else:
+            chunks = metrics_columnar_chunks(self.start, self.end, self.zones, self.tier, self.output, progress)
+        return gzip_chunks(chunks) if self.compress else chunks
+
+def plan_export(data_type: str, output: str, zones: Optional[str], start: Optional[datetime],
+                end: Optional[datetime], resolution: str, compress: bool, site: Optional[str] = None) -> ExportPlan:
+    """Validate a streamed export request (400/501 on bad input) and resolve its range, zones and file naming"""
+    if output not in EXPORT_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {output}")
+    if output != "csv" and pa is None:
+        raise HTTPException(status_code=501, detail=f"{output} output requires pyarrow")
+    if data_type != "metrics":
+        raise HTTPException(status_code=400, detail=f"Unknown data type: {data_type}")
+    if resolution not in EXPORT_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+    if site is not None and site not in zone_registry.sites:
+        raise HTTPException(status_code=400, detail=f"Unknown site: {site}")
+    zone_list = zones.split(",") if zones else zone_registry.sites[site].zones if site else zone_registry.zones
+    unknown = [zone for zone in zone_list if zone not in zone_registry.index]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown zones: {', '.join(unknown[:20])}")
+    end = to_utc_datetime(end) if end else datetime.now(timezone.utc)
+    start = to_utc_datetime(start) if start else end - timedelta(hours=24)
+    if not start < end <= start + timedelta(days=EXPORT_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"start must precede end by at most {EXPORT_MAX_DAYS} days")
+    
+    filename = f"metrics_export_{start.strftime('%Y%m%d%H%M')}_{end.strftime('%Y%m%d%H%M')}.{EXPORT_EXTENSIONS[output]}"
+    media_type = "text/csv; charset=utf-8" if output == "csv" else RESPONSE_FORMATS[output]
+    compress = compress and output != "parquet"
+    if compress:
+        media_type, filename = "application/gzip", filename + ".gz"
+    return ExportPlan(start, end, zone_list, EXPORT_RESOLUTIONS[resolution], output, compress, filename, media_type)
+
+async def gzip_chunks(chunks: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    """Compress a stream of text or byte chunks into a single gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# ==================== METRICS ====================
+# Prometheus text exposition on /metrics. Each (method, path) is resolved to
+# its route template once; after that a request costs a few dict updates and
+# one bisect per histogram. Families are only formatted when scraped. Every
+# series carries a `worker` label since each process keeps its own counts.
+
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+METRICS_ROUTE_CACHE = 4096  # resolved (method, path) pairs kept before the cache is reset
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL", "0.5"))  # 0 disables the probe
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class Histogram:
+    """Fixed-bucket histogram; `counts` are per bucket, made cumulative on render"""
+    
+    __slots__ = ("bounds", "counts", "sum")
+    
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+    
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {total}")
+        return lines
+
+def metric_labels(**labels: Any) -> str:
+    return ",".join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for name, value in labels.items())
+
+class RequestMetrics:
+    """Per-route request counts by status, latency and body-size histograms and in-flight gauges"""
+    
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], str] = {}
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.request_bytes: Dict[Tuple[str, str], Histogram] = {}
+        self.response_bytes: Dict[Tuple[str, str], Histogram] = {}
+    
+    def route_of(self, router, scope) -> str:
+        """Route template for the request (bounded label set), "unmatched" for 404s"""
+        key = (scope["method"], scope["path"])
+        route = self.routes.get(key)
+        if route is None:
+            route = "unmatched"
+            for candidate in router.routes:
+                match, _ = candidate.matches(scope)
+                if match == Match.FULL:
+                    route = candidate.path
+                    break
+                if match == Match.PARTIAL and route == "unmatched":
+                    route = candidate.path  # right path, wrong method: answered with 405
+            if len(self.routes) >= METRICS_ROUTE_CACHE:
+                self.routes.clear()
+            self.routes[key] = route
+        return route
+    
+    def observe(self, key: Tuple[str, str], status: int, seconds: float, received: int, sent: int):
+        counter = key + (status,)
+        self.requests[counter] = self.requests.get(counter, 0) + 1
+        if key not in self.latency:
+            self.latency[key] = Histogram(METRICS_LATENCY_BUCKETS)
+            self.request_bytes[key] = Histogram(METRICS_SIZE_BUCKETS)
+            self.response_bytes[key] = Histogram(METRICS_SIZE_BUCKETS)
+        self.latency[key].observe(seconds)
+        self.request_bytes[key].observe(received)
+        self.response_bytes[key].observe(sent)
+    
+    def render(self) -> List[str]:
+        lines = [
+            "# HELP http_requests_total Requests completed, by route and status",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{{{metric_labels(worker=WORKER_ID, method=method, route=route, status=status)}}} {count}")
+        lines += [
+            "# HELP http_requests_in_flight Requests being handled",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        for (method, route), count in sorted(self.in_flight.items()):
+            lines.append(f"http_requests_in_flight{{{metric_labels(worker=WORKER_ID, method=method, route=route)}}} {count}")
+        for name, help_text, histograms in (
+            ("http_request_duration_seconds", "Time from request start to the last response byte", self.latency),
+            ("http_request_size_bytes", "Request body bytes received", self.request_bytes),
+            ("http_response_size_bytes", "Response body bytes sent, after compression", self.response_bytes),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (method, route), histogram in sorted(histograms.items()):
+                lines += histogram.render(name, metric_labels(worker=WORKER_ID, method=method, route=route))
+        return lines
+
+class MetricsMiddleware:
+    """Times and sizes every HTTP request into `metrics`; WebSocket traffic passes through untouched"""
+    
+    def __init__(self, app, metrics: RequestMetrics, router):
+        self.app = app
+        self.metrics = metrics
+        self.router = router
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        metrics = self.metrics
+        key = (scope["method"], metrics.route_of(self.router, scope))
+        status = 500  # unless the app starts a response before failing
+        received = sent = 0
+        
+        async def counted_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            return message
+        
+        async def counted_send(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+        
+        metrics.in_flight[key] = metrics.in_flight.get(key, 0) + 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counted_receive, counted_send)
+        finally:
+            metrics.in_flight[key] -= 1
+            metrics.observe(key, status, time.perf_counter() - start, received, sent)
+
+class EventLoopMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. how long callbacks wait for the loop"""
+    
+    def __init__(self, interval: float = EVENT_LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.lag = Histogram(METRICS_LATENCY_BUCKETS)
+        self.last = 0.0
+        self.task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if self.interval > 0:
+            self.task = asyncio.create_task(self._probe())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+    
+    async def _probe(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.perf_counter() - start - self.interval)
+            self.lag.observe(self.last)
+    
+    def render(self) -> List[str]:
+        labels = metric_labels(worker=WORKER_ID)
+        return [
+            "# HELP event_loop_lag_seconds Delay of the latest event-loop probe",
+            "# TYPE event_loop_lag_seconds gauge",
+            f"event_loop_lag_seconds{{{labels}}} {self.last}",
+            "# HELP event_loop_lag_probe_seconds Delay of every event-loop probe",
+            "# TYPE event_loop_lag_probe_seconds histogram",
+            *self.lag.render("event_loop_lag_probe_seconds", labels),
+        ]
+
+def mongo_pool_metrics() -> List[str]:
+    labels = metric_labels(worker=WORKER_ID)
+    return [
+        "# HELP mongodb_pool_connections Driver connections by state",
+        "# TYPE mongodb_pool_connections gauge",
+        f"mongodb_pool_connections{{{labels},state=\"open\"}} {pool_monitor.open}",
+        f"mongodb_pool_connections{{{labels},state=\"checked_out\"}} {pool_monitor.checked_out}",
+        "# HELP mongodb_pool_wait_queue Operations waiting for a connection",
+        "# TYPE mongodb_pool_wait_queue gauge",
+        f"mongodb_pool_wait_queue{{{labels}}} {pool_monitor.waiting}",
+        "# HELP mongodb_pool_max_size Configured connections per server",
+        "# TYPE mongodb_pool_max_size gauge",
+        f"mongodb_pool_max_size{{{labels}}} {client.options.pool_options.max_pool_size}",
+    ]
+
+request_metrics = RequestMetrics()
+event_loop_monitor = EventLoopMonitor()
+
+def render_metrics() -> bytes:
+    lines = request_metrics.render() + mongo_pool_metrics() + event_loop_monitor.render()
+    return ("\n".join(lines) + "\n").encode()
+
+# ==================== PROFILING ====================
+# Opt-in per-request profiles for /api endpoints. A sampler thread records
+# every thread's Python stack each PROFILE_INTERVAL_MS; a request's CPU
+# profile is the samples taken while it ran, as folded stacks
+# ("thread;outer;...;leaf count", the input of flamegraph.pl and speedscope).
+# Requests ask for one with `X-Profile: 1` or `?profile=1` (PROFILE_REQUESTS),
+# which also traces allocations with tracemalloc, or with `cpu` instead of 1
+# for samples only: tracing slows the request several times over and skews
+# its samples toward allocation-heavy code. With PROFILE_SLOW_MS set the
+# sampler runs continuously and any slower request is kept (CPU only).
+# Samples from concurrent requests overlap, so profile under light load.
+
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "false").lower() in ("1", "true", "yes")
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))  # 0 disables slow-request capture
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER = int(os.environ.get("PROFILE_BUFFER", "32"))  # profiles kept, oldest dropped first
+PROFILE_WINDOW = 30.0  # seconds of samples kept while sampling continuously; longer requests keep their last 30 s
+PROFILE_TRACE_FRAMES = int(os.environ.get("PROFILE_TRACE_FRAMES", "1"))  # allocation traceback depth; each extra frame slows traced requests
+PROFILE_TOP = 20
+FOLDED_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+class StackSampler:
+    """Background thread sampling all threads' stacks while any profile is open, or always"""
+    
+    # Leaf functions of worker threads waiting for work; such samples are dropped
+    IDLE_LEAVES = {("threading.py", "wait"), ("queue.py", "get"), ("thread.py", "_worker"), ("selectors.py", "select"),
+                   ("periodic_executor.py", "_run")}
+    
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, window: float = PROFILE_WINDOW):
+        self.interval = interval
+        self.window = window
+        self.samples: deque = deque()  # (perf_counter, thread name, code objects root first)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.users = 0
+        self.always = False
+        self.loop_thread: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = False
+        self.labels: Dict[Any, str] = {}
+    
+    def start(self, always: bool = False):
+        """Start sampling from the event-loop thread (call it from there)"""
+        self.loop_thread = threading.get_ident()
+        self.always = always
+        self.stopped = False
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+    
+    def acquire(self):
+        self.users += 1
+        self.wakeup.set()
+    
+    def release(self):
+        self.users -= 1
+    
+    def _run(self):
+        me = threading.get_ident()
+        while not self.stopped:
+            if not (self.always or self.users):
+                with self.lock:
+                    self.samples.clear()
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            batch = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if ident != self.loop_thread and (os.path.basename(code.co_filename), code.co_name) in self.IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                batch.append((now, "event-loop" if ident == self.loop_thread else names.get(ident, str(ident)), tuple(stack)))
+            with self.lock:
+                self.samples.extend(batch)
+                while self.samples[0][0] < now - self.window:
+                    self.samples.popleft()
+            time.sleep(self.interval)
+    
+    def label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+    
+    def collect(self, start: float, end: float) -> Counter:
+        """Folded stacks of the samples taken between `start` and `end` (perf_counter)"""
+        with self.lock:
+            window = [sample for sample in self.samples if start <= sample[0] <= end]
+        folded: Counter = Counter()
+        for _, thread, stack in window:
+            folded[";".join([thread] + [self.label(code) for code in stack])] += 1
+        return folded
+
+def folded_top(folded: Counter, weight_name: str) -> List[Dict[str, Any]]:
+    """Heaviest leaf functions (self time or self bytes)"""
+    leaves: Counter = Counter()
+    for stack, weight in folded.items():
+        leaves[stack.rsplit(";", 1)[-1]] += weight
+    return [{"function": name, weight_name: weight} for name, weight in leaves.most_common(PROFILE_TOP)]
+
+_profiler_lines: Set[Tuple[str, int]] = set()
+
+def profiler_lines() -> Set[Tuple[str, int]]:
+    """(file, line) pairs of the profiler's own code, whose allocations are left out of traces"""
+    if not _profiler_lines:
+        for function in (StackSampler._run, StackSampler.label, StackSampler.collect, folded_top, ProfilingMiddleware.__call__):
+            code = function.__code__
+            _profiler_lines.update((code.co_filename, line) for _, _, line in code.co_lines() if line is not None)
+    return _profiler_lines
+
+class AllocationTrace:
+    """tracemalloc for the duration of one or more profiled requests"""
+    
+    def __init__(self):
+        self.users = 0
+        self.started_here = False
+    
+    def begin(self):
+        if self.users == 0:
+            self.started_here = not tracemalloc.is_tracing()
+            if self.started_here:
+                tracemalloc.start(PROFILE_TRACE_FRAMES)
+        tracemalloc.reset_peak()
+        self.users += 1
+    
+    def end(self) -> Dict[str, Any]:
+        """Peak traced memory and the allocations still alive, as folded stacks weighted by bytes"""
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        self.users -= 1
+        if self.users == 0 and self.started_here:
+            tracemalloc.stop()
+        own = profiler_lines()
+        labels: Dict[Tuple[str, int], str] = {}
+        folded: Counter = Counter()
+        for stat in snapshot.statistics("traceback"):
+            frames = [(frame.filename, frame.lineno) for frame in stat.traceback]
+            if not own.isdisjoint(frames):
+                continue  # the sampler's and this profile's own bookkeeping
+            folded[";".join(labels.get(frame) or labels.setdefault(frame, f"{os.path.basename(frame[0])}:{frame[1]}")
+                            for frame in frames)] += stat.size
+        return {"peak_bytes": peak, "retained_bytes": sum(folded.values()), "top": folded_top(folded, "bytes"), "folded": dict(folded)}
+
+@dataclass
+class RequestProfile:
+    id: str
+    method: str
+    path: str
+    query: str
+    trigger: str
+    started_at: str
+    duration_ms: float
+    status: int
+    cpu: Dict[str, Any]
+    memory: Optional[Dict[str, Any]] = None
+    
+    def describe(self, folded: bool = False) -> Dict[str, Any]:
+        body = {
+            "id": self.id, "method": self.method, "path": self.path, "query": self.query, "trigger": self.trigger,
+            "started_at": self.started_at, "duration_ms": self.duration_ms, "status": self.status,
+            "cpu": {key: value for key, value in self.cpu.items() if folded or key != "folded"},
+        }
+        if self.memory is not None:
+            body["memory"] = {key: value for key, value in self.memory.items() if folded or key != "folded"}
+        return body
+
+class ProfilingMiddleware:
+    """Profiles /api requests that ask for it, or that run longer than `slow_ms`, into `profiles`"""
+    
+    def __init__(self, app, sampler: StackSampler, profiles: deque, enabled: bool = PROFILE_REQUESTS,
+                 slow_ms: float = PROFILE_SLOW_MS):
+        self.app = app
+        self.sampler = sampler
+        self.profiles = profiles
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.allocations = AllocationTrace()
+    
+    def requested(self, scope) -> Tuple[Optional[str], bool]:
+        """(trigger, trace allocations) for `?profile=` / `X-Profile:` set to 1 (CPU and allocations) or cpu (CPU only)"""
+        value = trigger = None
+        query = scope.get("query_string", b"")
+        if b"profile=" in query:
+            value, trigger = parse_qs(query.decode()).get("profile", [""])[0].lower(), "query"
+        else:
+            for name, header in scope["headers"]:
+                if name == b"x-profile":
+                    value, trigger = header.decode("latin-1").lower(), "header"
+                    break
+        if value in ("1", "true", "yes"):
+            return trigger, True
+        if value == "cpu":
+            return trigger, False
+        return None, False
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.enabled or self.slow_ms > 0) or not scope["path"].startswith("/api/") \
+                or scope["path"].startswith("/api/admin/profiles"):
+            await self.app(scope, receive, send)
+            return
+        
+        trigger, trace = self.requested(scope) if self.enabled else (None, False)
+        if trigger is None and not self.sampler.always:
+            await self.app(scope, receive, send)
+            return
+        
+        profile_id = uuid.uuid4().hex[:12] if trigger is not None else None
+        started_at = datetime.now(timezone.utc)
+        status = 500
+        
+        async def send_profiled(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile_id is not None:
+                    MutableHeaders(raw=message["headers"])["X-Profile-Id"] = profile_id
+            await send(message)
+        
+        if trigger is not None:
+            self.sampler.acquire()
+            if trace:
+                self.allocations.begin()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            end = time.perf_counter()
+            duration_ms = (end - start) * 1000
+            if trigger is not None or duration_ms >= self.slow_ms:
+                folded = self.sampler.collect(start, end)
+                profile = RequestProfile(
+                    id=profile_id or uuid.uuid4().hex[:12], method=scope["method"], path=scope["path"],
+                    query=scope.get("query_string", b"").decode(), trigger=trigger or "slow",
+                    started_at=started_at.isoformat(), duration_ms=round(duration_ms, 3), status=status,
+                    cpu={
+                        "interval_ms": self.sampler.interval * 1000,
+                        "samples": sum(folded.values()),
+                        "top": folded_top(folded, "samples"),
+                        "folded": dict(folded),
+                    }
+                )
+                self.profiles.append(profile)
+            if trigger is not None:
+                self.sampler.release()
+                if trace:
+                    profile.memory = self.allocations.end()
+
+stack_sampler = StackSampler()
+request_profiles: deque = deque(maxlen=PROFILE_BUFFER)
+
+def find_profile(profile_id: str) -> RequestProfile:
+    for profile in request_profiles:
+        if profile.id == profile_id:
+            return profile
+    raise HTTPException(status_code=404, detail="Profile not found")
+
+# ==================== COMPRESSION ====================
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+# Already-compressed bodies, and event streams that must reach the client per event, are sent as-is
+UNCOMPRESSIBLE_MEDIA_TYPES = ("application/gzip", PARQUET_MEDIA_TYPE, "text/event-stream")
+
+def pick_content_encoding(accept_encoding: str) -> Optional[str]:
+    """Brotli when installed and accepted, else gzip when accepted, else None"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip() not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def new_compressor(encoding: str) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    """(compress, finish) pair for a streaming brotli or gzip encoder"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+class CompressionMiddleware:
+    """Brotli / gzip response compression for bodies of at least `minimum_size` bytes; streamed bodies stay streamed"""
+    
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            encoding = pick_content_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        compress = finish = None
+        passthrough = False
+        
+        async def send_compressed(message):
+            nonlocal start_message, compress, finish, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compress is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if (
+                    "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(UNCOMPRESSIBLE_MEDIA_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                
+                compress, finish = new_compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag  # the strong ETag names the uncompressed body
+                await send(start_message)
+            
+            data = compress(body)
+            if not more_body:
+                data += finish()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+        
+        await self.app(scope, receive, send_compressed)
+
+# ==================== INGESTION ====================
+# Meters push readings in bulk as NDJSON or Arrow IPC streams. Bodies are
+# validated column-wise (no per-row models), parked in a bounded buffer and
+# written by one writer task in batches of up to INGEST_FLUSH_ROWS, or every
+# INGEST_FLUSH_INTERVAL seconds. When storage falls behind and the buffer is
+# full, producers get 429 with a Retry-After sized to the backlog.
+
+INGEST_MAX_BUFFERED = int(os.environ.get("INGEST_MAX_BUFFERED", "200000"))
+INGEST_FLUSH_ROWS = int(os.environ.get("INGEST_FLUSH_ROWS", str(INSERT_BATCH_SIZE)))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "0.5"))
+INGEST_MAX_BODY_ROWS = 100_000
+INGEST_MAX_BODY_BYTES = int(os.environ.get("INGEST_MAX_BODY_BYTES", str(32 << 20)))  # before and after gunzip
+INGEST_MAX_ERRORS = 20  # per-row errors echoed back per request
+INGEST_TIMESTAMP_RANGE_MS = (0, 4_102_444_800_000)  # 1970-01-01 up to 2100-01-01 UTC
+INGEST_RETRY_BACKOFF = (0.5, 30.0)  # writer sleep after a failed flush, doubling up to the max
+INGEST_LATENCY_SAMPLES = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# Flush failures that a retry would only repeat
+INGEST_POISON_ERRORS = (ValueError, TypeError, OverflowError, BSONError)
+
+@dataclass
+class ReadingBatch:
+    epoch_ms: np.ndarray  # int64
+    zones: np.ndarray  # zone registry positions
+    values: np.ndarray  # (rows, len(GRID_METRIC_FIELDS)) float64
+    
+    def __len__(self) -> int:
+        return len(self.epoch_ms)
+    
+    @staticmethod
+    def concat(batches: List["ReadingBatch"]) -> "ReadingBatch":
+        return ReadingBatch(
+            np.concatenate([b.epoch_ms for b in batches]),
+            np.concatenate([b.zones for b in batches]),
+            np.concatenate([b.values for b in batches])
+        )
+    
+    def split(self, rows: int) -> Tuple["ReadingBatch", "ReadingBatch"]:
+        return (ReadingBatch(self.epoch_ms[:rows], self.zones[:rows], self.values[:rows]),
+                ReadingBatch(self.epoch_ms[rows:], self.zones[rows:], self.values[rows:]))
+
+ISO_OFFSET = re.compile(r"T[^\n]*[+-]\d\d:?\d\d\n")  # a non-UTC offset, which numpy cannot parse
+
+def epoch_ms_scalar(value: Any) -> float:
+    """epoch_ms_column for one value"""
+    try:
+        return float(value) * 1000 if type(value) in (int, float) else to_utc_datetime(value).timestamp() * 1000
+    except (TypeError, ValueError, AttributeError, OverflowError):
+        return np.nan
+
+def epoch_ms_column(values: List[Any]) -> np.ndarray:
+    """Epoch milliseconds of ISO strings or epoch seconds; NaN where neither parses.
+    
+    Numbers and naive or UTC ISO strings convert in bulk; batches holding other
+    offsets or strings numpy cannot read fall back to a per-value parse.
+    """
+    kinds = set(map(type, values))
+    if len(kinds) > 1:  # convert each kind in bulk, then place it
+        out = np.full(len(values), np.nan)
+        for kind in kinds & {int, float, str}:
+            rows = [i for i, value in enumerate(values) if type(value) is kind]
+            out[rows] = epoch_ms_column([values[i] for i in rows])
+        return out
+    if kinds & {int, float}:
+        try:
+            with np.errstate(over="ignore"):
+                return np.array(values, dtype=np.float64) * 1000
+        except OverflowError:  # an int beyond float range
+            pass
+    elif kinds == {str}:
+        text = ("\n".join(values) + "\n").replace("Z\n", "\n").replace("+00:00\n", "\n")
+        lines = text.split("\n")[:-1]
+        if len(lines) == len(values) and not ISO_OFFSET.search(text):
+            try:
+                parsed = np.array(lines, dtype="datetime64[ms]")
+            except ValueError:
+                pass
+            else:
+                out = parsed.astype(np.int64).astype(np.float64)
+                out[np.isnat(parsed)] = np.nan
+                return out
+    return np.array([epoch_ms_scalar(value) for value in values], dtype=np.float64)
+
+def number_column(values: List[Any]) -> np.ndarray:
+    """float64 column; NaN for anything that is not a JSON number"""
+    return np.fromiter((value if type(value) in (int, float) else np.nan for value in values), dtype=np.float64, count=len(values))
+
+def parse_ndjson_readings(body: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[int, str]]:
+    """Columns of an NDJSON body (one GridMetrics object per line) and errors of lines that are not JSON objects"""
+    lines = [line for line in body.split(b"\n") if line.strip()]
+    errors: Dict[int, str] = {}
+    try:
+        rows = json_loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:  # find the broken lines and keep the rest
+        rows = []
+        for i, line in enumerate(lines):
+            try:
+                rows.append(json_loads(line))
+            except ValueError:
+                rows.append(None)
+                errors[i] = "line is not valid JSON"
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            rows[i] = {}
+            errors.setdefault(i, "line is not a JSON object")
+    epoch_ms = epoch_ms_column([row.get("timestamp") for row in rows])
+    zones = zone_registry.positions([row.get("zone") for row in rows])
+    values = np.column_stack([number_column([row.get(field) for row in rows]) for field in GRID_METRIC_FIELDS]) \
+        if rows else np.zeros((0, len(GRID_METRIC_FIELDS)))
+    return epoch_ms, zones, values, errors
+
+def parse_arrow_readings(body: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[int, str]]:
+    """Columns of an Arrow IPC stream with GridMetrics columns (timestamp as timestamp, epoch seconds or ISO strings)"""
+    table = pa.ipc.open_stream(body).read_all()
+    missing = [name for name in ("timestamp", "zone", *GRID_METRIC_FIELDS) if name not in table.column_names]
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(missing)}")
+    timestamps = table.column("timestamp")
+    if pa.types.is_timestamp(timestamps.type):
+        epoch_ms = pc.cast(timestamps, pa.timestamp("ms", tz=timestamps.type.tz)).cast(pa.int64()) \
+            .cast(pa.float64()).fill_null(np.nan).to_numpy()
+    elif pa.types.is_integer(timestamps.type) or pa.types.is_floating(timestamps.type):
+        epoch_ms = timestamps.cast(pa.float64()).fill_null(np.nan).to_numpy() * 1000
+    else:
+        epoch_ms = epoch_ms_column(timestamps.to_pylist())
+    zones = pc.index_in(table.column("zone").cast(pa.string()), value_set=pa.array(zone_registry.zones)) \
+        .fill_null(-1).to_numpy().astype(np.int64)
+    values = np.column_stack([
+        table.column(field).cast(pa.float64()).fill_null(np.nan).to_numpy() for field in GRID_METRIC_FIELDS
+    ]) if table.num_rows else np.zeros((0, len(GRID_METRIC_FIELDS)))
+    return epoch_ms, zones, values, {}
+
+def validate_readings(epoch_ms: np.ndarray, zones: np.ndarray, values: np.ndarray,
+                      errors: Dict[int, str]) -> Tuple[ReadingBatch, int, List[Dict[str, Any]]]:
+    """Valid rows as a ReadingBatch, the rejected count and the first INGEST_MAX_ERRORS row errors"""
+    checks = [
+        (np.isnan(epoch_ms), "timestamp must be an ISO-8601 string or epoch seconds"),
+        (~((epoch_ms >= INGEST_TIMESTAMP_RANGE_MS[0]) & (epoch_ms < INGEST_TIMESTAMP_RANGE_MS[1])),
+         "timestamp must fall between 1970 and 2100"),
+        (zones < 0, "zone is not a registered zone (see /api/sites)"),
+        *((~np.isfinite(values[:, j]), f"{field} must be a finite number") for j, field in enumerate(GRID_METRIC_FIELDS))
+    ]
+    invalid = np.zeros(len(epoch_ms), dtype=bool)
+    for mask, _ in checks:
+        invalid |= mask
+    if errors:
+        invalid[list(errors)] = True
+    
+    rejected = np.flatnonzero(invalid)
+    details = []
+    for row in rejected[:INGEST_MAX_ERRORS].tolist():
+        message = errors.get(row) or next(message for mask, message in checks if mask[row])
+        details.append({"row": row, "error": message})
+    valid = ~invalid
+    batch = ReadingBatch(epoch_ms[valid].astype(np.int64), zones[valid], values[valid])
+    return batch, len(rejected), details
 
-# Create the main app
-app = FastAPI(title="Energy-Morph API", version="1.0.0")
+def parse_ingest_body(content_type: str, body: bytes) -> Tuple[ReadingBatch, int, List[Dict[str, Any]]]:
+    parse = parse_arrow_readings if content_type == ARROW_MEDIA_TYPE else parse_ndjson_readings
+    try:
+        columns = parse(body)
+    except (ValueError, pa.ArrowException if pa is not None else ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable body: {e}")
+    if len(columns[0]) > INGEST_MAX_BODY_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {INGEST_MAX_BODY_ROWS} readings per request")
+    return validate_readings(*columns)
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+def reading_documents(batch: ReadingBatch) -> List[Dict[str, Any]]:
+    """Metrics-store documents for a validated batch"""
+    zone_names = zone_registry.names[batch.zones].tolist()
+    return [
+        {"timestamp": datetime.fromtimestamp(ms / 1000, timezone.utc), "zone": zone, **dict(zip(GRID_METRIC_FIELDS, row))}
+        for ms, zone, row in zip(batch.epoch_ms.tolist(), zone_names, batch.values.tolist())
+    ]
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+class TelemetryIngestor:
+    """Bounded buffer of validated readings, drained to the metrics store in size/time-bounded batches.
+    
+    Failed flushes are retried, so delivery is at least once. A batch that fails
+    deterministically (a document that cannot be built or encoded) is bisected
+    until the offending readings are isolated, and only those are dropped, so
+    one bad reading cannot wedge the buffer.
+    """
+    
+    def __init__(self, max_buffered: int = INGEST_MAX_BUFFERED, flush_rows: int = INGEST_FLUSH_ROWS,
+                 flush_interval: float = INGEST_FLUSH_INTERVAL):
+        self.max_buffered = max_buffered
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.batches: deque = deque()
+        self.buffered = 0  # readings accepted but not yet written, including the batch being flushed
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.counts = {"accepted": 0, "rejected": 0, "written": 0, "dropped": 0, "throttled_requests": 0,
+                       "flushes": 0, "failed_flushes": 0}
+        self.flush_ms: deque = deque(maxlen=INGEST_LATENCY_SAMPLES)
+        self.write_rate = 0.0  # readings/s of recent flushes, for Retry-After
+        self.started_at = 0.0
+    
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.started_at = time.monotonic()
+        self.task = asyncio.create_task(self._writer())
+    
+    async def stop(self, timeout: float = 5.0):
+        """Stop the writer, then make one last attempt to write what is buffered"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        if self.batches:
+            batch = ReadingBatch.concat(list(self.batches))
+            self.batches.clear()
+            try:
+                await asyncio.wait_for(self._write(batch), timeout)
+            except Exception as e:
+                logger.error(f"Dropped {self.buffered} buffered readings on shutdown: {e}")
+    
+    def offer(self, batch: ReadingBatch) -> bool:
+        """Buffer a batch unless that would exceed `max_buffered`"""
+        if self.buffered + len(batch) > self.max_buffered:
+            self.counts["throttled_requests"] += 1
+            return False
+        if len(batch):
+            self.batches.append(batch)
+            self.buffered += len(batch)
+            self.counts["accepted"] += len(batch)
+            if self.buffered >= self.flush_rows:
+                self.wakeup.set()
+        return True
+    
+    def retry_after(self) -> int:
+        """Seconds until the writer should have made room, at its recent rate"""
+        return int(min(max(math.ceil(self.buffered / max(self.write_rate, 1.0)), 1), 30))
+    
+    def _take(self) -> ReadingBatch:
+        taken, rows = [], 0
+        while self.batches and rows < self.flush_rows:
+            batch = self.batches.popleft()
+            if rows + len(batch) > self.flush_rows:
+                batch, rest = batch.split(self.flush_rows - rows)
+                self.batches.appendleft(rest)
+            taken.append(batch)
+            rows += len(batch)
+        return ReadingBatch.concat(taken)
+    
+    async def _flush(self, batch: ReadingBatch):
+        """Write `batch`; on failure the chunks not yet written (with their rollups) go back to the front of the buffer"""
+        started = time.perf_counter()
+        written = 0
+        
+        def committed(rows: int):
+            nonlocal written
+            written += rows
+            self.buffered -= rows
+            self.counts["written"] += rows
+        
+        try:
+            documents = await asyncio.to_thread(reading_documents, batch)
+            await metrics_store.insert_documents(documents, on_chunk=committed)
+        except BaseException:
+            self.batches.appendleft(batch.split(written)[1])
+            raise
+        elapsed = time.perf_counter() - started
+        self.counts["flushes"] += 1
+        self.flush_ms.append(elapsed * 1000)
+        rate = len(batch) / max(elapsed, 1e-6)
+        self.write_rate = rate if not self.write_rate else 0.8 * self.write_rate + 0.2 * rate
+    
+    async def _write(self, batch: ReadingBatch):
+        """_flush, bisecting on deterministic failures and dropping only the readings that cannot be written"""
+        try:
+            await self._flush(batch)
+        except INGEST_POISON_ERRORS as e:
+            self.counts["failed_flushes"] += 1
+            rest = self.batches.popleft()  # put back by _flush
+            if len(rest) == 1:
+                self.buffered -= 1
+                self.counts["dropped"] += 1
+                logger.error(f"Dropped an ingested reading that cannot be written: {e}")
+                return
+            head, tail = rest.split(len(rest) // 2)
+            self.batches.appendleft(tail)
+            await self._write(head)  # a transient failure leaves head's rest in front of tail
+            await self._write(self.batches.popleft())
+    
+    async def _writer(self):
+        backoff = INGEST_RETRY_BACKOFF[0]
+        while True:
+            if self.buffered < self.flush_rows:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            if not self.batches:
+                continue
+            batch = self._take()
+            try:
+                await self._write(batch)
+                backoff = INGEST_RETRY_BACKOFF[0]
+            except asyncio.CancelledError:
+                raise  # the unwritten rest is back in the buffer for the final flush in stop()
+            except Exception as e:
+                # The rest is back at the front and still counted in `buffered`, so producers are throttled meanwhile
+                self.counts["failed_flushes"] += 1
+                logger.error(f"Ingest flush of {len(batch)} readings failed, retrying in {backoff:.1f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, INGEST_RETRY_BACKOFF[1])
+    
+    def stats(self) -> Dict[str, Any]:
+        flush_ms = sorted(self.flush_ms)
+        uptime = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "buffered": self.buffered,
+            "max_buffered": self.max_buffered,
+            "flush_rows": self.flush_rows,
+            "flush_interval_seconds": self.flush_interval,
+            **self.counts,
+            "write_rate_per_second": round(self.write_rate),
+            "avg_written_per_second": round(self.counts["written"] / uptime) if uptime else None,
+            "flush_ms": {
+                "p50": round(flush_ms[len(flush_ms) // 2], 2) if flush_ms else None,
+                "p95": round(flush_ms[int(len(flush_ms) * 0.95)], 2) if flush_ms else None
+            }
+        }
 
-# ==================== MODELS ====================
+ingestor = TelemetryIngestor()
 
-class GridMetrics(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    timestamp: str
-    solar_output: float
-    wind_output: float
-    megapack_charge: float
-    grid_demand: float
-    efficiency_ratio: float
-    zone: str
+# ==================== JOBS ====================
+# Long-running work (scenario sweeps, large exports, reports) runs outside the
+# request: submit returns a job id, JOB_CONCURRENCY workers drain a priority
+# queue, and results stay on disk until JOB_RESULT_TTL after completion.
 
-class KPIData(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    total_renewable_output: float
-    grid_uptime: float
-    efficiency_gain: float
-    co2_savings: float
-    megapack_capacity: float
-    peak_demand_handled: float
-    sparkline_data: List[float]
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", "2"))
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", "100"))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "3600"))
+JOB_RESULTS_DIR = Path(os.environ.get("JOB_RESULTS_DIR", str(ROOT_DIR / "job_results")))
+JOB_SWEEP_INTERVAL = 60.0
+JOB_EVENT_KEEPALIVE = 15.0
+JOB_LATENCY_SAMPLES = 500
+JOB_TERMINAL = ("succeeded", "failed", "cancelled")
 
-class SNNPrediction(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    timestamp: str
-    predicted_demand: List[float]
-    predicted_solar: List[float]
-    predicted_wind: List[float]
-    confidence: float
-    spike_patterns: List[Dict[str, Any]]
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: Dict[str, Any]
+    priority: int
+    spec: Any
+    created_at: float
+    status: str = "queued"
+    progress: float = 0.0
+    message: str = ""
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result_path: Optional[Path] = None
+    media_type: Optional[str] = None
+    task: Optional[asyncio.Task] = None
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+    
+    def update(self, **changes):
+        """Apply changes and wake everyone waiting on the previous state"""
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.changed.set()
+        self.changed = asyncio.Event()
+    
+    def describe(self) -> Dict[str, Any]:
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+        
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "message": self.message,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "queue_wait_ms": round((self.started_at - self.created_at) * 1000, 2) if self.started_at else None,
+            "run_ms": round((self.finished_at - self.started_at) * 1000, 2) if self.finished_at and self.started_at else None,
+            "error": self.error,
+            "result_url": f"/api/jobs/{self.id}/result" if self.status == "succeeded" else None,
+            "expires_at": iso(self.finished_at + JOB_RESULT_TTL) if self.finished_at else None
+        }
 
-class BlockchainTransaction(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    tx_hash: str
-    timestamp: str
-    energy_type: str
-    amount_kwh: float
-    source: str
-    destination: str
-    verified: bool
-    block_number: int
+def prepare_scenario_batch_job(params: Dict[str, Any]) -> ScenarioBatchRequest:
+    try:
+        request = ScenarioBatchRequest(**params)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    batch_scenario_ids(request)
+    return request
 
-class HeatmapData(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    zones: List[str]
-    timestamps: List[str]
-    power_values: List[List[float]]
-    efficiency_values: List[List[float]]
+async def run_scenario_batch_job(job: Job, request: ScenarioBatchRequest, folder: Path) -> Tuple[Path, str]:
+    total = len(batch_scenario_ids(request)) * request.runs
+    done = 0
+    
+    def on_chunk(size: int):
+        nonlocal done
+        done += size
+        job.update(progress=done / total, message=f"{done:,} of {total:,} runs")
+    
+    result = await scenario_batch_result(request, on_chunk)
+    path = folder / "scenario_batch.json"
+    await asyncio.to_thread(path.write_bytes, json_body(result))
+    return path, "application/json"
 
-class QueryRequest(BaseModel):
-    query_type: str
-    date_range: Optional[str] = "24h"
-    zone: Optional[str] = None
-    metric: Optional[str] = None
+def prepare_export_job(params: Dict[str, Any]) -> ExportPlan:
+    unknown = set(params) - {"data_type", "format", "site", "zones", "start", "end", "resolution", "compress"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown export parameters: {', '.join(sorted(unknown))}")
+    try:
+        start = to_utc_datetime(params["start"]) if params.get("start") else None
+        end = to_utc_datetime(params["end"]) if params.get("end") else None
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="start and end must be ISO timestamps")
+    return plan_export(
+        params.get("data_type", "metrics"), params.get("format", "csv"), params.get("zones"),
+        start, end, params.get("resolution", "minute"), bool(params.get("compress", False)), params.get("site")
+    )
 
-class QueryResponse(BaseModel):
-    results: List[Dict[str, Any]]
-    aggregations: Dict[str, Any]
-    query_time_ms: float
+async def run_export_job(job: Job, plan: ExportPlan, folder: Path) -> Tuple[Path, str]:
+    span = (plan.end - plan.start).total_seconds()
+    
+    def on_table(table: Dict[str, Any]):
+        reached = (to_utc_datetime(table["timestamp"][-1]) - plan.start).total_seconds()
+        job.update(progress=min(reached / span, 1.0), message=f"exported through {table['timestamp'][-1]}")
+    
+    path = folder / plan.filename
+    with open(path, "wb") as handle:
+        async for chunk in plan.chunks(on_table):
+            await asyncio.to_thread(handle.write, chunk.encode() if isinstance(chunk, str) else chunk)
+    return path, plan.media_type
 
-# ==================== DATA GENERATION ====================
+async def run_report_job(job: Job, spec: None, folder: Path) -> Tuple[Path, str]:
+    path = folder / "report.json"
+    await asyncio.to_thread(path.write_bytes, json_body(report_snapshot()))
+    return path, "application/json"
 
-def generate_time_series(hours: int = 24, base: float = 100, variance: float = 20) -> List[float]:
-    """Generate realistic time-series data with daily patterns"""
-    data = []
-    for i in range(hours):
-        hour_factor = math.sin((i / 24) * 2 * math.pi - math.pi/2) * 0.3 + 1
-        noise = random.gauss(0, variance)
-        value = base * hour_factor + noise
-        data.append(max(0, round(value, 2)))
-    return data
+def prepare_ledger_verify_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    unknown = set(params) - {"start", "end", "incremental"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown ledger_verify parameters: {', '.join(sorted(unknown))}")
+    start, end = params.get("start", 0), params.get("end")
+    if not isinstance(start, int) or start < 0 or (end is not None and (not isinstance(end, int) or end < 0)):
+        raise HTTPException(status_code=400, detail="start and end must be non-negative block heights")
+    return {"start": start, "end": end, "incremental": bool(params.get("incremental", False))}
 
-def generate_snn_spike_patterns() -> List[Dict[str, Any]]:
-    """Generate simplified SNN-inspired spike patterns for grid prediction"""
-    patterns = []
-    neuron_groups = ["solar_input", "wind_input", "demand_sensor", "storage_control", "grid_balance"]
-    
-    for group in neuron_groups:
-        spike_times = sorted([random.uniform(0, 100) for _ in range(random.randint(5, 15))])
-        patterns.append({
-            "neuron_group": group,
-            "spike_times": spike_times,
-            "firing_rate": len(spike_times) / 100,
-            "membrane_potential": random.uniform(-70, -50)
-        })
-    return patterns
-
-def generate_blockchain_hash() -> str:
-    """Generate mock blockchain transaction hash"""
-    random_data = str(random.random()) + str(datetime.now(timezone.utc).timestamp())
-    return "0x" + hashlib.sha256(random_data.encode()).hexdigest()
-
-def generate_heatmap_data(zones: int = 6, hours: int = 24) -> Dict:
-    """Generate heatmap data for power distribution visualization"""
-    zone_names = [f"Zone_{chr(65+i)}" for i in range(zones)]
-    timestamps = [(datetime.now(timezone.utc) - timedelta(hours=hours-i)).isoformat() for i in range(hours)]
-    
-    power_values = []
-    efficiency_values = []
-    
-    for zone_idx in range(zones):
-        zone_power = []
-        zone_efficiency = []
-        base_power = 50 + zone_idx * 20
-        
-        for hour_idx in range(hours):
-            hour_factor = math.sin((hour_idx / 24) * 2 * math.pi - math.pi/2) * 0.3 + 1
-            power = base_power * hour_factor + random.gauss(0, 10)
-            efficiency = 0.7 + random.gauss(0, 0.1) + (power / 500)
-            
-            zone_power.append(round(max(0, power), 2))
-            zone_efficiency.append(round(min(1, max(0, efficiency)), 3))
+async def run_ledger_verify_job(job: Job, spec: Dict[str, Any], folder: Path) -> Tuple[Path, str]:
+    end = min(spec["end"], energy_ledger.height) if spec["end"] is not None else energy_ledger.height
+    total = max(end - (max(spec["start"], energy_ledger.verified_through) if spec["incremental"] else spec["start"]), 1)
+    done = 0
+    
+    def on_chunk(blocks: int):
+        nonlocal done
+        done += blocks
+        job.update(progress=min(done / total, 1.0), message=f"{done:,} of {total:,} blocks")
+    
+    result = await verify_ledger(energy_ledger, spec["start"], end, spec["incremental"], on_chunk)
+    path = folder / "ledger_verify.json"
+    await asyncio.to_thread(path.write_bytes, json_body(result))
+    return path, "application/json"
+
+# kind -> (validate params at submit time, run)
+JOB_KINDS: Dict[str, Tuple[Callable[[Dict[str, Any]], Any], Callable[[Job, Any, Path], Any]]] = {
+    "scenario_batch": (prepare_scenario_batch_job, run_scenario_batch_job),
+    "export": (prepare_export_job, run_export_job),
+    "report": (lambda params: None, run_report_job),
+    "ledger_verify": (prepare_ledger_verify_job, run_ledger_verify_job)
+}
+
+class JobManager:
+    """Priority queue of jobs drained by a fixed pool of worker tasks, with on-disk results evicted after a TTL"""
+    
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, max_queued: int = JOB_MAX_QUEUED,
+                 ttl: float = JOB_RESULT_TTL, results_dir: Path = JOB_RESULTS_DIR):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.results_dir = results_dir
+        self.jobs: Dict[str, Job] = {}
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.sequence = 0
+        self.queue_waits: deque = deque(maxlen=JOB_LATENCY_SAMPLES)
+        self.run_times: deque = deque(maxlen=JOB_LATENCY_SAMPLES)
+        self.counts = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "evicted": 0}
+    
+    def start(self):
+        # Job metadata lives in memory, so results left by this slot's previous process are unreachable
+        self.results_dir = claim_worker_directory(self.results_dir)
+        for folder in self.results_dir.iterdir():
+            if folder.is_dir():
+                shutil.rmtree(folder, ignore_errors=True)
+        self.queue = asyncio.PriorityQueue()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self.tasks.append(asyncio.create_task(self._sweep()))
+    
+    async def stop(self):
+        running = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in self.tasks + running:
+            task.cancel()
+        await asyncio.gather(*self.tasks, *running, return_exceptions=True)
+        self.tasks = []
+    
+    def queued(self) -> int:
+        return sum(job.status == "queued" for job in self.jobs.values())
+    
+    def submit(self, kind: str, params: Dict[str, Any], priority: int) -> Job:
+        """Validate and enqueue a job (lower priority values run first); 400/404/422 on bad params, 429 when full"""
+        if kind not in JOB_KINDS:
+            raise HTTPException(status_code=400, detail=f"Unknown job kind: {kind} (available: {', '.join(JOB_KINDS)})")
+        if self.queue is None:
+            raise HTTPException(status_code=503, detail="Job workers are not running")
+        spec = JOB_KINDS[kind][0](params)
+        if self.queued() >= self.max_queued:
+            self.counts["rejected"] += 1
+            raise HTTPException(status_code=429, detail="Job queue is full", headers={"Retry-After": "30"})
         
-        power_values.append(zone_power)
-        efficiency_values.append(zone_efficiency)
+        job = Job(id=str(uuid.uuid4()), kind=kind, params=params, priority=priority, spec=spec, created_at=time.time())
+        self.jobs[job.id] = job
+        self.sequence += 1
+        self.queue.put_nowait((priority, self.sequence, job.id))
+        self.counts["submitted"] += 1
+        return job
     
-    return {
-        "zones": zone_names,
-        "timestamps": timestamps,
-        "power_values": power_values,
-        "efficiency_values": efficiency_values
-    }
+    async def cancel(self, job: Job):
+        """Cancel a queued job in place, or interrupt a running one at its next await and wait for it to stop"""
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        elif job.status == "running" and job.task:
+            task = job.task
+            task.cancel()
+            await asyncio.wait([task])
+    
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue  # cancelled while queued
+            job.update(status="running", started_at=time.time())
+            self.queue_waits.append((job.started_at - job.created_at) * 1000)
+            task = job.task = asyncio.create_task(self._run(job))
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+    
+    async def _run(self, job: Job):
+        folder = self.results_dir / job.id
+        folder.mkdir(parents=True, exist_ok=True)
+        try:
+            path, media_type = await JOB_KINDS[job.kind][1](job, job.spec, folder)
+        except asyncio.CancelledError:
+            shutil.rmtree(folder, ignore_errors=True)
+            self._finish(job, "cancelled")
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            shutil.rmtree(folder, ignore_errors=True)
+            self._finish(job, "failed", error=str(e))
+        else:
+            self._finish(job, "succeeded", progress=1.0, result_path=path, media_type=media_type)
+    
+    def _finish(self, job: Job, status: str, **changes):
+        job.update(status=status, finished_at=time.time(), task=None, **changes)
+        self.counts[status] += 1
+        if job.started_at:
+            self.run_times.append((job.finished_at - job.started_at) * 1000)
+    
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(JOB_SWEEP_INTERVAL)
+            self.evict_expired()
+    
+    def evict_expired(self, now: Optional[float] = None):
+        """Drop finished jobs (and their result files) older than the TTL"""
+        now = now or time.time()
+        for job in [job for job in self.jobs.values() if job.finished_at and job.finished_at + self.ttl < now]:
+            shutil.rmtree(self.results_dir / job.id, ignore_errors=True)
+            del self.jobs[job.id]
+            self.counts["evicted"] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        def percentiles(samples: deque) -> Dict[str, Optional[float]]:
+            if not samples:
+                return {"p50": None, "p95": None}
+            p50, p95 = np.percentile(list(samples), [50, 95])
+            return {"p50": round(float(p50), 2), "p95": round(float(p95), 2)}
+        
+        return {
+            "queue_depth": self.queued(),
+            "running": sum(job.status == "running" for job in self.jobs.values()),
+            "concurrency": self.concurrency,
+            "max_queued": self.max_queued,
+            "retained": len(self.jobs),
+            **self.counts,
+            "queue_wait_ms": percentiles(self.queue_waits),
+            "run_ms": percentiles(self.run_times)
+        }
+
+job_manager = JobManager()
+
+async def job_events(job: Job) -> AsyncIterator[str]:
+    """Server-sent events: the job's state on every change until it finishes, with keepalive comments"""
+    while True:
+        changed = job.changed
+        yield f"event: {job.status}\ndata: {json.dumps(job.describe())}\n\n"
+        if job.status in JOB_TERMINAL:
+            return
+        try:
+            await asyncio.wait_for(changed.wait(), JOB_EVENT_KEEPALIVE)
+        except asyncio.TimeoutError:
+            yield ": keepalive\n\n"
 
 # ==================== API ENDPOINTS ====================
 
@@ -172,254 +4597,431 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
+# Site Registry Endpoints
+@api_router.get("/sites")
+async def list_sites():
+    """Registered sites with their zone counts and grid configuration"""
+    return [site.describe() for site in zone_registry.sites.values()]
+
+@api_router.get("/sites/{site_id}/zones")
+async def list_site_zones(
+    site_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=ZONE_PAGE_MAX, ge=1, le=ZONE_PAGE_MAX)
+):
+    """One page of a site's zone names"""
+    site = zone_registry.sites.get(site_id)
+    if site is None:
+        raise HTTPException(status_code=404, detail=f"Unknown site: {site_id}")
+    return {**site.describe(), "offset": offset, "zones": site.zones[offset:offset + limit]}
+
 # Grid Metrics Endpoints
 @api_router.get("/grid/metrics", response_model=List[GridMetrics])
-async def get_grid_metrics(hours: int = Query(default=24, le=168)):
-    """Get grid metrics for the specified time range"""
-    metrics = []
-    zones = ["Zone_A", "Zone_B", "Zone_C", "Zone_D", "Zone_E", "Zone_F"]
+async def get_grid_metrics(
+    request: Request,
+    hours: int = Query(default=24, ge=1, le=720),
+    output: Optional[str] = Query(default=None, alias="format", description="json, arrow or parquet (default: Accept header, else json)"),
+    max_points: Optional[int] = Query(default=None, ge=10, le=DOWNSAMPLE_MAX_POINTS, description="Points per zone; reads finer rollups and downsamples"),
+    downsample: str = Query(default="minmax", description="minmax (keeps every peak) or lttb"),
+    site: Optional[str] = Query(default=None, description="Site id (default: first registered site)"),
+    zones: Optional[str] = Query(default=None, description="Comma-separated zones instead of the site's"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=ZONE_PAGE_SIZE, ge=1, le=ZONE_PAGE_MAX, description="Zones per page")
+):
+    """Get grid metrics for the specified time range; one page of zones, total in X-Total-Zones"""
+    output = negotiate_format(request, output, ("json", "arrow", "parquet"))
+    method = check_downsample_method(downsample)
+    selected_site, positions, total = select_zones(site, zones, offset, limit)
+    names = zone_registry.names[positions].tolist()
+    headers = {"X-Total-Zones": str(total)}
+    key = f"grid_metrics:{hours}:{zone_scope(selected_site, positions, total)}"
+    if max_points is not None:
+        key += f":{max_points}:{method}"
+    if output == "json":
+        return await cached_response(request, key, "grid_metrics", lambda: grid_metrics_snapshot(hours, names, max_points, method),
+                                     headers=headers)
     
-    for i in range(hours):
-        timestamp = (datetime.now(timezone.utc) - timedelta(hours=hours-i)).isoformat()
-        for zone in zones:
-            hour_factor = math.sin((i / 24) * 2 * math.pi - math.pi/2) * 0.3 + 1
-            
-            metrics.append(GridMetrics(
-                timestamp=timestamp,
-                solar_output=round(80 * hour_factor + random.gauss(0, 10), 2),
-                wind_output=round(60 + random.gauss(0, 15), 2),
-                megapack_charge=round(random.uniform(40, 95), 2),
-                grid_demand=round(120 * hour_factor + random.gauss(0, 20), 2),
-                efficiency_ratio=round(0.75 + random.gauss(0, 0.05), 3),
-                zone=zone
-            ))
-    
-    return metrics
+    async def batch():
+        return metrics_record_batch(await grid_metrics_table(hours, names, max_points, method))
+    return await cached_response(
+        request, f"{key}:{output}", "grid_metrics", batch,
+        COLUMNAR_ENCODERS[output], RESPONSE_FORMATS[output], headers
+    )
 
-@api_router.get("/grid/realtime")
-async def get_realtime_metrics():
-    """Get current real-time grid status"""
-    zones = ["Zone_A", "Zone_B", "Zone_C", "Zone_D", "Zone_E", "Zone_F"]
+@api_router.post("/grid/metrics")
+async def ingest_grid_metrics(readings: List[GridMetrics]):
+    """Store grid metric readings in the time-series collection"""
+    inserted = await metrics_store.insert_many([reading.model_dump() for reading in readings])
+    return {"inserted": inserted}
+
+async def read_ingest_body(request: Request) -> bytes:
+    """The request body, gunzipped if gzip-encoded; 413 once either form exceeds INGEST_MAX_BODY_BYTES"""
+    too_large = HTTPException(status_code=413, detail=f"Bodies are limited to {INGEST_MAX_BODY_BYTES} bytes")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > INGEST_MAX_BODY_BYTES:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > INGEST_MAX_BODY_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    body = b"".join(chunks)
+    if request.headers.get("content-encoding", "").lower() != "gzip":
+        return body
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        body = decompressor.decompress(body, INGEST_MAX_BODY_BYTES + 1)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Body is not valid gzip")
+    if len(body) > INGEST_MAX_BODY_BYTES:
+        raise too_large
+    if not decompressor.eof:
+        raise HTTPException(status_code=400, detail="Body is not valid gzip")
+    return body
+
+@api_router.post("/ingest/metrics", status_code=202)
+async def ingest_metrics_bulk(request: Request):
+    """Bulk-ingest GridMetrics readings sent as NDJSON or an Arrow IPC stream (optionally gzip-encoded).
     
-    return {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "total_generation": round(random.uniform(400, 600), 2),
-        "total_demand": round(random.uniform(350, 550), 2),
-        "grid_frequency": round(60 + random.gauss(0, 0.02), 3),
-        "zones": {
-            zone: {
-                "power_output": round(random.uniform(50, 150), 2),
-                "demand": round(random.uniform(40, 140), 2),
-                "efficiency": round(random.uniform(0.7, 0.95), 3),
-                "status": random.choice(["optimal", "nominal", "high_demand"])
-            }
-            for zone in zones
-        }
-    }
+    Valid rows are buffered for the background writer and invalid ones reported
+    by row; 429 with Retry-After while the buffer is full.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in (NDJSON_MEDIA_TYPE, ARROW_MEDIA_TYPE):
+        raise HTTPException(status_code=415, detail=f"Send {NDJSON_MEDIA_TYPE} or {ARROW_MEDIA_TYPE}")
+    if content_type == ARROW_MEDIA_TYPE and pa is None:
+        raise HTTPException(status_code=501, detail="Arrow ingestion requires pyarrow")
+    if ingestor.task is None:
+        raise HTTPException(status_code=503, detail="Ingest writer is not running")
+    if ingestor.buffered >= ingestor.max_buffered:  # refuse before paying for the body
+        ingestor.counts["throttled_requests"] += 1
+        raise HTTPException(status_code=429, detail="Ingest buffer is full", headers={"Retry-After": str(ingestor.retry_after())})
+    
+    body = await read_ingest_body(request)
+    batch, rejected, errors = await asyncio.to_thread(parse_ingest_body, content_type, body)
+    ingestor.counts["rejected"] += rejected
+    if not len(batch) and rejected:
+        raise HTTPException(status_code=422, detail={"accepted": 0, "rejected": rejected, "errors": errors})
+    if not ingestor.offer(batch):
+        raise HTTPException(status_code=429, detail="Ingest buffer is full", headers={"Retry-After": str(ingestor.retry_after())})
+    return {"accepted": len(batch), "rejected": rejected, "errors": errors, "buffered": ingestor.buffered}
+
+@api_router.get("/ingest/stats")
+async def get_ingest_stats():
+    """Ingest buffer depth, accepted/rejected/written counts, throttling and flush latency"""
+    return ingestor.stats()
+
+@api_router.get("/grid/realtime")
+async def get_realtime_metrics(
+    request: Request,
+    site: Optional[str] = Query(default=None, description="Site id (default: first registered site)"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=ZONE_PAGE_SIZE, ge=1, le=ZONE_PAGE_MAX, description="Zones per page")
+):
+    """Get current real-time grid status of a site; totals cover the site, `zones` one page of it"""
+    selected_site, positions, total = select_zones(site, None, offset, limit)
+    return await cached_response(
+        request, f"grid_realtime:{zone_scope(selected_site, positions, total)}", "grid_realtime",
+        lambda: realtime_grid_snapshot(selected_site, positions), headers={"X-Total-Zones": str(total)}
+    )
 
 # KPI Endpoints
 @api_router.get("/kpi/summary", response_model=KPIData)
-async def get_kpi_summary():
+async def get_kpi_summary(request: Request):
     """Get summary KPIs for the dashboard"""
-    return KPIData(
-        total_renewable_output=round(random.uniform(450, 550), 2),
-        grid_uptime=round(99.5 + random.uniform(0, 0.5), 2),
-        efficiency_gain=round(25 + random.uniform(0, 10), 2),
-        co2_savings=round(1200 + random.uniform(0, 300), 2),
-        megapack_capacity=round(random.uniform(70, 95), 2),
-        peak_demand_handled=round(random.uniform(85, 98), 2),
-        sparkline_data=generate_time_series(24, 100, 15)
-    )
+    return await cached_response(request, "kpi_summary", "kpi_summary", kpi_summary_snapshot)
 
 @api_router.get("/kpi/aggregations")
 async def get_kpi_aggregations(
-    date_range: str = Query(default="24h", description="Time range: 1h, 24h, 7d, 30d")
+    date_range: str = Query(default="24h", description="Time range: 1h, 24h, 7d, 30d"),
+    max_points: Optional[int] = Query(default=None, ge=10, le=DOWNSAMPLE_MAX_POINTS, description="Series points; reads finer rollups and downsamples"),
+    downsample: str = Query(default="minmax", description="minmax (keeps every peak) or lttb")
 ):
     """Get aggregated KPIs using MongoDB-style aggregations"""
-    # Simulate SQL-like aggregations with MongoDB pipelines
-    hours = {"1h": 1, "24h": 24, "7d": 168, "30d": 720}.get(date_range, 24)
+    method = check_downsample_method(downsample)
+    hours = DATE_RANGE_HOURS.get(date_range, 24)
     
+    now = datetime.now(timezone.utc)
+    if max_points is None:
+        tier = pick_rollup_tier(hours * 3600)
+    else:
+        tier = pick_frame_tier(hours * 3600, len(zone_registry.zones), max_points * DOWNSAMPLE_OVERSAMPLE)
+    frame = await rollup_store.frame(now - timedelta(hours=hours), now, zone_registry.zones, tier)
+    if frame is None:
+        frame = synthetic_frame(hours, tier, zone_registry.zones)
+    series = frame_series(frame)
+    if max_points is not None:
+        series = downsample_series(series, max_points, method)
     return {
         "date_range": date_range,
-        "aggregations": {
-            "avg_efficiency": round(0.82 + random.gauss(0, 0.03), 3),
-            "max_demand": round(550 + random.uniform(0, 100), 2),
-            "min_demand": round(200 + random.uniform(0, 50), 2),
-            "total_renewable_kwh": round(hours * 450 + random.uniform(0, 1000), 2),
-            "peak_solar_output": round(120 + random.uniform(0, 30), 2),
-            "peak_wind_output": round(90 + random.uniform(0, 25), 2),
-            "uptime_percentage": round(99.5 + random.uniform(0, 0.5), 2)
-        },
-        "time_series": {
-            "demand": generate_time_series(min(hours, 48), 400, 50),
-            "generation": generate_time_series(min(hours, 48), 450, 40),
-            "efficiency": [round(0.75 + random.gauss(0, 0.05), 3) for _ in range(min(hours, 48))]
-        }
+        "resolution": tier,
+        "aggregations": frame_aggregations(frame, hours),
+        "time_series": series
     }
 
 # SNN Prediction Endpoints
 @api_router.get("/snn/predictions", response_model=SNNPrediction)
 async def get_snn_predictions():
-    """Get SNN-based grid predictions for the next 24 hours"""
-    return SNNPrediction(
-        timestamp=datetime.now(timezone.utc).isoformat(),
-        predicted_demand=generate_time_series(24, 420, 30),
-        predicted_solar=generate_time_series(24, 80, 20),
-        predicted_wind=generate_time_series(24, 60, 25),
-        confidence=round(0.85 + random.uniform(0, 0.1), 3),
-        spike_patterns=generate_snn_spike_patterns()
-    )
+    """Get the latest precomputed SNN grid forecast for the next 24 hours"""
+    record = await snn_scheduler.current()
+    if record is None:
+        raise HTTPException(status_code=503, detail="SNN forecast not ready", headers={"Retry-After": "5"})
+    age = snn_scheduler.age_seconds()
+    return record.prediction.model_copy(update={
+        "age_seconds": round(age, 3),
+        "stale": age > 2 * snn_scheduler.interval
+    })
+
+@api_router.get("/snn/scheduler/stats")
+async def get_snn_scheduler_stats():
+    """Forecast scheduler runs, inference wall time and queue lag"""
+    return snn_scheduler.stats()
 
 @api_router.get("/snn/neuron-activity")
-async def get_neuron_activity():
+async def get_neuron_activity(request: Request):
     """Get detailed SNN neuron group activity"""
-    neuron_groups = {
-        "solar_input": {"neurons": 100, "active": random.randint(20, 50)},
-        "wind_input": {"neurons": 100, "active": random.randint(30, 60)},
-        "demand_sensor": {"neurons": 150, "active": random.randint(40, 80)},
-        "storage_control": {"neurons": 80, "active": random.randint(15, 40)},
-        "grid_balance": {"neurons": 200, "active": random.randint(60, 120)}
+    return await cached_response(request, "neuron_activity", "neuron_activity", neuron_activity_snapshot)
+
+# Blockchain Tracking Endpoints
+@api_router.get("/blockchain/transactions", response_model=List[BlockchainTransaction])
+async def get_blockchain_transactions(
+    limit: int = Query(default=20, ge=1, le=1000),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor header of the previous page"),
+    energy_type: Optional[str] = None,
+    source: Optional[str] = None,
+    destination: Optional[str] = None,
+    verified: Optional[bool] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    """Page through ledger transactions newest first; the next page's cursor is in the X-Next-Cursor header"""
+    filters = {
+        column: ledger_code(column, value)
+        for column, value in (("energy_type", energy_type), ("source", source), ("destination", destination))
+        if value is not None
     }
-    
+    try:
+        before = energy_ledger.cursor_sequence(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    rows, next_cursor = await asyncio.to_thread(
+        energy_ledger.query, limit, before, filters, verified,
+        int(to_utc_datetime(start).timestamp() * 1000) if start else None,
+        int(to_utc_datetime(end).timestamp() * 1000) if end else None
+    )
+    response_class = FastJSONResponse if FAST_RESPONSES else JSONResponse
+    return response_class(rows, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+@api_router.post("/blockchain/transactions")
+async def append_blockchain_transactions(transfers: List[LedgerTransfer]):
+    """Append energy transfers to the ledger; full blocks are sealed immediately"""
+    if not 1 <= len(transfers) <= 10_000:
+        raise HTTPException(status_code=400, detail="Submit between 1 and 10000 transfers")
+    records = ledger_records(transfers, energy_ledger.last_timestamp_ms)
+    try:
+        first = await asyncio.to_thread(energy_ledger.append, records)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e}; the latest ledger entry is at {energy_ledger.last_timestamp_ms} ms")
     return {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "neuron_groups": neuron_groups,
-        "total_spikes": sum(g["active"] for g in neuron_groups.values()),
-        "network_state": "active",
-        "learning_rate": round(0.01 + random.gauss(0, 0.002), 4)
+        "first_sequence": first,
+        "count": len(records),
+        "sealed_through": energy_ledger.sealed,
+        "pending_transactions": energy_ledger.tx_count - energy_ledger.sealed
     }
 
-# Blockchain Tracking Endpoints
-@api_router.get("/blockchain/transactions", response_model=List[BlockchainTransaction])
-async def get_blockchain_transactions(limit: int = Query(default=20, le=100)):
-    """Get recent blockchain transactions for renewable energy tracking"""
-    transactions = []
-    energy_types = ["solar", "wind", "hydro", "geothermal"]
-    sources = ["GigaFactory_1", "GigaFactory_2", "Solar_Farm_A", "Wind_Farm_B", "Hydro_Plant_C"]
-    destinations = ["Grid_Main", "Megapack_Bank_1", "Megapack_Bank_2", "Industrial_Zone", "Residential_Zone"]
-    
-    for i in range(limit):
-        transactions.append(BlockchainTransaction(
-            tx_hash=generate_blockchain_hash(),
-            timestamp=(datetime.now(timezone.utc) - timedelta(minutes=i*5)).isoformat(),
-            energy_type=random.choice(energy_types),
-            amount_kwh=round(random.uniform(50, 500), 2),
-            source=random.choice(sources),
-            destination=random.choice(destinations),
-            verified=random.random() > 0.05,
-            block_number=15000000 + random.randint(0, 100000)
-        ))
-    
-    return transactions
+@api_router.get("/blockchain/transactions/{sequence}/proof")
+async def get_blockchain_proof(sequence: int):
+    """Merkle inclusion proof of a transaction against its block header"""
+    if not 0 <= sequence < energy_ledger.tx_count:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    proof = await asyncio.to_thread(energy_ledger.proof, sequence)
+    if proof is None:
+        raise HTTPException(status_code=409, detail="Transaction is pending; no block seals it yet")
+    return proof
+
+@api_router.get("/blockchain/blocks/{height}")
+async def get_blockchain_block(height: int):
+    """Header of a sealed block"""
+    if not 0 <= height < energy_ledger.height:
+        raise HTTPException(status_code=404, detail="Block not found")
+    return ledger_block_dict(await asyncio.to_thread(energy_ledger.block, height))
+
+@api_router.get("/blockchain/verify")
+async def verify_blockchain(end: Optional[int] = Query(default=None, ge=0)):
+    """Recompute Merkle roots and hash links of the blocks sealed since the verified checkpoint, up to `end`.
+    
+    Read-only: the checkpoint only moves through `ledger_verify` jobs (and the
+    startup audit), which are also the way to re-verify the whole chain.
+    """
+    return await verify_ledger(energy_ledger, end=end, incremental=True, checkpoint=False)
 
 @api_router.get("/blockchain/summary")
-async def get_blockchain_summary():
+async def get_blockchain_summary(request: Request):
     """Get blockchain tracking summary"""
-    return {
-        "total_tracked_kwh": round(random.uniform(50000, 100000), 2),
-        "verified_transactions": random.randint(900, 1000),
-        "pending_transactions": random.randint(0, 10),
-        "renewable_percentage": round(random.uniform(85, 98), 2),
-        "by_source": {
-            "solar": round(random.uniform(30, 40), 1),
-            "wind": round(random.uniform(25, 35), 1),
-            "hydro": round(random.uniform(15, 25), 1),
-            "geothermal": round(random.uniform(5, 15), 1)
-        },
-        "last_block": 15000000 + random.randint(0, 100000),
-        "network_hash_rate": f"{round(random.uniform(100, 200), 2)} TH/s"
-    }
+    return await cached_response(request, "blockchain_summary", "blockchain_summary", blockchain_summary_snapshot)
 
 # Heatmap Endpoints
 @api_router.get("/heatmap/data", response_model=HeatmapData)
-async def get_heatmap_data(hours: int = Query(default=24, le=168)):
-    """Get heatmap data for power zone visualization"""
-    data = generate_heatmap_data(6, hours)
-    return HeatmapData(**data)
+async def get_heatmap_data(
+    request: Request,
+    hours: int = Query(default=24, ge=1, le=168),
+    output: Optional[str] = Query(default=None, alias="format", description="json, arrow, parquet or f32 (default: Accept header, else json)"),
+    since: Optional[datetime] = Query(default=None, description="Last column timestamp the client holds; only columns from it onward are returned"),
+    site: Optional[str] = Query(default=None, description="Site id (default: first registered site)"),
+    zones: Optional[str] = Query(default=None, description="Comma-separated zones instead of the site's"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=ZONE_PAGE_SIZE, ge=1, le=ZONE_PAGE_MAX, description="Zones (rows) per page")
+):
+    """Get heatmap data for power zone visualization; one page of zones, total in X-Total-Zones"""
+    output = negotiate_format(request, output, ("json", "arrow", "parquet", "f32"))
+    if since is not None:
+        since = to_utc_datetime(since)
+    selected_site, positions, total = select_zones(site, zones, offset, limit)
+    names = zone_registry.names[positions].tolist()
+    headers = {"X-Total-Zones": str(total)}
+    key = f"heatmap_data:{hours}:{since.isoformat() if since else 'full'}:{zone_scope(selected_site, positions, total)}"
+    if output == "json":
+        return await cached_response(request, key, "heatmap_data", lambda: heatmap_data_snapshot(hours, since, names), headers=headers)
+    if output == "f32":
+        return await cached_response(
+            request, f"{key}:f32", "heatmap_data", lambda: heatmap_matrices(hours, since, names),
+            encode_heatmap_f32, RESPONSE_FORMATS["f32"], headers
+        )
+    
+    async def batch():
+        return heatmap_record_batch(await heatmap_matrices(hours, since, names))
+    return await cached_response(
+        request, f"{key}:{output}", "heatmap_data", batch,
+        COLUMNAR_ENCODERS[output], RESPONSE_FORMATS[output], headers
+    )
 
 @api_router.get("/heatmap/realtime")
-async def get_realtime_heatmap():
-    """Get real-time heatmap data for morphing visualization"""
-    zones = ["Zone_A", "Zone_B", "Zone_C", "Zone_D", "Zone_E", "Zone_F"]
+async def get_realtime_heatmap(
+    request: Request,
+    site: Optional[str] = Query(default=None, description="Site id (default: first registered site)"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=ZONE_PAGE_SIZE, ge=1, le=ZONE_PAGE_MAX, description="Zones per page")
+):
+    """Get real-time heatmap data for morphing visualization, one page of a site's zones"""
+    selected_site, positions, total = select_zones(site, None, offset, limit)
+    return await cached_response(
+        request, f"heatmap_realtime:{zone_scope(selected_site, positions, total)}", "heatmap_realtime",
+        lambda: realtime_heatmap_snapshot(selected_site, positions), headers={"X-Total-Zones": str(total)}
+    )
+
+# Realtime Streaming Endpoints
+@api_router.websocket("/stream")
+async def realtime_stream(websocket: WebSocket, topics: str = ""):
+    """Multiplexed push channel for grid, heatmap, neurons and blockchain snapshots.
     
-    return {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "zones": {
-            zone: {
-                "power_level": round(random.uniform(30, 100), 2),
-                "efficiency": round(random.uniform(0.7, 0.95), 3),
-                "status": random.choice(["optimal", "nominal", "high_load", "low_load"]),
-                "color_intensity": round(random.uniform(0.3, 1.0), 2)
-            }
-            for zone in zones
-        }
-    }
+    grid and heatmap follow the default site; grid:<site> and heatmap:<site>
+    stream another site's first page of zones.
+    Subscribe with ?topics=grid,heatmap or by sending
+    {"action": "subscribe" | "unsubscribe", "topics": [...]}.
+    Each message is {"topic": ..., "data": <same body as the REST endpoint>}.
+    """
+    await websocket.accept()
+    subscriber = StreamSubscriber(websocket)
+    sender = asyncio.create_task(subscriber.drain())
+    
+    def apply(action: str, requested: List[str]):
+        for topic in requested:
+            if topic not in realtime_hub.topics:
+                continue
+            if action == "subscribe":
+                realtime_hub.subscribe(subscriber, topic)
+            elif action == "unsubscribe":
+                realtime_hub.unsubscribe(subscriber, topic)
+    
+    apply("subscribe", [topic for topic in topics.split(",") if topic])
+    try:
+        while True:
+            try:
+                command = json.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            if isinstance(command, dict):
+                apply(command.get("action", ""), command.get("topics", []))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        realtime_hub.disconnect(subscriber)
+        sender.cancel()
+
+@api_router.get("/stream/stats")
+async def get_stream_stats():
+    """Subscriber counts and producer state per realtime topic"""
+    return realtime_hub.stats()
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Snapshot cache hit/miss counters"""
+    return snapshot_cache.stats()
 
 # Query Interface Endpoints
 @api_router.post("/query/execute", response_model=QueryResponse)
 async def execute_query(request: QueryRequest):
     """Execute ad-hoc queries with MongoDB aggregation pipelines"""
-    import time
     start_time = time.time()
     
-    # Simulate different query types
-    results = []
-    aggregations = {}
-    
-    hours = {"1h": 1, "24h": 24, "7d": 168, "30d": 720}.get(request.date_range, 24)
+    if request.metric is not None and request.metric not in GRID_METRIC_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {request.metric}")
     
-    if request.query_type == "efficiency":
-        results = [
-            {"zone": f"Zone_{chr(65+i)}", "avg_efficiency": round(0.75 + random.gauss(0, 0.05), 3)}
-            for i in range(6)
-        ]
-        aggregations = {"overall_avg": round(0.82, 3), "best_zone": "Zone_C", "worst_zone": "Zone_F"}
-    
-    elif request.query_type == "demand":
-        results = [
-            {"hour": i, "demand_mw": round(400 + random.gauss(0, 50), 2)}
-            for i in range(min(hours, 48))
-        ]
-        aggregations = {"peak_demand": round(550, 2), "min_demand": round(250, 2), "avg_demand": round(400, 2)}
-    
-    elif request.query_type == "renewable":
-        results = [
-            {"source": src, "output_kwh": round(random.uniform(1000, 5000), 2)}
-            for src in ["solar", "wind", "hydro", "geothermal"]
-        ]
-        aggregations = {"total_renewable": round(sum(r["output_kwh"] for r in results), 2), "renewable_ratio": round(0.87, 2)}
-    
-    elif request.query_type == "zone":
-        zone = request.zone or "Zone_A"
-        results = [
-            {"timestamp": (datetime.now(timezone.utc) - timedelta(hours=i)).isoformat(), 
-             "power": round(100 + random.gauss(0, 20), 2)}
-            for i in range(min(hours, 48))
-        ]
-        aggregations = {"zone": zone, "avg_power": round(100, 2), "peak_power": round(140, 2)}
+    hours = DATE_RANGE_HOURS.get(request.date_range, 24)
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(hours=hours)
     
-    else:
+    execution_stats = None
+    pipeline = compile_query_pipeline(request, start, end, hours)
+    if pipeline is None:
         results = [{"message": "Unknown query type"}]
         aggregations = {}
+    else:
+        rows, execution_stats = await metrics_store.aggregate(pipeline, explain=request.explain)
+        if rows:
+            results, aggregations = shape_query_results(request, rows, start, hours)
+            execution_stats["source"] = GRID_METRICS_COLLECTION
+        else:
+            results, aggregations = simulate_query_results(request, hours)
+            execution_stats["source"] = "simulated"
     
     query_time = (time.time() - start_time) * 1000
     
     return QueryResponse(
         results=results,
         aggregations=aggregations,
-        query_time_ms=round(query_time, 2)
+        query_time_ms=round(query_time, 2),
+        execution_stats=execution_stats
     )
 
 # Export Endpoints
 @api_router.get("/export/csv")
-async def export_csv(data_type: str = Query(default="metrics")):
+async def export_csv(
+    data_type: str = Query(default="metrics"),
+    output: str = Query(default="json", alias="format", description="json (legacy preview), or streamed csv, arrow or parquet"),
+    site: Optional[str] = Query(default=None, description="Export every zone of this site"),
+    zones: Optional[str] = Query(default=None, description="Comma-separated zones, default all (of `site`)"),
+    start: Optional[datetime] = Query(default=None, description="ISO start, default 24h before end"),
+    end: Optional[datetime] = Query(default=None, description="ISO end, default now"),
+    resolution: str = Query(default="minute", description="minute, hour or day"),
+    compress: bool = Query(default=False, description="Gzip a csv or arrow stream")
+):
     """Generate CSV export data"""
+    if output in EXPORT_EXTENSIONS:
+        plan = plan_export(data_type, output, zones, start, end, resolution, compress, site)
+        return StreamingResponse(
+            plan.chunks(),
+            media_type=plan.media_type,
+            headers={"Content-Disposition": f'attachment; filename="{plan.filename}"', "X-Export-Resolution": plan.tier}
+        )
+    
     if data_type == "metrics":
         headers = ["timestamp", "zone", "solar_output", "wind_output", "demand", "efficiency"]
         rows = []
         for i in range(24):
             ts = (datetime.now(timezone.utc) - timedelta(hours=i)).isoformat()
-            for zone in ["Zone_A", "Zone_B", "Zone_C"]:
+            for zone in zone_registry.default_site.zones[:3]:
                 rows.append({
                     "timestamp": ts,
                     "zone": zone,
@@ -432,9 +5034,8 @@ async def export_csv(data_type: str = Query(default="metrics")):
     
     return {"error": "Unknown data type"}
 
-@api_router.get("/export/report")
-async def generate_report():
-    """Generate summary report data"""
+def report_snapshot() -> Dict[str, Any]:
+    """Summary report of the last 24 hours"""
     return {
         "report_title": "Energy-Morph Grid Performance Report",
         "generated_at": datetime.now(timezone.utc).isoformat(),
@@ -458,51 +5059,145 @@ async def generate_report():
         ]
     }
 
+@api_router.get("/export/report")
+async def generate_report():
+    """Generate summary report data"""
+    return report_snapshot()
+
 # Scenario Endpoints
 @api_router.get("/scenarios/list")
 async def get_scenarios():
     """Get available simulation scenarios"""
     return {
         "scenarios": [
-            {"id": "peak_ai", "name": "Peak AI Training Load", "description": "Simulate high GPU cluster demand"},
-            {"id": "solar_peak", "name": "Solar Peak Production", "description": "Midday solar maximum scenario"},
-            {"id": "grid_outage", "name": "Grid Outage Recovery", "description": "Test Megapack backup response"},
-            {"id": "demand_surge", "name": "Demand Surge", "description": "Sudden 40% demand increase"},
-            {"id": "wind_drop", "name": "Wind Power Drop", "description": "Wind turbine output reduction"}
+            {"id": scenario_id, "name": scenario["name"], "description": scenario["description"]}
+            for scenario_id, scenario in SCENARIOS.items()
         ]
     }
 
 @api_router.post("/scenarios/simulate")
-async def simulate_scenario(scenario_id: str = Query(...)):
-    """Run a scenario simulation"""
-    scenarios = {
-        "peak_ai": {"demand_increase": 35, "megapack_discharge": 60, "efficiency_impact": -5},
-        "solar_peak": {"solar_boost": 40, "storage_charge": 25, "efficiency_impact": 10},
-        "grid_outage": {"megapack_discharge": 90, "islanding_mode": True, "recovery_time_sec": 0.2},
-        "demand_surge": {"demand_increase": 40, "price_spike": 25, "load_shedding": False},
-        "wind_drop": {"wind_reduction": 50, "solar_compensation": 15, "storage_support": 30}
-    }
-    
-    if scenario_id not in scenarios:
+async def simulate_scenario(
+    scenario_id: str = Query(...),
+    runs: int = Query(default=SIM_SINGLE_RUNS, ge=1, le=SIM_MAX_RUNS),
+    seed: Optional[int] = Query(default=None, ge=0)
+):
+    """Run a Monte Carlo scenario simulation on the minute-stepped grid model"""
+    if scenario_id not in SCENARIOS:
         raise HTTPException(status_code=404, detail="Scenario not found")
     
-    scenario = scenarios[scenario_id]
-    
+    result = await scenario_outcomes(scenario_id, runs, seed, SIM_STEPS_PER_HOUR)
+    distributions = result["distributions"]
     return {
-        "scenario_id": scenario_id,
+        **result,
         "simulation_result": "success",
-        "parameters": scenario,
         "impact": {
-            "grid_stability": round(random.uniform(0.9, 1.0), 3),
-            "cost_impact_usd": round(random.uniform(-1000, 5000), 2),
-            "renewable_utilization": round(random.uniform(0.7, 0.95), 2)
+            "grid_stability": distributions["grid_stability"]["p50"],
+            "cost_impact_usd": distributions["cost_impact_usd"]["p50"],
+            "renewable_utilization": distributions["renewable_utilization"]["p50"],
+            "unserved_energy_mwh": distributions["unserved_energy_mwh"]["p50"],
+            "min_soc": distributions["min_soc"]["p50"]
         },
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
+@api_router.post("/scenarios/batch")
+async def simulate_scenario_batch(request: ScenarioBatchRequest):
+    """Monte Carlo sweep of one or more scenarios, with p5/p50/p95 outcome distributions"""
+    return await scenario_batch_result(request)
+
+# Job Endpoints
+@api_router.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """Queue a scenario sweep, export or report; poll, stream or cancel it by id"""
+    return job_manager.submit(request.kind, request.params, request.priority).describe()
+
+@api_router.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = Query(default=50, ge=1, le=500)):
+    """Most recent jobs first, optionally filtered by status"""
+    jobs = [job for job in reversed(job_manager.jobs.values()) if status is None or job.status == status]
+    return {"jobs": [job.describe() for job in jobs[:limit]]}
+
+@api_router.get("/jobs/stats")
+async def get_job_stats():
+    """Queue depth, running jobs, outcome counts and queue-wait / run-time percentiles"""
+    return job_manager.stats()
+
+def find_job(job_id: str) -> Job:
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status and progress"""
+    return find_job(job_id).describe()
+
+@api_router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Stream job progress as server-sent events until it finishes"""
+    job = find_job(job_id)
+    return StreamingResponse(job_events(job), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@api_router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Download a finished job's result"""
+    job = find_job(job_id)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return FileResponse(job.result_path, media_type=job.media_type, filename=job.result_path.name)
+
+@api_router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = find_job(job_id)
+    if job.status in JOB_TERMINAL:
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+    await job_manager.cancel(job)
+    return job.describe()
+
+# Profiling Endpoints
+@api_router.get("/admin/profiles")
+async def list_profiles():
+    """Captured request profiles, newest first, without their stacks"""
+    return [profile.describe() for profile in reversed(request_profiles)]
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """One request profile with its CPU and allocation folded stacks"""
+    return find_profile(profile_id).describe(folded=True)
+
+@api_router.get("/admin/profiles/{profile_id}/folded")
+async def get_profile_folded(profile_id: str, kind: str = "cpu"):
+    """Folded stacks ("frame;frame;frame weight" per line) for flamegraph.pl, speedscope or inferno"""
+    if kind not in ("cpu", "memory"):
+        raise HTTPException(status_code=400, detail=f"Unknown profile kind: {kind} (expected cpu or memory)")
+    profile = find_profile(profile_id)
+    source = profile.cpu if kind == "cpu" else profile.memory
+    if source is None:
+        raise HTTPException(status_code=404, detail="Profile has no allocation trace (only profile=1 requests are traced)")
+    body = "".join(f"{stack} {weight}\n" for stack, weight in sorted(source["folded"].items()))
+    return Response(body, media_type=FOLDED_MEDIA_TYPE)
+
+@api_router.delete("/admin/profiles")
+async def clear_profiles():
+    """Drop every captured profile"""
+    cleared = len(request_profiles)
+    request_profiles.clear()
+    return {"cleared": cleared}
+
 # Include the router
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text exposition of this worker's request, driver pool and event-loop metrics"""
+    return Response(render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware, sampler=stack_sampler, profiles=request_profiles)
+app.add_middleware(MetricsMiddleware, metrics=request_metrics, router=app.router)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -510,8 +5205,66 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Zones", "X-Profile-Id"],
 )
 
+@app.on_event("startup")
+async def init_time_series_store():
+    try:
+        await metrics_store.ensure_schema()
+        await rollup_store.ensure_schema()
+        if await rollup_store.is_empty() and await metrics_store.collection.find_one({}, {"_id": 1}):
+            logger.info("Rollups empty, rebuilding from stored readings in the background")
+            app.state.rollup_backfill = asyncio.create_task(rollup_store.backfill(metrics_store))
+    except PyMongoError as e:
+        logger.error(f"Could not prepare {GRID_METRICS_COLLECTION} collections: {e}")
+
+@app.on_event("startup")
+async def start_energy_ledger():
+    global ledger_verify_pool
+    if LEDGER_VERIFY_WORKERS > 0:
+        ledger_verify_pool = ProcessPoolExecutor(max_workers=LEDGER_VERIFY_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    await ledger_feed.start()
+
+@app.on_event("startup")
+async def start_snn_scheduler():
+    snn_scheduler.start()
+
+@app.on_event("startup")
+async def start_ingest_writer():
+    ingestor.start()
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_manager.start()
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    event_loop_monitor.start()
+
+@app.on_event("startup")
+async def start_stack_sampler():
+    if PROFILE_REQUESTS or PROFILE_SLOW_MS > 0:
+        stack_sampler.start(always=PROFILE_SLOW_MS > 0)
+
+@app.on_event("startup")
+async def start_simulation_pool():
+    global simulation_pool
+    if SIM_WORKERS > 0:
+        simulation_pool = ProcessPoolExecutor(max_workers=SIM_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await snn_scheduler.stop()
+    await job_manager.stop()
+    await ingestor.stop()
+    await ledger_feed.stop()
+    await realtime_hub.stop()
+    await event_loop_monitor.stop()
+    stack_sampler.stop()
+    await shared_state.close()
+    if simulation_pool is not None:
+        simulation_pool.shutdown(wait=False, cancel_futures=True)
+    if ledger_verify_pool is not None:
+        ledger_verify_pool.shutdown(wait=False, cancel_futures=True)
     client.close()
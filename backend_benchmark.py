@@ -0,0 +1,844 @@
+#!/usr/bin/env python3
+"""
+Energy-Morph Backend Benchmarks
+Runs the FastAPI app in-process and measures endpoint latency and allocations.
+
+Usage:
+    python backend_benchmark.py                 # run every benchmark
+    python backend_benchmark.py grid_metrics    # run selected benchmarks
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+import httpx
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import PyMongoError
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "energy_morph_bench")
+
+import server  # noqa: E402
+from fastapi import FastAPI, Query  # noqa: E402
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def use_mock_database(module=server):
+    """Point the app's stores at an in-memory mongomock database"""
+    mock_db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    module.db = mock_db
+    module.rollup_store = module.RollupStore(mock_db)
+    module.metrics_store = module.GridMetricsStore(mock_db, rollups=module.rollup_store)
+
+
+def load_server_variant(name: str, **env: str):
+    """Import a separate copy of backend/server.py with `env` applied, on a mock database"""
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        spec = importlib.util.spec_from_file_location(name, ROOT_DIR / "backend" / "server.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    use_mock_database(module)
+    return module
+
+
+def build_legacy_app() -> FastAPI:
+    """Pre-columnar implementations kept as the 'before' reference"""
+    legacy = FastAPI()
+
+    @legacy.get("/api/grid/metrics", response_model=List[server.GridMetrics])
+    async def get_grid_metrics(hours: int = Query(default=24, le=720)):
+        metrics = []
+        zones = ["Zone_A", "Zone_B", "Zone_C", "Zone_D", "Zone_E", "Zone_F"]
+
+        for i in range(hours):
+            timestamp = (datetime.now(timezone.utc) - timedelta(hours=hours-i)).isoformat()
+            for zone in zones:
+                hour_factor = math.sin((i / 24) * 2 * math.pi - math.pi/2) * 0.3 + 1
+
+                metrics.append(server.GridMetrics(
+                    timestamp=timestamp,
+                    solar_output=round(80 * hour_factor + random.gauss(0, 10), 2),
+                    wind_output=round(60 + random.gauss(0, 15), 2),
+                    megapack_charge=round(random.uniform(40, 95), 2),
+                    grid_demand=round(120 * hour_factor + random.gauss(0, 20), 2),
+                    efficiency_ratio=round(0.75 + random.gauss(0, 0.05), 3),
+                    zone=zone
+                ))
+
+        return metrics
+
+    return legacy
+
+
+class EnergyMorphBenchmark:
+    def __init__(self, iterations: int = 50):
+        self.iterations = iterations
+        self.results: List[Dict] = []
+
+    async def measure(self, app, path: str, params: Dict = None, body: Dict = None) -> Dict:
+        """Time `iterations` requests (POSTing `body` when given), then trace allocations of one more"""
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            def send():
+                if body is not None:
+                    return http.post(path, params=params, json=body)
+                return http.get(path, params=params)
+
+            await send()  # warm-up
+            latencies = []
+            for _ in range(self.iterations):
+                start = time.perf_counter()
+                response = await send()
+                latencies.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+
+            tracemalloc.start()
+            response = await send()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            "p50_ms": statistics.median(latencies),
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            "rps": len(latencies) / (sum(latencies) / 1000),
+            "peak_alloc_kib": peak / 1024,
+            "bytes": len(response.content),
+        }
+
+    def report(self, name: str, before: Dict, after: Dict):
+        speedup = before["p50_ms"] / after["p50_ms"] if after["p50_ms"] else float("inf")
+        print(f"   {name:<28} before p50 {before['p50_ms']:8.2f} ms  peak {before['peak_alloc_kib']:9.1f} KiB"
+              f" | after p50 {after['p50_ms']:8.2f} ms  peak {after['peak_alloc_kib']:9.1f} KiB"
+              f" | {speedup:5.1f}x")
+        self.results.append({"name": name, "before": before, "after": after})
+
+    async def bench_grid_metrics(self):
+        """Row-by-row Pydantic construction vs columnar NumPy generation"""
+        use_mock_database()
+        legacy = build_legacy_app()
+        for hours in (24, 168, 720):
+            before = await self.measure(legacy, "/api/grid/metrics", {"hours": hours})
+            after = await self.measure(server.app, "/api/grid/metrics", {"hours": hours})
+            self.report(f"grid/metrics hours={hours}", before, after)
+
+    async def bench_store_ingest(self):
+        """Month of 6-zone per-second readings into a local mongod, then raw and rollup range reads"""
+        days = int(os.environ.get("BENCH_STORE_DAYS", "30"))
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+        database = client[os.environ["DB_NAME"]]
+        try:
+            await database.drop_collection(server.GRID_METRICS_COLLECTION)
+        except PyMongoError as e:
+            print(f"   ⚠️  Skipped - no mongod at {os.environ['MONGO_URL']} ({type(e).__name__})")
+            return
+        rollups = server.RollupStore(database)
+        for collection in rollups.collections.values():
+            await collection.drop()
+        store = server.GridMetricsStore(database, rollups=rollups)
+        await store.ensure_schema()
+        await rollups.ensure_schema()
+
+        end = datetime.now(timezone.utc).replace(microsecond=0)
+        start = end - timedelta(days=days)
+        zones = server.zone_registry.zones
+        inserted, insert_seconds = 0, 0.0
+        for hour in range(days * 24):
+            hour_start = start + timedelta(hours=hour)
+            hour_rng = np.random.default_rng(hour)
+            columns = {
+                field: hour_rng.normal(100, 10, 3600 * len(zones))
+                for field in server.GRID_METRIC_FIELDS
+            }
+            timestamps = [hour_start + timedelta(seconds=sec) for sec in range(3600)]
+            readings = [
+                {"timestamp": ts, "zone": zone, **{field: columns[field][i * len(zones) + z] for field in columns}}
+                for i, ts in enumerate(timestamps) for z, zone in enumerate(zones)
+            ]
+            t0 = time.perf_counter()
+            inserted += await store.insert_many(readings)
+            insert_seconds += time.perf_counter() - t0
+            if (hour + 1) % 24 == 0:
+                print(f"   day {(hour + 1) // 24:3d}: {inserted:,} readings, {inserted / insert_seconds:,.0f} readings/s")
+
+        print(f"   ingest (incl. rollups): {inserted:,} readings in {insert_seconds:.1f}s = {inserted / insert_seconds:,.0f} readings/s")
+        for label, span in (("1h", timedelta(hours=1)), ("24h", timedelta(days=1)), ("7d", timedelta(days=7)), ("30d", timedelta(days=30))):
+            raw_pipeline = [
+                {"$match": {"zone": {"$in": zones}, "timestamp": {"$gte": end - span, "$lt": end}}},
+                {"$group": {"_id": "$zone", "demand": {"$avg": "$grid_demand"}}}
+            ]
+            tier = server.pick_rollup_tier(span.total_seconds())
+            raw, rolled = [], []
+            for _ in range(5):
+                t0 = time.perf_counter()
+                await store.aggregate(raw_pipeline)
+                raw.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter()
+                frame = await rollups.frame(end - span, end, zones, tier)
+                rolled.append((time.perf_counter() - t0) * 1000)
+            print(f"   range {label:>4}: raw scan p50 {statistics.median(raw):9.1f} ms"
+                  f" | rollup {tier} ({len(frame['timestamps'])} points) p50 {statistics.median(rolled):7.1f} ms")
+        client.close()
+
+    async def bench_fast_responses(self):
+        """Default response_model validation vs FAST_RESPONSES=1, snapshot cache disabled"""
+        variants = {
+            "default": load_server_variant("server_default", FAST_RESPONSES="0", SNN_CHECKPOINT_DIR=""),
+            "fast": load_server_variant("server_fast", FAST_RESPONSES="1", SNN_CHECKPOINT_DIR=""),
+        }
+        for module in variants.values():
+            module.CACHE_TTL_SECONDS = {key: 0.0 for key in module.CACHE_TTL_SECONDS}
+            await module.snn_scheduler.run_once()
+        endpoints = [
+            ("/api/grid/metrics", {"hours": 720}, None),
+            ("/api/heatmap/data", {"hours": 168}, None),
+            ("/api/blockchain/transactions", {"limit": 100}, None),
+            ("/api/snn/predictions", None, None),
+            ("/api/kpi/aggregations", {"date_range": "30d"}, None),
+            ("/api/query/execute", None, {"query_type": "zone", "date_range": "24h"}),
+            ("/api/scenarios/list", None, None),
+        ]
+        for path, params, body in endpoints:
+            before = await self.measure(variants["default"].app, path, params, body)
+            after = await self.measure(variants["fast"].app, path, params, body)
+            speedup = before["p50_ms"] / after["p50_ms"] if after["p50_ms"] else float("inf")
+            print(f"   {path:<30} default p50 {before['p50_ms']:7.2f} p99 {before['p99_ms']:7.2f} ms {before['rps']:7.0f} req/s"
+                  f" | fast p50 {after['p50_ms']:7.2f} p99 {after['p99_ms']:7.2f} ms {after['rps']:7.0f} req/s | {speedup:4.1f}x")
+            self.results.append({"name": f"fast_responses {path}", "before": before, "after": after})
+
+    async def bench_heatmap_delta(self):
+        """Bytes on the wire for a 168h heatmap refresh: full vs compressed vs `since` delta"""
+        use_mock_database()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            async def wire_bytes(params: Dict, encoding: str) -> int:
+                response = await http.get("/api/heatmap/data", params=params, headers={"Accept-Encoding": encoding})
+                response.raise_for_status()
+                return response.num_bytes_downloaded
+
+            full = (await http.get("/api/heatmap/data", params={"hours": 168})).json()
+            delta = {"hours": 168, "since": full["timestamps"][-1]}
+            baseline = await wire_bytes({"hours": 168}, "identity")
+            cases = [
+                ("full json", {"hours": 168}, "identity"),
+                ("full json gzip", {"hours": 168}, "gzip"),
+                ("full json br", {"hours": 168}, "br"),
+                ("full f32 gzip", {"hours": 168, "format": "f32"}, "gzip"),
+                ("delta json", delta, "identity"),
+                ("delta f32", {**delta, "format": "f32"}, "identity"),
+            ]
+            for label, params, encoding in cases:
+                size = await wire_bytes(params, encoding)
+                print(f"   {label:<18} {size:>8,} bytes | {baseline / size:6.1f}x smaller than full json")
+
+    async def bench_snn(self):
+        """LIF network: 24h horizon simulation and full fit + forecast, budget 100 ms"""
+        use_mock_database()
+        forecaster = server.SpikingGridForecaster()
+        history, hours = await server.fleet_history(server.SNN_HISTORY_HOURS)
+        forecaster.predict(history, hours)  # warm-up
+        inputs = np.zeros(len(server.SNN_CHANNELS))
+
+        def horizon():
+            for _ in range(server.SNN_HORIZON_HOURS):
+                forecaster.run_hour(inputs)
+
+        steps = server.SNN_HORIZON_HOURS * server.SNN_STEPS_PER_HOUR
+        print(f"   network: {forecaster.size} neurons, {forecaster.synapse_count:,} synapses, {steps} steps per 24h horizon")
+        for label, fn in (
+            ("24h horizon", horizon),
+            (f"fit {len(history)}h + forecast 24h", lambda: forecaster.predict(history, hours)),
+            ("forecast 24h (fitted)", lambda: forecaster.forecast()),
+        ):
+            samples = sorted(self.time_call(fn, repeat=1) for _ in range(30))
+            p50, p99 = statistics.median(samples), samples[-1]
+            status = "✅" if p50 < 100 else "⚠️ "
+            print(f"   {status} {label:<26} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+
+    async def bench_scenarios(self):
+        """10,000 Monte Carlo 24h runs at 1-minute steps: one run at a time vs vectorized chunks vs process pool"""
+        runs = 10_000
+        single = self.time_call(lambda: server.simulate_grid_runs("peak_ai", 1, np.random.SeedSequence(0)), repeat=10)
+        print(f"   one run per call            {single:8.2f} ms/run -> {single * runs / 1000:7.1f} s for {runs:,} runs (extrapolated)")
+
+        t0 = time.perf_counter()
+        outcomes, _ = await server.run_simulation("peak_ai", runs, 0)
+        vectorized = time.perf_counter() - t0
+        print(f"   vectorized, {server.SIM_CHUNK_RUNS:,}-run chunks  {vectorized:7.2f} s | {single * runs / 1000 / vectorized:5.1f}x"
+              f" | stability p5/p50/p95 {np.round(np.percentile(outcomes['grid_stability'], [5, 50, 95]), 3).tolist()}")
+
+        workers = os.cpu_count() or 1
+        server.simulation_pool = server.ProcessPoolExecutor(max_workers=workers, mp_context=server.multiprocessing.get_context("spawn"))
+        try:
+            await server.run_simulation("peak_ai", workers, 0)  # spawn the workers
+            t0 = time.perf_counter()
+            await server.run_simulation("peak_ai", runs, 0)
+            pooled = time.perf_counter() - t0
+        finally:
+            server.simulation_pool.shutdown()
+            server.simulation_pool = None
+        print(f"   process pool, {workers} worker(s)     {pooled:7.2f} s | {single * runs / 1000 / pooled:5.1f}x")
+
+    async def bench_jobs(self):
+        """Scenario sweep held open as one request vs submitted as a job, then a burst of 20 jobs on 2 workers"""
+        use_mock_database()
+        server.job_manager = server.JobManager(concurrency=2, results_dir=Path(tempfile.mkdtemp()) / "jobs")
+        server.job_manager.start()
+        sweep = {"runs": 5000, "seed": 1}
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+            await server.baseline_cost(server.SIM_STEPS_PER_HOUR)
+            t0 = time.perf_counter()
+            (await http.post("/api/scenarios/batch", json=sweep)).raise_for_status()
+            held = (time.perf_counter() - t0) * 1000
+
+            async def wait_for(job_id: str) -> Dict:
+                while (job := (await http.get(f"/api/jobs/{job_id}")).json())["status"] not in server.JOB_TERMINAL:
+                    await asyncio.sleep(0.02)
+                return job
+
+            t0 = time.perf_counter()
+            response = await http.post("/api/jobs", json={"kind": "scenario_batch", "params": sweep})
+            submitted = (time.perf_counter() - t0) * 1000
+            await wait_for(response.json()["id"])
+            completed = (time.perf_counter() - t0) * 1000
+            print(f"   5 x 5,000-run sweep: request held open {held:8.1f} ms | job submit {submitted:6.2f} ms, result ready after {completed:8.1f} ms")
+
+            burst = [{"kind": "scenario_batch", "params": {"runs": 1000, "scenario_ids": ["peak_ai"]}, "priority": 5} for _ in range(16)]
+            burst += [{"kind": "report", "priority": 0} for _ in range(4)]
+            t0 = time.perf_counter()
+            ids = [(await http.post("/api/jobs", json=body)).json()["id"] for body in burst]
+            jobs = [await wait_for(job_id) for job_id in ids]
+            elapsed = (time.perf_counter() - t0) * 1000
+            stats = (await http.get("/api/jobs/stats")).json()
+            reports = [job["queue_wait_ms"] for job in jobs if job["kind"] == "report"]
+            sweeps = [job["queue_wait_ms"] for job in jobs if job["kind"] == "scenario_batch"]
+        await server.job_manager.stop()
+        shutil.rmtree(server.job_manager.results_dir.parent)
+        print(f"   burst of {len(burst)} jobs drained in {elapsed:7.1f} ms; queue wait p50 {stats['queue_wait_ms']['p50']} ms"
+              f" p95 {stats['queue_wait_ms']['p95']} ms, run p50 {stats['run_ms']['p50']} ms")
+        print(f"   priority 0 reports waited max {max(reports):7.1f} ms | priority 5 sweeps waited max {max(sweeps):7.1f} ms")
+
+    async def bench_ledger(self):
+        """Energy ledger: sustained append throughput and Merkle proof latency as it grows to LEDGER_BENCH_TXS (10M)"""
+        total = int(os.environ.get("LEDGER_BENCH_TXS", "10000000"))
+        batch = 100_000
+        ledger = server.EnergyLedger(Path(tempfile.mkdtemp()) / "ledger")
+        ledger.open()
+        now_ms = int(time.time() * 1000)
+        checkpoint, window_start, window_txs = 1_000_000, time.perf_counter(), 0
+        t0 = time.perf_counter()
+        while ledger.tx_count < total:
+            records = server.generate_ledger_transfers(min(batch, total - ledger.tx_count), now_ms, now_ms)
+            ledger.append(records)
+            window_txs += len(records)
+            if ledger.tx_count >= checkpoint or ledger.tx_count == total:
+                rate = window_txs / (time.perf_counter() - window_start)
+                print(f"   {ledger.tx_count:>12,} tx  {ledger.height:>8,} blocks  last window {rate:>10,.0f} tx/s")
+                checkpoint += 1_000_000
+                window_start, window_txs = time.perf_counter(), 0
+        ledger.seal_pending()
+        elapsed = time.perf_counter() - t0
+        print(f"   sustained append incl. sealing: {total / elapsed:,.0f} tx/s ({elapsed:.1f} s)")
+        
+        samples = random.sample(range(total), 1000)
+        proof_ms = []
+        for sequence in samples:
+            t1 = time.perf_counter()
+            proof = ledger.proof(sequence)
+            proof_ms.append((time.perf_counter() - t1) * 1000)
+            assert proof["valid"]
+        proof_ms.sort()
+        print(f"   inclusion proof ({len(proof['path'])} hashes): p50 {statistics.median(proof_ms):6.3f} ms"
+              f"  p99 {proof_ms[int(len(proof_ms) * 0.99)]:6.3f} ms")
+        recent_ms = self.time_call(lambda: ledger.recent(100))
+        print(f"   newest 100 transactions (verified): p50 {recent_ms:6.3f} ms")
+        blocks = min(ledger.height, 1000)
+        verify_ms = self.time_call(lambda: server.verify_ledger_blocks(str(ledger.directory), ledger.segment_txs, 0, blocks), repeat=1)
+        print(f"   chain verification, one core: {blocks / verify_ms * 1000:,.0f} blocks/s")
+        ledger.close()
+        size = sum(path.stat().st_size for path in ledger.directory.rglob("*") if path.is_file())
+        shutil.rmtree(ledger.directory.parent)
+        print(f"   on disk incl. posting lists {size / 1e6:,.0f} MB ({size / total:.1f} bytes/tx)")
+
+    async def bench_ledger_pages(self):
+        """Ledger transaction pages: first vs deepest page through posting-list indexes, vs a filtering scan"""
+        total = int(os.environ.get("LEDGER_PAGE_BENCH_TXS", "2000000"))
+        ledger = server.EnergyLedger(Path(tempfile.mkdtemp()) / "ledger")
+        ledger.open()
+        now_ms = int(time.time() * 1000)
+        for start in range(0, total, 200_000):
+            ledger.append(server.generate_ledger_transfers(min(200_000, total - start), now_ms, now_ms))
+        limit = 100
+        cases = {
+            "unfiltered": {},
+            "energy_type=wind": {"energy_type": 1},
+            "solar + Wind_Farm_B + Grid_Main": {"energy_type": 0, "source": 3, "destination": 0},
+        }
+        print(f"   {total:,} transactions, pages of {limit}:")
+        for name, filters in cases.items():
+            ledger.verified.clear()
+            first_ms = self.time_call(lambda: ledger.query(limit, filters=filters))
+            deepest = ledger.matching(0, total, filters, 10**9)[-limit] + 1 if filters else limit
+            deep_ms = self.time_call(lambda: ledger.query(limit, before=deepest, filters=filters))
+            
+            def scan():
+                records = ledger.read(0, ledger.tx_count)
+                mask = np.ones(len(records), dtype=bool)
+                for column, code in filters.items():
+                    mask &= records[column] == code
+                return np.nonzero(mask)[0][::-1][:limit]
+            scan_ms = self.time_call(scan, repeat=3)
+            print(f"   {name:<34} first page {first_ms:7.2f} ms | deepest page {deep_ms:7.2f} ms | filtering scan {scan_ms:8.2f} ms")
+        
+        summary_ms = self.time_call(ledger.summary)
+        ledger.close()
+        reopen_ms = self.time_call(lambda: (ledger.open(), ledger.close()), repeat=3)
+        (ledger.index_dir / "meta.json").unlink()
+        rebuild_ms = self.time_call(lambda: (ledger.open(), ledger.close()), repeat=1)
+        shutil.rmtree(ledger.directory.parent)
+        print(f"   summary from running counters {summary_ms:7.3f} ms")
+        print(f"   reopen with persisted counters {reopen_ms:7.1f} ms | rebuilding indexes and counters {rebuild_ms:8.1f} ms")
+
+    async def bench_ledger_verify(self):
+        """Ledger audit: verified blocks/s from 1 to N pool workers, and an incremental audit after new blocks"""
+        total = int(os.environ.get("LEDGER_VERIFY_BENCH_TXS", "4000000"))
+        ledger = server.EnergyLedger(Path(tempfile.mkdtemp()) / "ledger")
+        ledger.open()
+        now_ms = int(time.time() * 1000)
+        for start in range(0, total, 200_000):
+            ledger.append(server.generate_ledger_transfers(min(200_000, total - start), now_ms, now_ms))
+        ledger.seal_pending()
+        cores = os.cpu_count() or 1
+        print(f"   {ledger.height:,} blocks ({total:,} transactions), {cores} core(s) available")
+        
+        result = await server.verify_ledger(ledger)
+        single = result["blocks_per_second"]
+        print(f"   {'in-process threads':<22} {single:>8,} blocks/s")
+        workers = 1
+        while workers <= max(cores, 2):
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(
+                pool, server.verify_ledger_blocks, str(ledger.directory), ledger.segment_txs, 0, 1) for _ in range(workers)))
+            result = await server.verify_ledger(ledger, pool=pool)
+            pool.shutdown()
+            assert result["valid"]
+            print(f"   {f'{workers} process worker(s)':<22} {result['blocks_per_second']:>8,} blocks/s  {result['blocks_per_second'] / single:5.2f}x")
+            workers *= 2
+        
+        ledger.append(server.generate_ledger_transfers(10 * ledger.block_txs, now_ms, now_ms))
+        incremental = await server.verify_ledger(ledger, incremental=True)
+        full = await server.verify_ledger(ledger)
+        ledger.close()
+        shutil.rmtree(ledger.directory.parent)
+        print(f"   after 10 new blocks: incremental audit {incremental['elapsed_ms']:8.1f} ms ({incremental['blocks_checked']} blocks)"
+              f" | full audit {full['elapsed_ms']:8.1f} ms ({full['blocks_checked']:,} blocks)")
+
+    async def bench_ingest(self):
+        """Bulk telemetry ingest: vectorized vs per-row validation, request-path capacity, backpressure, and mongod end to end"""
+        from pydantic import TypeAdapter
+        import ingest_loadgen
+
+        rows = 100_000
+        columns = ingest_loadgen.reading_columns(rows, time.time() - 86400, np.random.default_rng(0))
+        ndjson = ingest_loadgen.encode_ndjson(columns)
+        arrow = ingest_loadgen.encode_arrow(columns)
+        as_array = b"[" + ndjson.rstrip(b"\n").replace(b"\n", b",") + b"]"
+        adapter = TypeAdapter(List[server.GridMetrics])
+        pydantic_ms = self.time_call(lambda: adapter.validate_json(as_array), repeat=3)
+        ndjson_ms = self.time_call(lambda: server.parse_ingest_body(server.NDJSON_MEDIA_TYPE, ndjson), repeat=3)
+        arrow_ms = self.time_call(lambda: server.parse_ingest_body(server.ARROW_MEDIA_TYPE, arrow), repeat=3)
+        print(f"   validate {rows:,} readings: pydantic per row {rows / pydantic_ms * 1000:>10,.0f}/s"
+              f" | NDJSON columns {rows / ndjson_ms * 1000:>10,.0f}/s | Arrow {rows / arrow_ms * 1000:>10,.0f}/s")
+
+        async def load(label: str, ingestor, **kwargs):
+            server.ingestor = ingestor
+            ingestor.start()
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+                result = await ingest_loadgen.run_load(http, **kwargs)
+            await ingestor.stop()
+            print(f"   {label:<38} offered {result['offered_per_second']:>7,}/s accepted {result['accepted_per_second']:>7,}/s"
+                  f" written {result['written_per_second']:>7,}/s | 429s {result['throttled']:>4}"
+                  f" | p99 {result['latency_ms']['p99']:>7} ms | buffered {result['server_buffered']:,}")
+
+        use_mock_database()
+        paused = server.TelemetryIngestor(max_buffered=10**8, flush_rows=10**8, flush_interval=3600)
+        for fmt in ("ndjson", "arrow"):
+            await load(f"request path only, {fmt} (writer paused)", paused, rate=50_000, duration=10, fmt=fmt)
+            paused.batches.clear()
+            paused.buffered = 0
+        await load("mongomock writer, 20k buffer", server.TelemetryIngestor(max_buffered=20_000, flush_rows=5000, flush_interval=0.2),
+                   rate=50_000, duration=10)
+
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+        database = client[os.environ["DB_NAME"]]
+        try:
+            await database.drop_collection(server.GRID_METRICS_COLLECTION)
+        except PyMongoError as e:
+            print(f"   ⚠️  Skipped end to end - no mongod at {os.environ['MONGO_URL']} ({type(e).__name__})")
+            return
+        server.rollup_store = server.RollupStore(database)
+        server.metrics_store = server.GridMetricsStore(database, rollups=server.rollup_store)
+        await server.metrics_store.ensure_schema()
+        await server.rollup_store.ensure_schema()
+        await load("mongod end to end", server.TelemetryIngestor(), rate=50_000, duration=30)
+        client.close()
+
+    async def bench_downsample(self):
+        """Reducing 10M-point demand series to chart size: stride decimation vs plain LTTB vs min/max and min/max-preselected LTTB"""
+        n = int(os.environ.get("DOWNSAMPLE_BENCH_POINTS", "10000000"))
+        bench_rng = np.random.default_rng(0)
+        x = np.arange(n, dtype=np.float64)
+        y = 720 + 200 * np.sin(x / 86400 * 2 * np.pi) + bench_rng.normal(0, 20, n)
+        spikes = bench_rng.choice(n, 50, replace=False)
+        y[spikes] += bench_rng.uniform(300, 600, 50)  # one-second grid_demand spikes
+
+        def plain_lttb(points):
+            saved, server.LTTB_PRESELECT = server.LTTB_PRESELECT, n
+            try:
+                return server.lttb_indices(x, y, points)
+            finally:
+                server.LTTB_PRESELECT = saved
+
+        print(f"   {n:,} points, {len(spikes)} one-point spikes")
+        for points in (1000, 4000):
+            cases = {
+                "stride": lambda: np.arange(0, n, -(-n // points)),
+                "plain LTTB": lambda: plain_lttb(points),
+                "min/max": lambda: server.downsample_indices(x, y, points, "minmax"),
+                "LTTB (min/max preselect)": lambda: server.downsample_indices(x, y, points, "lttb"),
+            }
+            for name, reduce in cases.items():
+                keep = reduce()
+                kept = np.isin(spikes, keep).sum()
+                elapsed = self.time_call(reduce, repeat=5)
+                print(f"   max_points={points:<5} {name:<26} {elapsed:8.1f} ms ({n / max(elapsed, 1e-3) / 1000:8.1f}M points/s)"
+                      f" | {len(keep):>5} points | peak kept {y[keep].max() == y.max()!s:<5} | spikes kept {kept:>2}/{len(spikes)}")
+
+        use_mock_database()
+        for params in ({"hours": 168}, {"hours": 168, "max_points": 1000}, {"hours": 720, "max_points": 3000}):
+            result = await self.measure(server.app, "/api/grid/metrics", params)
+            print(f"   grid/metrics {str(params):<38} p50 {result['p50_ms']:8.2f} ms | {result['bytes'] / 1024:8.1f} KiB")
+
+    async def bench_zone_scaling(self):
+        """Grid, heatmap and realtime endpoint latency over one site of 6 to 5,000 zones, uncached, all zones on one page"""
+        use_mock_database()
+        saved_registry, saved_ttl, saved_iterations = server.zone_registry, dict(server.CACHE_TTL_SECONDS), self.iterations
+        server.CACHE_TTL_SECONDS.update({name: 0.0 for name in server.CACHE_TTL_SECONDS})
+        self.iterations = 10
+        endpoints = [
+            ("/api/grid/realtime", {}),
+            ("/api/heatmap/realtime", {}),
+            ("/api/heatmap/data", {"hours": 24}),
+            ("/api/grid/metrics", {"hours": 24}),
+            ("/api/grid/metrics", {"hours": 24, "format": "arrow"}),
+        ]
+        baseline = {}
+        try:
+            for zones in (6, 50, 500, 5000):
+                server.zone_registry = server.ZoneRegistry([{"id": "bench", "zones": zones}])
+                for path, params in endpoints:
+                    result = await self.measure(server.app, path, {**params, "limit": zones})
+                    name = f"{path.removeprefix('/api/')}{' arrow' if 'format' in params else ''}"
+                    first = baseline.setdefault(name, (zones, result["p50_ms"]))
+                    growth = result["p50_ms"] / first[1] / (zones / first[0])
+                    print(f"   {zones:>5} zones  {name:<22} p50 {result['p50_ms']:8.2f} ms"
+                          f" | {result['p50_ms'] * 1000 / zones:8.1f} µs/zone | {result['bytes'] / 1024:9.1f} KiB"
+                          f" | latency growth / zone growth {growth:5.2f}")
+        finally:
+            server.zone_registry, self.iterations = saved_registry, saved_iterations
+            server.CACHE_TTL_SECONDS.update(saved_ttl)
+
+    async def bench_snn_online(self):
+        """SNN readout: per-sample online update and checkpoint reload vs refit, and error drift under 30 days of load growth"""
+        days = 30
+        total = server.SNN_HISTORY_HOURS + days * 24
+        columns = server.generate_grid_metrics_columns(total, len(server.zone_registry.zones))
+        history = np.column_stack([columns[metric].reshape(total, -1).mean(axis=1) for metric in server.SNN_METRICS])
+        history[server.SNN_HISTORY_HOURS:, 0] *= np.linspace(1.0, 1.25, days * 24)  # demand grows 25% after the fit
+        hours = np.arange(total) + 400_000
+        fit_rows = server.SNN_HISTORY_HOURS
+
+        online, frozen = server.SpikingGridForecaster(), server.SpikingGridForecaster()
+        refit_ms = self.time_call(lambda: online.fit(history[:fit_rows], hours[:fit_rows]), repeat=5)
+        frozen.fit(history[:fit_rows], hours[:fit_rows])
+
+        update_ms, online_errors, frozen_errors = [], [], []
+        for values, hour in zip(history[fit_rows:], hours[fit_rows:]):
+            t0 = time.perf_counter()
+            online_errors.append(online.learn(values, hour))
+            update_ms.append((time.perf_counter() - t0) * 1000)
+            readout, precision = frozen.readout.copy(), frozen.precision.copy()
+            frozen_errors.append(frozen.learn(values, hour))
+            frozen.readout, frozen.precision = readout, precision  # advance the reservoir but keep the fitted weights
+
+        checkpoint_dir = Path(tempfile.mkdtemp())
+        save_ms = self.time_call(lambda: online.save_checkpoint(checkpoint_dir), repeat=5)
+        load_ms = self.time_call(lambda: (setattr(online, "checkpoint_version", 0), online.load_checkpoint(checkpoint_dir)), repeat=5)
+        shutil.rmtree(checkpoint_dir)
+
+        print(f"   {f'refit on {fit_rows}h':<30}p50 {refit_ms:8.2f} ms")
+        print(f"   online update per new hour    p50 {statistics.median(update_ms):8.2f} ms  p99 {sorted(update_ms)[int(len(update_ms) * 0.99)]:6.2f} ms")
+        print(f"   checkpoint save (memmap)      p50 {save_ms:8.2f} ms")
+        print(f"   checkpoint reload (mmap)      p50 {load_ms:8.2f} ms | {refit_ms / load_ms:5.1f}x faster than refitting")
+        print(f"   a-priori normalized MSE (fit LOO {frozen.loo_mse:.3f}), demand +25% over {days} days:")
+        for week in range(math.ceil(days / 7)):
+            window = slice(week * 168, (week + 1) * 168)
+            print(f"     week {week + 1}: frozen readout {np.mean(frozen_errors[window]):6.3f} | online RLS {np.mean(online_errors[window]):6.3f}")
+
+    async def bench_snn_scheduler(self):
+        """/api/snn/predictions: inference per request vs reading the scheduler's latest forecast"""
+        use_mock_database()
+        os.environ["SNN_CHECKPOINT_DIR"] = server.SNN_CHECKPOINT_DIR = tempfile.mkdtemp()  # spawned workers read the env
+
+        async def on_request():
+            history, hours = await server.fleet_history(server.SNN_HISTORY_HOURS)
+            await asyncio.to_thread(server.snn_forecaster.predict, history, hours)
+
+        samples = []
+        for _ in range(20):
+            t0 = time.perf_counter()
+            await on_request()
+            samples.append((time.perf_counter() - t0) * 1000)
+        print(f"   inference per request      p50 {statistics.median(samples):7.2f} ms")
+
+        scheduler = server.snn_scheduler = server.SNNForecastScheduler(interval=0.5, workers=1)
+        scheduler.start()
+        await scheduler.current()
+        read = await self.measure(server.app, "/api/snn/predictions")
+        print(f"   precomputed read           p50 {read['p50_ms']:7.2f} ms  p99 {read['p99_ms']:7.2f} ms {read['rps']:7.0f} req/s")
+        await asyncio.sleep(3)
+        stats = scheduler.stats()
+        await scheduler.stop()
+        shutil.rmtree(server.SNN_CHECKPOINT_DIR)
+        print(f"   process pool, {stats['interval_seconds']}s cadence: {stats['runs']} runs, inference avg {stats['avg_inference_ms']} ms"
+              f" max {stats['max_inference_ms']} ms, queue lag last {stats['last_queue_lag_ms']} ms"
+              f" max {stats['max_queue_lag_ms']} ms (first run includes worker spawn)")
+
+    def time_call(self, fn: Callable, repeat: int = 20) -> float:
+        """Median milliseconds of `repeat` calls to fn()"""
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(samples)
+
+    async def bench_columnar_formats(self):
+        """JSON vs Arrow IPC / Parquet / float32 body size and encode/decode time at 168h"""
+        use_mock_database()
+        if server.pa is None:
+            print("   ⚠️  Skipped - pyarrow is not installed")
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        metrics = await server.grid_metrics_table(168)
+        heatmap = await server.heatmap_matrices(168)
+        rows = server.grid_metrics_records(metrics, metrics["timestamp"], metrics["zone"])
+        heatmap_model = await server.heatmap_data_snapshot(168)
+        cases = {
+            "grid/metrics json": (lambda: server.json_body(rows), json.loads),
+            "grid/metrics arrow": (lambda: server.encode_arrow(server.metrics_record_batch(metrics)),
+                                   lambda body: pa.ipc.open_stream(body).read_all()),
+            "grid/metrics parquet": (lambda: server.encode_parquet(server.metrics_record_batch(metrics)),
+                                     lambda body: pq.read_table(pa.BufferReader(body))),
+            "heatmap/data json": (lambda: server.json_body(heatmap_model), json.loads),
+            "heatmap/data arrow": (lambda: server.encode_arrow(server.heatmap_record_batch(heatmap)),
+                                   lambda body: pa.ipc.open_stream(body).read_all()),
+            "heatmap/data parquet": (lambda: server.encode_parquet(server.heatmap_record_batch(heatmap)),
+                                     lambda body: pq.read_table(pa.BufferReader(body))),
+            "heatmap/data f32": (lambda: server.encode_heatmap_f32(heatmap),
+                                 lambda body: np.frombuffer(body, "<f4", offset=4 + int.from_bytes(body[:4], "little"))),
+        }
+        for name, (encode, decode) in cases.items():
+            body = encode()
+            print(f"   {name:<24} {len(body) / 1024:8.1f} KiB | encode p50 {self.time_call(encode):7.2f} ms"
+                  f" | decode p50 {self.time_call(lambda: decode(body)):7.2f} ms")
+
+    async def bench_export_csv(self):
+        """Streamed minute-resolution CSV export of all six zones over 30-120 days"""
+        use_mock_database()
+        end = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        for days, compress in ((30, False), (120, False), (120, True)):
+            params = {
+                "format": "csv", "compress": str(compress).lower(),
+                "start": (end - timedelta(days=days)).isoformat(), "end": end.isoformat()
+            }
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+                t0 = time.perf_counter()
+                response = await http.get("/api/export/csv", params=params)
+                elapsed = time.perf_counter() - t0
+                response.raise_for_status()
+            rows = days * 1440 * len(server.zone_registry.zones)
+            label = f"export/csv days={days}{' gzip' if compress else ''}"
+            print(f"   {label:<28} {rows:>10,} rows in {elapsed:6.2f}s = {rows / elapsed:>10,.0f} rows/s"
+                  f" | {len(response.content) / 2**20:7.1f} MiB")
+
+        # ASGITransport buffers the whole body, so trace the chunk generator directly for memory
+        for days in (7, 90):
+            tracemalloc.start()
+            async for _ in server.metrics_csv_chunks(end - timedelta(days=days), end, server.zone_registry.zones, "1m"):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"   generator days={days:<3} peak {peak / 1024:9.1f} KiB")
+
+    async def bench_metrics(self):
+        """Per-request cost of the Prometheus middleware around a bare ASGI app, and /metrics scrape time"""
+        requests = 100_000
+        body = b'{"status":"healthy"}'
+
+        async def bare(scope, receive, send):
+            await receive()
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            pass
+
+        async def drive(app, scopes):
+            t0 = time.perf_counter()
+            for scope in scopes:
+                await app(scope, receive, send)
+            return (time.perf_counter() - t0) / len(scopes) * 1e6
+
+        paths = ["/api/health", "/api/grid/realtime", "/api/jobs/a1b2", "/api/sites/gigafactory/zones"]
+        scopes = [{"type": "http", "method": "GET", "path": paths[i % len(paths)], "headers": []} for i in range(requests)]
+        metrics = server.RequestMetrics()
+        instrumented = server.MetricsMiddleware(bare, metrics, server.app.router)
+        await drive(instrumented, scopes[:1000])  # resolve routes once, as a running server would
+        bare_us = min([await drive(bare, scopes) for _ in range(3)])
+        instrumented_us = min([await drive(instrumented, scopes) for _ in range(3)])
+        print(f"   bare ASGI app {bare_us:6.2f} µs/request | with MetricsMiddleware {instrumented_us:6.2f} µs/request"
+              f" | overhead {instrumented_us - bare_us:5.2f} µs/request over {len(paths)} routes")
+
+        saved = server.request_metrics
+        server.request_metrics = metrics
+        scrape_ms = self.time_call(server.render_metrics, repeat=20)
+        print(f"   render /metrics ({len(metrics.latency)} routes) p50 {scrape_ms:6.2f} ms | {len(server.render_metrics()) / 1024:6.1f} KiB")
+        for route in server.app.router.routes:  # every route seen, with two methods each
+            for method in ("GET", "POST"):
+                metrics.observe((method, route.path), 200, 0.01, 0, 100)
+        scrape_ms = self.time_call(server.render_metrics, repeat=20)
+        print(f"   render /metrics ({len(metrics.latency)} routes) p50 {scrape_ms:6.2f} ms | {len(server.render_metrics()) / 1024:6.1f} KiB")
+        server.request_metrics = saved
+
+    async def bench_profiling(self):
+        """Request latency with profiling off, with the always-on sampler (PROFILE_SLOW_MS) and for an explicitly profiled request"""
+        from starlette.middleware import Middleware
+
+        use_mock_database()
+        app = server.app
+        saved_middleware, saved_ttl = list(app.user_middleware), dict(server.CACHE_TTL_SECONDS)
+        server.CACHE_TTL_SECONDS.update({name: 0.0 for name in server.CACHE_TTL_SECONDS})
+        sampler, profiles = server.StackSampler(), deque(maxlen=server.PROFILE_BUFFER)
+
+        def profiled(**options):
+            app.user_middleware = [
+                Middleware(server.ProfilingMiddleware, sampler=sampler, profiles=profiles, **options)
+                if m.cls is server.ProfilingMiddleware else m for m in saved_middleware
+            ]
+            app.middleware_stack = app.build_middleware_stack()
+
+        try:
+            for path, params in (("/api/grid/realtime", {}), ("/api/heatmap/data", {"hours": 168})):
+                profiled(enabled=False, slow_ms=0)
+                off = await self.measure(app, path, params)
+                sampler.start(always=True)
+                profiled(enabled=False, slow_ms=10_000)
+                sampling = await self.measure(app, path, params)
+                sampler.stop()
+                sampler.start(always=False)
+                profiled(enabled=True, slow_ms=0)
+                cpu_only = await self.measure(app, path, {**params, "profile": "cpu"})
+                traced = await self.measure(app, path, {**params, "profile": 1})
+                sampler.stop()
+                print(f"   {path:<20} p50 off {off['p50_ms']:7.2f} ms | sampler always on {sampling['p50_ms']:7.2f} ms"
+                      f" ({sampling['p50_ms'] / off['p50_ms'] - 1:+6.1%}) | ?profile=cpu {cpu_only['p50_ms']:7.2f} ms"
+                      f" | ?profile=1 ({server.PROFILE_TRACE_FRAMES}-frame tracemalloc) {traced['p50_ms']:7.2f} ms")
+            latest = profiles[-1]
+            print(f"   last profile: {latest.cpu['samples']} samples, {len(latest.cpu['folded'])} distinct stacks,"
+                  f" peak {latest.memory['peak_bytes'] / 1024:.1f} KiB traced; top: {latest.cpu['top'][0]['function'] if latest.cpu['top'] else '-'}")
+        finally:
+            app.user_middleware = saved_middleware
+            app.middleware_stack = app.build_middleware_stack()
+            server.CACHE_TTL_SECONDS.update(saved_ttl)
+
+    async def bench_scaleout(self):
+        """uvicorn with 1, 2 and 4 workers sharing SHARED_STATE_URL: /api/grid/realtime throughput and snapshots computed"""
+        import cluster_loadtest
+
+        shared_url = os.environ.get("SHARED_STATE_URL", "")
+        if not shared_url:
+            print("   ⚠️  Skipped - set SHARED_STATE_URL=redis://... to run the cluster")
+            return
+        duration = float(os.environ.get("SCALEOUT_BENCH_SECONDS", "10"))
+        runs = {
+            "shared": cluster_loadtest.run_scaling([1, 2, 4], shared_url, duration=duration)["runs"],
+            "per-worker cache": cluster_loadtest.run_scaling([4], "", duration=duration)["runs"],
+        }
+        print(f"   {os.cpu_count()} CPUs, {duration:.0f} s per run")
+        for label, results in runs.items():
+            for result in results:
+                print(f"   {label:<17} {result['workers']} workers {result['requests_per_second']:>9,.1f} req/s"
+                      f" ({result['speedup']:4.2f}x) | p99 {result['latency_ms']['p99']:>7} ms"
+                      f" | {result['distinct_snapshots']:>3} snapshots computed | errors {result['errors']}")
+
+    def run(self, selected: List[str]):
+        benchmarks: Dict[str, Callable] = {
+            name[len("bench_"):]: getattr(self, name)
+            for name in dir(self) if name.startswith("bench_")
+        }
+        for name in selected or sorted(benchmarks):
+            if name not in benchmarks:
+                print(f"Unknown benchmark: {name} (available: {', '.join(sorted(benchmarks))})")
+                return 1
+            print("\n" + "="*60)
+            print(f"BENCHMARK: {name} — {benchmarks[name].__doc__}")
+            print("="*60)
+            asyncio.run(benchmarks[name]())
+        return 0
+
+
+def main():
+    return EnergyMorphBenchmark().run(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
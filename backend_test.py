@@ -1,230 +1,654 @@
 #!/usr/bin/env python3
 """
-Energy-Morph Dashboard Backend API Testing
-Tests all API endpoints for the Tesla Gigafactory power grid management system.
+Energy-Morph Backend Load Suite
+Boots the FastAPI app in-process on a mongomock database, checks every API
+endpoint's status once, then offers each a fixed request rate from concurrent
+async clients and reports p50/p95/p99 latency, throughput and peak RSS per
+endpoint. The JSON report can be diffed against a stored baseline to catch
+regressions.
+
+Usage:
+    python backend_test.py                                           # smoke checks, then 2 s at 50 req/s per endpoint
+    python backend_test.py --rps 100 --duration 10 --only grid,heatmap
+    python backend_test.py --output report.json --baseline backend_test_baseline.json
+    python backend_test.py --save-baseline                           # record a new baseline
+    python backend_test.py --mongo-url mongodb://localhost:27017     # a local mongod instead of mongomock
+    python backend_test.py --url http://localhost:8001 --smoke-only  # a running server; no RSS figures
 """
 
-import requests
-import sys
+import argparse
+import asyncio
+import gc
+import gzip
 import json
-from datetime import datetime
-from typing import Dict, List, Any
-
-class EnergyMorphAPITester:
-    def __init__(self, base_url="https://megapack-dash.preview.emergentagent.com"):
-        self.base_url = base_url
-        self.api_url = f"{base_url}/api"
-        self.tests_run = 0
-        self.tests_passed = 0
-        self.failed_tests = []
-        self.session = requests.Session()
-        self.session.headers.update({'Content-Type': 'application/json'})
-
-    def run_test(self, name: str, method: str, endpoint: str, expected_status: int = 200, 
-                 data: Dict = None, params: Dict = None) -> tuple[bool, Dict]:
-        """Run a single API test"""
-        url = f"{self.api_url}/{endpoint}"
-        self.tests_run += 1
-        
-        print(f"\n🔍 Testing {name}...")
-        print(f"   URL: {url}")
-        
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIR = Path(__file__).parent
+BASELINE_PATH = ROOT_DIR / "backend_test_baseline.json"
+UNREACHABLE_MONGO_URL = "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=200"  # startup schema check fails fast, then mongomock
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+WARMUP_REQUESTS = 3
+RSS_SAMPLE_INTERVAL = 0.005
+READY_TIMEOUT = 60
+TAIL_SAMPLES = 10  # a percentile is compared with the baseline only when both runs have this many requests beyond it
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+LEDGER_SEED_TXS = 8
+SUITE_FRAME_CELLS = 4000  # in-process rollup frame cap: 720 h of the six default zones exceeds it
+MIB = 1024 * 1024
+
+
+@dataclass
+class Scenario:
+    """One request shape: checked once against `status`, then loaded unless `load` is False"""
+    name: str
+    method: str
+    path: str
+    status: int = 200
+    params: Optional[Dict] = None
+    body: Any = None
+    content: Optional[bytes] = None
+    headers: Optional[Dict] = None
+    load: bool = True
+    check: Optional[Callable[[httpx.Response], bool]] = None
+
+    def send(self, client: httpx.AsyncClient):
+        return client.request(self.method, self.path, params=self.params, json=self.body,
+                              content=self.content, headers=self.headers)
+
+
+# ==================== SCENARIOS ====================
+# One builder per API area. Builders may issue setup requests (a site id, a
+# ledger cursor) and run in order, so later ones see earlier writes.
+
+async def health_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    return [
+        Scenario("API Root", "GET", "/api/"),
+        Scenario("Health Check", "GET", "/api/health"),
+        # Prometheus metrics are served next to the API, not under /api
+        Scenario("Prometheus Metrics", "GET", "/metrics", check=lambda r: 'route="/api/health"' in r.text),
+        Scenario("Request Profiles", "GET", "/api/admin/profiles"),
+        Scenario("Request Profile (unknown id)", "GET", "/api/admin/profiles/nope", 404),
+    ]
+
+
+async def site_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    sites = (await client.get("/api/sites")).json()
+    site_id = sites[0]["id"]
+    return [
+        Scenario("List Sites", "GET", "/api/sites"),
+        Scenario("Site Zones", "GET", f"/api/sites/{site_id}/zones", params={"limit": 10}),
+        Scenario("Realtime Grid (site page)", "GET", "/api/grid/realtime", params={"site": site_id, "limit": 3}),
+        Scenario("Heatmap Data (site page)", "GET", "/api/heatmap/data", params={"site": site_id, "offset": 1, "limit": 2}),
+        Scenario("Grid Metrics (page past the end)", "GET", "/api/grid/metrics", params={"site": site_id, "offset": 10**6},
+                 check=lambda r: r.json() == []),
+        Scenario("Heatmap Data (page past the end)", "GET", "/api/heatmap/data", params={"site": site_id, "offset": 10**6},
+                 check=lambda r: r.json()["zones"] == []),
+        Scenario("Site Zones (unknown site)", "GET", "/api/sites/Nowhere/zones", 404),
+        Scenario("Grid Metrics (unknown site)", "GET", "/api/grid/metrics", 400, params={"site": "Nowhere"}),
+    ]
+
+
+async def grid_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    now = datetime.now(timezone.utc).isoformat()
+    lines = [json.dumps({"timestamp": now, "zone": zone, "solar_output": 80.5, "wind_output": 60.2,
+                         "megapack_charge": 75.0, "grid_demand": 120.4, "efficiency_ratio": 0.78})
+             for zone in ("Zone_A", "Zone_B", "Nowhere")]
+    scenarios = []
+    if os.environ.get("ROLLUP_MAX_FRAME_CELLS") == str(SUITE_FRAME_CELLS):  # a remote server's cap is unknown
+        scenarios.append(Scenario("Grid Metrics (over the cell budget)", "GET", "/api/grid/metrics", 413,
+                                  params={"hours": 720, "limit": 5000}, load=False))
+    return scenarios + [
+        Scenario("Grid Metrics (24h)", "GET", "/api/grid/metrics"),
+        Scenario("Grid Metrics (repeated zones)", "GET", "/api/grid/metrics", params={"zones": ",".join(["Zone_A"] * 1000)},
+                 check=lambda r: len(r.json()) == 24 and r.headers["X-Total-Zones"] == "1"),
+        Scenario("Grid Metrics (48h)", "GET", "/api/grid/metrics", params={"hours": 48}),
+        Scenario("Grid Metrics (1h)", "GET", "/api/grid/metrics", params={"hours": 1}),
+        Scenario("Grid Metrics (arrow)", "GET", "/api/grid/metrics", params={"hours": 168, "format": "arrow"}),
+        Scenario("Grid Metrics (downsampled)", "GET", "/api/grid/metrics", params={"hours": 168, "max_points": 500}),
+        Scenario("Grid Metrics (LTTB)", "GET", "/api/grid/metrics",
+                 params={"hours": 168, "max_points": 500, "downsample": "lttb"}),
+        Scenario("Grid Metrics (bad downsample)", "GET", "/api/grid/metrics", 400, params={"downsample": "mean"}),
+        Scenario("Grid Metrics (negative hours)", "GET", "/api/grid/metrics", 422, params={"hours": -3}),
+        Scenario("Bulk Ingest (NDJSON, one bad row)", "POST", "/api/ingest/metrics", 202,
+                 content="\n".join(lines).encode(), headers={"Content-Type": NDJSON_MEDIA_TYPE},
+                 check=lambda r: r.json().get("accepted") == 2),
+        Scenario("Bulk Ingest (JSON body)", "POST", "/api/ingest/metrics", 415, body=[]),
+        Scenario("Bulk Ingest (timestamp out of range)", "POST", "/api/ingest/metrics", 422,
+                 content=lines[0].replace(json.dumps(now), "1.7e12").encode(), headers={"Content-Type": NDJSON_MEDIA_TYPE}),
+        Scenario("Bulk Ingest (gzip bomb)", "POST", "/api/ingest/metrics", 413, content=gzip.compress(b" " * (33 << 20)),
+                 headers={"Content-Type": NDJSON_MEDIA_TYPE, "Content-Encoding": "gzip"}, load=False),
+        Scenario("Ingest Stats", "GET", "/api/ingest/stats"),
+        Scenario("Realtime Grid Metrics", "GET", "/api/grid/realtime"),
+        Scenario("Realtime Stream Stats", "GET", "/api/stream/stats"),
+        Scenario("Snapshot Cache Stats", "GET", "/api/cache/stats"),
+    ]
+
+
+async def kpi_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    return [
+        Scenario("KPI Summary", "GET", "/api/kpi/summary"),
+        Scenario("KPI Aggregations (24h)", "GET", "/api/kpi/aggregations"),
+        Scenario("KPI Aggregations (7d)", "GET", "/api/kpi/aggregations", params={"date_range": "7d"}),
+        Scenario("KPI Aggregations (30d, 200 points)", "GET", "/api/kpi/aggregations",
+                 params={"date_range": "30d", "max_points": 200}),
+    ]
+
+
+async def snn_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    return [
+        Scenario("SNN Predictions", "GET", "/api/snn/predictions"),
+        Scenario("Neuron Activity", "GET", "/api/snn/neuron-activity"),
+        Scenario("SNN Scheduler Stats", "GET", "/api/snn/scheduler/stats"),
+    ]
+
+
+async def blockchain_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    transfer = {"energy_type": "solar", "amount_kwh": 125.5, "source": "Solar_Farm_A", "destination": "Grid_Main"}
+    await client.post("/api/blockchain/transactions", json=[transfer] * LEDGER_SEED_TXS)  # a sealed block and a second page
+    cursor = (await client.get("/api/blockchain/transactions", params={"limit": 5})).headers.get("X-Next-Cursor")
+    scenarios = [
+        Scenario("Blockchain Transactions", "GET", "/api/blockchain/transactions"),
+        Scenario("Blockchain Transactions (limit 5)", "GET", "/api/blockchain/transactions", params={"limit": 5}),
+        Scenario("Blockchain Transactions (filtered)", "GET", "/api/blockchain/transactions",
+                 params={"energy_type": "wind", "verified": "true", "limit": 50}),
+    ]
+    if cursor:
+        scenarios.append(Scenario("Blockchain Transactions (next page)", "GET", "/api/blockchain/transactions",
+                                  params={"limit": 5, "cursor": cursor}))
+    return scenarios + [
+        Scenario("Blockchain Transactions (bad cursor)", "GET", "/api/blockchain/transactions", 400,
+                 params={"cursor": "0:-1"}),
+        Scenario("Blockchain Summary", "GET", "/api/blockchain/summary"),
+        Scenario("Blockchain Append", "POST", "/api/blockchain/transactions", body=[transfer]),
+        Scenario("Blockchain Append (unknown source)", "POST", "/api/blockchain/transactions", 400,
+                 body=[{**transfer, "source": "Nowhere"}]),
+        Scenario("Blockchain Proof", "GET", "/api/blockchain/transactions/0/proof", check=lambda r: r.json().get("valid")),
+        Scenario("Blockchain Block", "GET", "/api/blockchain/blocks/0"),
+        # GET only re-checks blocks past the checkpoint and leaves it where it is
+        Scenario("Blockchain Verify", "GET", "/api/blockchain/verify", params={"incremental": "false"},
+                 check=lambda r: r.json()["start"] == r.json()["verified_through_block"] + 1),
+        Scenario("Submit Ledger Verify Job", "POST", "/api/jobs", 202,
+                 body={"kind": "ledger_verify", "params": {"start": 0}}, load=False),
+    ]
+
+
+async def heatmap_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    timestamps = (await client.get("/api/heatmap/data", params={"hours": 168})).json().get("timestamps")
+    scenarios = [
+        Scenario("Heatmap Data (24h)", "GET", "/api/heatmap/data"),
+        Scenario("Heatmap Data (48h)", "GET", "/api/heatmap/data", params={"hours": 48}),
+        Scenario("Heatmap Data (parquet)", "GET", "/api/heatmap/data", params={"hours": 168, "format": "parquet"}),
+        Scenario("Heatmap Data (f32)", "GET", "/api/heatmap/data", params={"hours": 168, "format": "f32"}),
+        Scenario("Heatmap Data (168h)", "GET", "/api/heatmap/data", params={"hours": 168}),
+        Scenario("Heatmap Data (negative hours)", "GET", "/api/heatmap/data", 422, params={"hours": -3}),
+    ]
+    if timestamps:
+        scenarios.append(Scenario("Heatmap Data (delta)", "GET", "/api/heatmap/data",
+                                  params={"hours": 168, "since": timestamps[-1]}))
+    return scenarios + [Scenario("Realtime Heatmap", "GET", "/api/heatmap/realtime")]
+
+
+async def query_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    queries = [
+        {"query_type": "efficiency", "date_range": "24h"},
+        {"query_type": "demand", "date_range": "24h"},
+        {"query_type": "renewable", "date_range": "7d"},
+        {"query_type": "zone", "date_range": "24h", "zone": "Zone_A"},
+    ]
+    return [Scenario(f"Query Execute ({query['query_type']})", "POST", "/api/query/execute", body=query)
+            for query in queries] + [
+        Scenario("Query Execute (efficiency of grid_demand)", "POST", "/api/query/execute",
+                 body={"query_type": "efficiency", "date_range": "24h", "metric": "grid_demand"},
+                 check=lambda r: all("avg_grid_demand" in row for row in r.json()["results"])),
+    ]
+
+
+async def export_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    return [
+        Scenario("Export CSV", "GET", "/api/export/csv"),
+        Scenario("Export CSV (metrics)", "GET", "/api/export/csv", params={"data_type": "metrics"}),
+        Scenario("Export CSV (streamed)", "GET", "/api/export/csv", params={"format": "csv", "zones": "Zone_A"}),
+        Scenario("Export CSV (gzip)", "GET", "/api/export/csv",
+                 params={"format": "csv", "resolution": "hour", "compress": "true"}),
+        Scenario("Export CSV (bad zone)", "GET", "/api/export/csv", 400, params={"format": "csv", "zones": "Zone_Z"}),
+        Scenario("Generate Report", "GET", "/api/export/report"),
+    ]
+
+
+async def scenario_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    simulations = ["peak_ai", "solar_peak", "grid_outage", "demand_surge", "wind_drop"]
+    return [
+        Scenario("List Scenarios", "GET", "/api/scenarios/list"),
+        *(Scenario(f"Simulate {scenario}", "POST", "/api/scenarios/simulate", params={"scenario_id": scenario})
+          for scenario in simulations),
+        Scenario("Scenario Batch", "POST", "/api/scenarios/batch", body={"runs": 1000, "seed": 1}),
+        Scenario("Scenario Batch (unknown)", "POST", "/api/scenarios/batch", 404, body={"scenario_ids": ["unknown"]}),
+    ]
+
+
+async def job_scenarios(client: httpx.AsyncClient) -> List[Scenario]:
+    # Submissions are checked but not loaded: the bounded queue would answer 429
+    return [
+        Scenario("Submit Report Job", "POST", "/api/jobs", 202, body={"kind": "report"}, load=False),
+        Scenario("Submit Job (unknown kind)", "POST", "/api/jobs", 400, body={"kind": "unknown"}),
+        Scenario("Job Stats", "GET", "/api/jobs/stats"),
+        Scenario("List Jobs", "GET", "/api/jobs"),
+        Scenario("Job Status (unknown)", "GET", "/api/jobs/unknown", 404),
+    ]
+
+
+SECTIONS = [
+    ("HEALTH & INFO", health_scenarios),
+    ("SITE REGISTRY", site_scenarios),
+    ("GRID METRICS", grid_scenarios),
+    ("KPI", kpi_scenarios),
+    ("SNN PREDICTION", snn_scenarios),
+    ("BLOCKCHAIN", blockchain_scenarios),
+    ("HEATMAP", heatmap_scenarios),
+    ("QUERY INTERFACE", query_scenarios),
+    ("EXPORT", export_scenarios),
+    ("SCENARIO", scenario_scenarios),
+    ("JOB", job_scenarios),
+]
+
+
+# ==================== MULTI-REQUEST CHECKS ====================
+# Each returns None on success or a one-line failure description.
+
+async def check_shared_snapshot(client: httpx.AsyncClient) -> Optional[str]:
+    """Back-to-back requests share one snapshot, whichever worker serves them"""
+    etags = {(await client.get("/api/grid/realtime")).headers.get("ETag") for _ in range(4)}
+    if len(etags) <= 2 and None not in etags:
+        return None
+    return f"{len(etags)} ETags over 4 requests"
+
+
+async def check_job_lifecycle(client: httpx.AsyncClient) -> Optional[str]:
+    """A submitted report job finishes and serves its result"""
+    response = await client.post("/api/jobs", json={"kind": "report"})
+    if response.status_code != 202:
+        return f"submit returned {response.status_code}"
+    job = response.json()
+    for _ in range(20):
+        job = (await client.get(f"/api/jobs/{job['id']}")).json()
+        if job.get("status") in ("succeeded", "failed", "cancelled"):
+            break
+        await asyncio.sleep(0.5)
+    if job.get("status") != "succeeded":
+        return f"job ended {job.get('status')}"
+    result = await client.get(f"/api/jobs/{job['id']}/result")
+    return None if result.status_code == 200 else f"result returned {result.status_code}"
+
+
+CHECKS = [("Shared Realtime Snapshot", check_shared_snapshot), ("Job Lifecycle", check_job_lifecycle)]
+
+
+# ==================== MEASUREMENT ====================
+
+class RssSampler:
+    """Peak resident set size of this process, sampled from a background thread"""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self.base = self.peak = self.current()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def current(self) -> Optional[int]:
         try:
-            if method == 'GET':
-                response = self.session.get(url, params=params, timeout=10)
-            elif method == 'POST':
-                response = self.session.post(url, json=data, params=params, timeout=10)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
-
-            success = response.status_code == expected_status
-            
-            if success:
-                self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
-                try:
-                    response_data = response.json()
-                    if isinstance(response_data, list) and len(response_data) > 0:
-                        print(f"   Response: List with {len(response_data)} items")
-                    elif isinstance(response_data, dict):
-                        print(f"   Response keys: {list(response_data.keys())[:5]}")
-                    return True, response_data
-                except:
-                    return True, {}
-            else:
-                self.failed_tests.append({
-                    "test": name,
-                    "endpoint": endpoint,
-                    "expected": expected_status,
-                    "actual": response.status_code,
-                    "response": response.text[:200] if response.text else "No response"
-                })
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
-                print(f"   Response: {response.text[:200]}")
-                return False, {}
-
-        except Exception as e:
-            self.failed_tests.append({
-                "test": name,
-                "endpoint": endpoint,
-                "error": str(e)
-            })
-            print(f"❌ Failed - Error: {str(e)}")
-            return False, {}
-
-    def test_health_endpoints(self):
-        """Test basic health and info endpoints"""
-        print("\n" + "="*50)
-        print("TESTING HEALTH & INFO ENDPOINTS")
-        print("="*50)
-        
-        self.run_test("API Root", "GET", "")
-        self.run_test("Health Check", "GET", "health")
-
-    def test_grid_metrics(self):
-        """Test grid metrics endpoints"""
-        print("\n" + "="*50)
-        print("TESTING GRID METRICS ENDPOINTS")
-        print("="*50)
-        
-        # Test grid metrics with different parameters
-        self.run_test("Grid Metrics (24h)", "GET", "grid/metrics")
-        self.run_test("Grid Metrics (48h)", "GET", "grid/metrics", params={"hours": 48})
-        self.run_test("Grid Metrics (1h)", "GET", "grid/metrics", params={"hours": 1})
-        
-        # Test realtime metrics
-        self.run_test("Realtime Grid Metrics", "GET", "grid/realtime")
-
-    def test_kpi_endpoints(self):
-        """Test KPI endpoints"""
-        print("\n" + "="*50)
-        print("TESTING KPI ENDPOINTS")
-        print("="*50)
-        
-        self.run_test("KPI Summary", "GET", "kpi/summary")
-        self.run_test("KPI Aggregations (24h)", "GET", "kpi/aggregations")
-        self.run_test("KPI Aggregations (7d)", "GET", "kpi/aggregations", params={"date_range": "7d"})
-
-    def test_snn_endpoints(self):
-        """Test SNN prediction endpoints"""
-        print("\n" + "="*50)
-        print("TESTING SNN PREDICTION ENDPOINTS")
-        print("="*50)
-        
-        self.run_test("SNN Predictions", "GET", "snn/predictions")
-        self.run_test("Neuron Activity", "GET", "snn/neuron-activity")
-
-    def test_blockchain_endpoints(self):
-        """Test blockchain tracking endpoints"""
-        print("\n" + "="*50)
-        print("TESTING BLOCKCHAIN ENDPOINTS")
-        print("="*50)
-        
-        self.run_test("Blockchain Transactions", "GET", "blockchain/transactions")
-        self.run_test("Blockchain Transactions (limit 5)", "GET", "blockchain/transactions", params={"limit": 5})
-        self.run_test("Blockchain Summary", "GET", "blockchain/summary")
-
-    def test_heatmap_endpoints(self):
-        """Test heatmap data endpoints"""
-        print("\n" + "="*50)
-        print("TESTING HEATMAP ENDPOINTS")
-        print("="*50)
-        
-        self.run_test("Heatmap Data (24h)", "GET", "heatmap/data")
-        self.run_test("Heatmap Data (48h)", "GET", "heatmap/data", params={"hours": 48})
-        self.run_test("Realtime Heatmap", "GET", "heatmap/realtime")
-
-    def test_query_endpoints(self):
-        """Test query interface endpoints"""
-        print("\n" + "="*50)
-        print("TESTING QUERY INTERFACE ENDPOINTS")
-        print("="*50)
-        
-        # Test different query types
-        queries = [
-            {"query_type": "efficiency", "date_range": "24h"},
-            {"query_type": "demand", "date_range": "24h"},
-            {"query_type": "renewable", "date_range": "7d"},
-            {"query_type": "zone", "date_range": "24h", "zone": "Zone_A"}
-        ]
-        
-        for i, query in enumerate(queries):
-            self.run_test(f"Query Execute ({query['query_type']})", "POST", "query/execute", data=query)
-
-    def test_export_endpoints(self):
-        """Test export functionality"""
-        print("\n" + "="*50)
-        print("TESTING EXPORT ENDPOINTS")
-        print("="*50)
-        
-        self.run_test("Export CSV", "GET", "export/csv")
-        self.run_test("Export CSV (metrics)", "GET", "export/csv", params={"data_type": "metrics"})
-        self.run_test("Generate Report", "GET", "export/report")
-
-    def test_scenario_endpoints(self):
-        """Test scenario simulation endpoints"""
-        print("\n" + "="*50)
-        print("TESTING SCENARIO ENDPOINTS")
-        print("="*50)
-        
-        self.run_test("List Scenarios", "GET", "scenarios/list")
-        
-        # Test scenario simulations
-        scenarios = ["peak_ai", "solar_peak", "grid_outage", "demand_surge", "wind_drop"]
-        for scenario in scenarios:
-            self.run_test(f"Simulate {scenario}", "POST", "scenarios/simulate", params={"scenario_id": scenario})
-
-    def run_all_tests(self):
-        """Run all API tests"""
-        print("🚀 Starting Energy-Morph Dashboard API Tests")
-        print(f"🌐 Base URL: {self.base_url}")
-        print(f"📡 API URL: {self.api_url}")
-        
-        start_time = datetime.now()
-        
-        # Run all test suites
-        self.test_health_endpoints()
-        self.test_grid_metrics()
-        self.test_kpi_endpoints()
-        self.test_snn_endpoints()
-        self.test_blockchain_endpoints()
-        self.test_heatmap_endpoints()
-        self.test_query_endpoints()
-        self.test_export_endpoints()
-        self.test_scenario_endpoints()
-        
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        # Print final results
-        print("\n" + "="*60)
-        print("📊 FINAL TEST RESULTS")
-        print("="*60)
-        print(f"✅ Tests passed: {self.tests_passed}/{self.tests_run}")
-        print(f"⏱️  Total time: {duration:.2f} seconds")
-        print(f"📈 Success rate: {(self.tests_passed/self.tests_run*100):.1f}%")
-        
-        if self.failed_tests:
-            print(f"\n❌ Failed tests ({len(self.failed_tests)}):")
-            for failure in self.failed_tests:
-                error_msg = failure.get('error', f"Status {failure.get('actual', 'unknown')}")
-                print(f"   • {failure['test']}: {error_msg}")
-        
-        return self.tests_passed == self.tests_run
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * self.page_size
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def start(self):
+        if self.base is not None:
+            self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self):
+        self.base = self.peak = self.current()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = self.current()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def window(self) -> Dict[str, Optional[float]]:
+        """Peak and growth since the last reset; without /proc, the process-lifetime peak only"""
+        if self.base is None:
+            if resource is None:
+                return {"peak_rss_mib": None, "rss_growth_mib": None}
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+            return {"peak_rss_mib": round(peak / MIB, 1), "rss_growth_mib": None}
+        peak = max(self.peak, self.current() or 0)
+        return {"peak_rss_mib": round(peak / MIB, 1), "rss_growth_mib": round((peak - self.base) / MIB, 1)}
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    latencies = sorted(latencies)
+    percentile = lambda q: round(latencies[min(int(len(latencies) * q), len(latencies) - 1)], 3) if latencies else None
+    return {**{name: percentile(q) for name, q in QUANTILES.items()},
+            "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+            "max": round(latencies[-1], 3) if latencies else None}
+
+
+async def load_endpoint(client: httpx.AsyncClient, scenario: Scenario, rps: float, duration: float,
+                        concurrency: int, rss: Optional[RssSampler]) -> Dict:
+    """Offer `rps` requests/s for `duration` s with at most `concurrency` in flight"""
+    for _ in range(WARMUP_REQUESTS):
+        await scenario.send(client)
+    gc.collect()  # don't bill the previous endpoint's garbage to this one
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    slots = asyncio.Semaphore(concurrency)
+    interval = 1 / rps
+
+    async def send():
+        try:
+            t0 = time.perf_counter()
+            response = await scenario.send(client)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statuses[str(response.status_code)] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+        finally:
+            slots.release()
+
+    if rss is not None:
+        rss.reset()
+    started = time.monotonic()
+    tasks = []
+    sent = 0
+    while (now := time.monotonic()) - started < duration:
+        due = started + sent * interval
+        if due > now:
+            await asyncio.sleep(due - now)
+        await slots.acquire()
+        tasks.append(asyncio.create_task(send()))
+        sent += 1
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    return {
+        "method": scenario.method,
+        "path": scenario.path,
+        "requests": sent,
+        "errors": sent - statuses[str(scenario.status)],
+        "status_counts": dict(statuses),
+        "throughput_rps": round(sent / elapsed, 1),
+        "latency_ms": latency_summary(latencies),
+        **(rss.window() if rss is not None else {"peak_rss_mib": None, "rss_growth_mib": None}),
+    }
+
+
+# ==================== BASELINE ====================
+
+def compare(report: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Regressions against `baseline`: slower tails, lower throughput, more memory or new errors"""
+    regressions = []
+    for name, current in report["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if base is None:
+            continue
+        samples = min(current["requests"], base["requests"])
+        for q, quantile in QUANTILES.items():
+            before, after = base["latency_ms"][q], current["latency_ms"][q]
+            if round(samples * (1 - quantile)) < TAIL_SAMPLES or before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before >= min_delta_ms:
+                regressions.append(f"{name}: {q} {before:.2f} -> {after:.2f} ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if base["peak_rss_mib"] and current["peak_rss_mib"] and current["peak_rss_mib"] > base["peak_rss_mib"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {base['peak_rss_mib']} -> {current['peak_rss_mib']} MiB")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ==================== RUNNER ====================
+
+def bson_datetimes(value):
+    """Aware datetimes as naive UTC, as BSON stores them"""
+    if isinstance(value, dict):
+        return {key: bson_datetimes(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [bson_datetimes(item) for item in value]
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def use_mock_database(module):
+    """Point the app's stores at an in-memory mongomock database"""
+    import mongomock
+    from mongomock_motor import AsyncMongoMockClient
+
+    # mongomock normalizes stored dates but not pipeline literals, so `$subtract` of the two fails
+    aggregate = mongomock.collection.Collection.aggregate
+    mongomock.collection.Collection.aggregate = lambda self, pipeline, *args, **kwargs: aggregate(
+        self, bson_datetimes(pipeline), *args, **kwargs)
+    mock_db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    module.db = mock_db
+    module.rollup_store = module.RollupStore(mock_db)
+    module.metrics_store = module.GridMetricsStore(mock_db, rollups=module.rollup_store)
+
+
+@asynccontextmanager
+async def in_process_client(mongo_url: Optional[str], timeout: float):
+    """The app with its startup hooks run, behind an ASGI transport; scratch dirs keep the ledger and jobs out of the tree"""
+    scratch = Path(tempfile.mkdtemp(prefix="energy_morph_suite_"))
+    os.environ.update({
+        "MONGO_URL": mongo_url or UNREACHABLE_MONGO_URL,
+        "DB_NAME": os.environ.get("DB_NAME", "energy_morph_suite"),
+        "LEDGER_DIR": str(scratch / "ledger"),
+        "JOB_RESULTS_DIR": str(scratch / "job_results"),
+        "SNN_CHECKPOINT_DIR": "",
+        "SNN_WORKERS": "0",  # forecasts in a thread, so their memory shows in this process's RSS
+        "LEDGER_FEED_INTERVAL": "0",  # no simulated transfers between runs
+        "LEDGER_BLOCK_TXS": str(LEDGER_SEED_TXS),  # the seeded transfers seal block 0
+        "ROLLUP_MAX_FRAME_CELLS": str(SUITE_FRAME_CELLS),
+    })
+    sys.path.insert(0, str(ROOT_DIR / "backend"))
+    import server
+
+    if mongo_url:
+        await server.client.drop_database(server.db.name)
+    async with server.app.router.lifespan_context(server.app):
+        if not mongo_url:
+            use_mock_database(server)
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)  # unhandled errors count as 500s
+        async with httpx.AsyncClient(transport=transport, base_url="http://suite", timeout=timeout) as client:
+            yield client
+
+
+@asynccontextmanager
+async def remote_client(url: str, timeout: float, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url.rstrip("/"), timeout=timeout, limits=limits) as client:
+        yield client
+
+
+async def wait_ready(client: httpx.AsyncClient):
+    """Wait for the first SNN forecast, which the prediction endpoints need"""
+    deadline = time.monotonic() + READY_TIMEOUT
+    while (await client.get("/api/snn/predictions")).status_code == 503 and time.monotonic() < deadline:
+        await asyncio.sleep(0.25)
+
+
+async def smoke(client: httpx.AsyncClient) -> tuple[List[Scenario], List[Dict]]:
+    """Build every section's scenarios and send each once; returns the scenarios and the failures"""
+    scenarios: List[Scenario] = []
+    failures: List[Dict] = []
+    for title, build in SECTIONS:
+        print(f"\n{'=' * 50}\nTESTING {title} ENDPOINTS\n{'=' * 50}")
+        for scenario in await build(client):
+            scenarios.append(scenario)
+            try:
+                response = await scenario.send(client)
+                ok = response.status_code == scenario.status and (scenario.check is None or scenario.check(response))
+                detail = None if ok else f"expected {scenario.status}, got {response.status_code}: {response.text[:200]}"
+            except (httpx.HTTPError, ValueError) as e:
+                detail = str(e)
+            print(f"{'✅' if detail is None else '❌'} {scenario.name:<40} {scenario.method} {scenario.path}")
+            if detail is not None:
+                print(f"   {detail}")
+                failures.append({"test": scenario.name, "path": scenario.path, "error": detail})
+    print(f"\n{'=' * 50}\nTESTING MULTI-REQUEST CHECKS\n{'=' * 50}")
+    for name, check in CHECKS:
+        detail = await check(client)
+        print(f"{'✅' if detail is None else '❌'} {name}" + (f": {detail}" if detail else ""))
+        if detail is not None:
+            failures.append({"test": name, "error": detail})
+    return scenarios, failures
+
+
+def selected(scenario: Scenario, only: List[str]) -> bool:
+    text = f"{scenario.name} {scenario.path}".lower()
+    return scenario.load and (not only or any(term in text for term in only))
+
+
+async def run_suite(args) -> Dict:
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    if args.url:
+        opened, target = remote_client(args.url, args.timeout, args.concurrency), args.url
+    else:
+        opened = in_process_client(args.mongo_url, args.timeout)
+        target = f"in-process ({'mongod' if args.mongo_url else 'mongomock'})"
+    rss = None if args.url else RssSampler()
+
+    async with opened as client:
+        await wait_ready(client)
+        started = time.monotonic()
+        scenarios, failures = await smoke(client)
+        endpoints = {}
+        if not args.smoke_only:
+            only = [term.strip().lower() for term in args.only.split(",") if term.strip()]
+            chosen = [scenario for scenario in scenarios if selected(scenario, only)]
+            print(f"\n{'=' * 50}\nLOAD: {args.rps:g} req/s for {args.duration:g} s, {args.concurrency} in flight\n{'=' * 50}")
+            print(f"   {'endpoint':<40} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>7} {'RSS MiB':>8} {'errors':>6}")
+            if rss is not None:
+                rss.start()
+            try:
+                for scenario in chosen:
+                    result = endpoints[scenario.name] = await load_endpoint(
+                        client, scenario, args.rps, args.duration, args.concurrency, rss)
+                    latency = result["latency_ms"]
+                    print(f"   {scenario.name:<40} {latency['p50'] or 0:8.2f} {latency['p95'] or 0:8.2f} "
+                          f"{latency['p99'] or 0:8.2f} {result['throughput_rps']:7.1f} "
+                          f"{result['peak_rss_mib'] or 0:8.1f} {result['errors']:6d}")
+            finally:
+                if rss is not None:
+                    rss.stop()
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "target": target,
+        "settings": {"rps": args.rps, "duration": args.duration, "concurrency": args.concurrency, "seed": args.seed},
+        "elapsed_seconds": round(time.monotonic() - started, 1),
+        "smoke": {"run": len(scenarios) + len(CHECKS), "failed": failures},
+        "endpoints": endpoints,
+    }
+
 
 def main():
-    """Main test execution"""
-    tester = EnergyMorphAPITester()
-    
+    parser = argparse.ArgumentParser(description="Smoke checks and per-endpoint load for the backend API")
+    parser.add_argument("--rps", type=float, default=50, help="requests per second offered to each endpoint")
+    parser.add_argument("--duration", type=float, default=2, help="seconds of load per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at most")
+    parser.add_argument("--only", default="", help="comma-separated name or path fragments to load (default: all)")
+    parser.add_argument("--smoke-only", action="store_true", help="check statuses only, no load")
+    parser.add_argument("--output", default="", help="write the JSON report here")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="report to compare against (skipped if missing)")
+    parser.add_argument("--save-baseline", action="store_true", help="write the report to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore latency regressions smaller than this")
+    parser.add_argument("--mongo-url", default="", help="run against this mongod instead of mongomock")
+    parser.add_argument("--url", default="", help="load a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the app's random generators")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("server").setLevel(logging.CRITICAL)
     try:
-        success = tester.run_all_tests()
-        return 0 if success else 1
+        report = asyncio.run(run_suite(args))
     except KeyboardInterrupt:
-        print("\n⚠️  Tests interrupted by user")
-        return 1
-    except Exception as e:
-        print(f"\n💥 Unexpected error: {e}")
+        print("\n⚠️  Run interrupted by user")
         return 1
 
+    failures = report["smoke"]["failed"]
+    print(f"\n{'=' * 60}\n📊 FINAL RESULTS\n{'=' * 60}")
+    print(f"✅ Smoke checks passed: {report['smoke']['run'] - len(failures)}/{report['smoke']['run']}")
+    print(f"⏱️  Total time: {report['elapsed_seconds']:.1f} seconds")
+    for failure in failures:
+        print(f"   ❌ {failure['test']}: {failure['error']}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"📝 Report written to {args.output}")
+
+    regressions = []
+    baseline_path = Path(args.baseline)
+    if args.save_baseline and report["endpoints"]:
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"📌 Baseline written to {baseline_path}")
+    elif report["endpoints"] and baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get("settings", {}) != report["settings"]:
+            print(f"⚠️  Baseline was recorded with {baseline.get('settings')}; figures may not be comparable")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        print(f"📈 {len(regressions)} regression(s) against {baseline_path} "
+              f"(commit {baseline.get('commit')}, tolerance {args.tolerance:.0%})")
+        for regression in regressions:
+            print(f"   • {regression}")
+
+    errors = sum(result["errors"] for result in report["endpoints"].values())
+    return 1 if failures or regressions or errors else 0
+
+
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
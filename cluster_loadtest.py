@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Energy-Morph Cluster Load Test
+Starts the backend under uvicorn with 1..N worker processes sharing one
+SHARED_STATE_URL, drives it from several client processes and reports
+request throughput per worker count plus how many distinct realtime
+snapshots (ETags) the cluster produced - with a shared store that is one per
+cache window, however many workers serve it.
+
+Usage:
+    python cluster_loadtest.py --shared-url redis://localhost:6379/0           # 1, 2 and 4 workers, 15 s each
+    python cluster_loadtest.py --shared-url redis://localhost:6379/0 --workers 1,2,4,8 --clients 8
+    python cluster_loadtest.py --workers 1,4 --path "/api/heatmap/realtime?site=berlin"
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+STARTUP_TIMEOUT = 90
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, shared_url: str) -> subprocess.Popen:
+    env = {**os.environ, "SHARED_STATE_URL": shared_url}
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017/?serverSelectionTimeoutMS=1000")
+    env.setdefault("DB_NAME", "energy_morph_loadtest")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+
+
+def wait_ready(base_url: str, server: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server not ready after {STARTUP_TIMEOUT} s")
+
+
+def client_process(base_url: str, path: str, duration: float, concurrency: int) -> Dict:
+    """One load-generating process: `concurrency` request loops for `duration` s"""
+    latencies: List[float] = []
+    etags = set()
+    errors = 0
+
+    async def loop(client: httpx.AsyncClient, stop_at: float):
+        nonlocal errors
+        while time.monotonic() < stop_at:
+            t0 = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - t0) * 1000)
+                etags.add(response.headers.get("etag"))
+            except httpx.HTTPError:
+                errors += 1
+
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+            stop_at = time.monotonic() + duration
+            await asyncio.gather(*(loop(client, stop_at) for _ in range(concurrency)))
+
+    asyncio.run(run())
+    return {"latencies": latencies, "etags": sorted(etag for etag in etags if etag), "errors": errors}
+
+
+def run_cluster(workers: int, shared_url: str, path: str, duration: float, clients: int, concurrency: int) -> Dict:
+    """Throughput and snapshot counts for one worker count"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(workers, port, shared_url)
+    try:
+        wait_ready(base_url, server)
+        httpx.get(f"{base_url}{path}", timeout=30)  # warm every worker's imports before timing
+        started = time.monotonic()
+        with multiprocessing.get_context("spawn").Pool(clients) as pool:
+            results = pool.starmap(client_process, [(base_url, path, duration, concurrency)] * clients)
+        elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    latencies = sorted(ms for result in results for ms in result["latencies"])
+    percentile = lambda q: round(latencies[min(int(len(latencies) * q), len(latencies) - 1)], 2) if latencies else None
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "errors": sum(result["errors"] for result in results),
+        "distinct_snapshots": len({etag for result in results for etag in result["etags"]}),
+        "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+                       "mean": round(statistics.fmean(latencies), 2) if latencies else None},
+        "elapsed_seconds": round(elapsed, 2),
+    }
+
+
+def run_scaling(worker_counts: List[int], shared_url: str, path: str = "/api/grid/realtime", duration: float = 15,
+                clients: int = 4, concurrency: int = 16) -> Dict:
+    """run_cluster for each worker count, with throughput relative to the first"""
+    runs = [run_cluster(workers, shared_url, path, duration, clients, concurrency) for workers in worker_counts]
+    base: Optional[float] = runs[0]["requests_per_second"] if runs else None
+    for run in runs:
+        run["speedup"] = round(run["requests_per_second"] / base, 2) if base else None
+    return {"path": path, "shared_state": shared_url or "in-process", "cpu_count": os.cpu_count(), "runs": runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker throughput test for the backend")
+    parser.add_argument("--shared-url", default=os.environ.get("SHARED_STATE_URL", ""),
+                        help="SHARED_STATE_URL for the workers (empty: each worker caches on its own)")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts to run")
+    parser.add_argument("--path", default="/api/grid/realtime", help="endpoint to load")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per worker count")
+    parser.add_argument("--clients", type=int, default=4, help="load-generating processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per client process")
+    args = parser.parse_args()
+
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    result = run_scaling(worker_counts, args.shared_url, args.path, args.duration, args.clients, args.concurrency)
+    print(json.dumps(result, indent=2))
+    return 1 if any(run["errors"] for run in result["runs"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,3 @@
-import { useState, useEffect } from "react";
 import { motion } from "framer-motion";
 import { Card, CardContent, CardHeader, CardTitle } from "./ui/card";
 import { Skeleton } from "./ui/skeleton";
@@ -6,28 +5,10 @@ import { Badge } from "./ui/badge";
 import { ScrollArea } from "./ui/scroll-area";
 import { Progress } from "./ui/progress";
 import { Link2, CheckCircle, Clock, Leaf } from "lucide-react";
-import axios from "axios";
-
-const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
-const API = `${BACKEND_URL}/api`;
+import { useRealtimeTopic } from "../hooks/use-realtime-topic";
 
 const BlockchainTracker = ({ data, loading, fullSize = false }) => {
-  const [summary, setSummary] = useState(null);
-
-  useEffect(() => {
-    const fetchSummary = async () => {
-      try {
-        const response = await axios.get(`${API}/blockchain/summary`);
-        setSummary(response.data);
-      } catch (error) {
-        console.error("Failed to fetch blockchain summary:", error);
-      }
-    };
-
-    fetchSummary();
-    const interval = setInterval(fetchSummary, 15000);
-    return () => clearInterval(interval);
-  }, []);
+  const summary = useRealtimeTopic("blockchain", "/blockchain/summary", 15000);
 
   if (loading) {
     return (
@@ -30,27 +30,12 @@ const Header = ({ onRefresh, onStartTour }) => {
   const { theme, toggleTheme } = useTheme();
   const [isExportingPDF, setIsExportingPDF] = useState(false);
 
-  const handleExportCSV = async () => {
-    try {
-      const response = await axios.get(`${API}/export/csv`);
-      const { headers, rows, filename } = response.data;
-      
-      const csvContent = [
-        headers.join(","),
-        ...rows.map(row => headers.map(h => row[h]).join(","))
-      ].join("\n");
-      
-      const blob = new Blob([csvContent], { type: "text/csv" });
-      const url = window.URL.createObjectURL(blob);
-      const a = document.createElement("a");
-      a.href = url;
-      a.download = filename;
-      a.click();
-      
-      toast.success("CSV exported successfully");
-    } catch (error) {
-      toast.error("Failed to export CSV");
-    }
+  const handleExportCSV = () => {
+    // Streamed straight to disk by the browser instead of being assembled in memory
+    const a = document.createElement("a");
+    a.href = `${API}/export/csv?format=csv`;
+    a.click();
+    toast.success("CSV export started");
   };
 
   const handleGenerateReport = async () => {
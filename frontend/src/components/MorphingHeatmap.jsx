@@ -11,12 +11,21 @@ import { Button } from "./ui/button";
 import { useTheme } from "../App";
 import { RefreshCw } from "lucide-react";
 import axios from "axios";
+import { useRealtimeTopic } from "../hooks/use-realtime-topic";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
 // Custom Heatmap using CSS Grid
 const HeatmapCell = ({ value, maxValue, type }) => {
+  // null: no readings for this zone-hour, shown as missing rather than as zero
+  if (value == null) {
+    return (
+      <div className="w-full h-8 rounded-sm border border-dashed border-border/50 flex items-center justify-center text-xs font-mono text-muted-foreground">
+        –
+      </div>
+    );
+  }
   const intensity = Math.min(value / maxValue, 1);
   const color = type === "power" 
     ? `rgba(0, 191, 255, ${0.2 + intensity * 0.8})`
@@ -50,11 +59,14 @@ const MorphingHeatmap = ({ data, loading, fullSize = false }) => {
     }
   }, []);
 
+  const streamedMorphData = useRealtimeTopic("heatmap", "/heatmap/realtime", 5000);
   useEffect(() => {
-    fetchMorphData();
-    const interval = setInterval(fetchMorphData, 5000);
-    return () => clearInterval(interval);
-  }, [fetchMorphData]);
+    if (!streamedMorphData) return undefined;
+    setIsAnimating(true);
+    setMorphData(streamedMorphData);
+    const timeout = setTimeout(() => setIsAnimating(false), 500);
+    return () => clearTimeout(timeout);
+  }, [streamedMorphData]);
 
   if (loading) {
     return (
@@ -70,7 +82,8 @@ const MorphingHeatmap = ({ data, loading, fullSize = false }) => {
   }
 
   const values = viewMode === "power" ? data?.power_values : data?.efficiency_values;
-  const maxValue = values ? Math.max(...values.flat()) : 100;
+  const present = values ? values.flat().filter((value) => value != null) : [];
+  const maxValue = present.length ? Math.max(...present) : 100;
 
   return (
     <Card className="bg-card/50 border-border/50 h-full">
@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState } from "react";
 import { motion } from "framer-motion";
 import { 
   ResponsiveContainer, 
@@ -17,33 +17,15 @@ import { Badge } from "./ui/badge";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "./ui/tabs";
 import { useTheme } from "../App";
 import { Brain, Activity, Sparkles } from "lucide-react";
-import axios from "axios";
-
-const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
-const API = `${BACKEND_URL}/api`;
+import { useRealtimeTopic } from "../hooks/use-realtime-topic";
 
 const SNNPredictions = ({ data, loading, fullSize = false }) => {
   const { theme } = useTheme();
-  const [neuronActivity, setNeuronActivity] = useState(null);
+  const neuronActivity = useRealtimeTopic("neurons", "/snn/neuron-activity", 10000);
   const [activeTab, setActiveTab] = useState("predictions");
 
   const isDark = theme === "dark";
 
-  useEffect(() => {
-    const fetchNeuronActivity = async () => {
-      try {
-        const response = await axios.get(`${API}/snn/neuron-activity`);
-        setNeuronActivity(response.data);
-      } catch (error) {
-        console.error("Failed to fetch neuron activity:", error);
-      }
-    };
-
-    fetchNeuronActivity();
-    const interval = setInterval(fetchNeuronActivity, 10000);
-    return () => clearInterval(interval);
-  }, []);
-
   if (loading) {
     return (
       <Card className="bg-card/50 border-border/50 h-full">
@@ -0,0 +1,115 @@
+import { useEffect, useState } from "react";
+import axios from "axios";
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || window.location.origin;
+const API = `${BACKEND_URL}/api`;
+const STREAM_URL = `${API.replace(/^http/, "ws")}/stream`;
+
+const MAX_RETRY_DELAY = 30000;
+
+// One WebSocket per tab, shared by every component that subscribes to a topic
+const topicListeners = new Map();
+const connectionListeners = new Set();
+let socket = null;
+let connected = false;
+let reconnectTimer = null;
+let retryDelay = 1000;
+
+const send = (message) => {
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    socket.send(JSON.stringify(message));
+  }
+};
+
+const setConnected = (value) => {
+  connected = value;
+  connectionListeners.forEach((listener) => listener(value));
+};
+
+const connect = () => {
+  reconnectTimer = null;
+  socket = new WebSocket(STREAM_URL);
+
+  socket.onopen = () => {
+    retryDelay = 1000;
+    send({ action: "subscribe", topics: [...topicListeners.keys()] });
+    setConnected(true);
+  };
+
+  socket.onmessage = (event) => {
+    const { topic, data } = JSON.parse(event.data);
+    topicListeners.get(topic)?.forEach((listener) => listener(data));
+  };
+
+  socket.onclose = () => {
+    socket = null;
+    setConnected(false);
+    if (topicListeners.size > 0) {
+      reconnectTimer = setTimeout(connect, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY);
+    }
+  };
+};
+
+const subscribe = (topic, listener) => {
+  if (!topicListeners.has(topic)) {
+    topicListeners.set(topic, new Set());
+    send({ action: "subscribe", topics: [topic] });
+  }
+  topicListeners.get(topic).add(listener);
+  if (!socket && !reconnectTimer) {
+    connect();
+  }
+
+  return () => {
+    const listeners = topicListeners.get(topic);
+    listeners.delete(listener);
+    if (listeners.size === 0) {
+      topicListeners.delete(topic);
+      send({ action: "unsubscribe", topics: [topic] });
+    }
+    if (topicListeners.size === 0 && socket) {
+      socket.close();
+    }
+  };
+};
+
+/**
+ * Latest snapshot for a realtime topic pushed over the shared /api/stream
+ * socket. While the socket is down, polls `fallbackPath` every
+ * `fallbackInterval` ms instead.
+ */
+export const useRealtimeTopic = (topic, fallbackPath, fallbackInterval) => {
+  const [data, setData] = useState(null);
+  const [isConnected, setIsConnected] = useState(connected);
+
+  useEffect(() => {
+    connectionListeners.add(setIsConnected);
+    const unsubscribe = subscribe(topic, setData);
+    return () => {
+      connectionListeners.delete(setIsConnected);
+      unsubscribe();
+    };
+  }, [topic]);
+
+  useEffect(() => {
+    if (isConnected) {
+      return undefined;
+    }
+
+    const poll = async () => {
+      try {
+        const response = await axios.get(`${API}${fallbackPath}`);
+        setData(response.data);
+      } catch (error) {
+        console.error(`Failed to fetch ${fallbackPath}:`, error);
+      }
+    };
+
+    poll();
+    const interval = setInterval(poll, fallbackInterval);
+    return () => clearInterval(interval);
+  }, [isConnected, fallbackPath, fallbackInterval]);
+
+  return data;
+};
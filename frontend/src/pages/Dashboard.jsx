@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 import { motion, AnimatePresence } from "framer-motion";
 import { useTheme } from "../App";
 import axios from "axios";
@@ -15,9 +15,40 @@ import QueryInterface from "../components/QueryInterface";
 import ScenarioPanel from "../components/ScenarioPanel";
 import RealtimeMetrics from "../components/RealtimeMetrics";
 import OnboardingTour from "../components/OnboardingTour";
+import { useRealtimeTopic } from "../hooks/use-realtime-topic";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const HEATMAP_HOURS = 24;
+
+// Replace columns the delta re-sends (the current hour), append newer ones
+// and keep the window at its original width
+const mergeHeatmapDelta = (current, delta) => {
+  const width = current.timestamps.length;
+  const timestamps = [...current.timestamps];
+  const power = current.power_values.map((row) => [...row]);
+  const efficiency = current.efficiency_values.map((row) => [...row]);
+
+  delta.timestamps.forEach((timestamp, column) => {
+    let index = timestamps.indexOf(timestamp);
+    if (index === -1) {
+      timestamps.push(timestamp);
+      index = timestamps.length - 1;
+    }
+    delta.zones.forEach((_, zone) => {
+      power[zone][index] = delta.power_values[zone][column];
+      efficiency[zone][index] = delta.efficiency_values[zone][column];
+    });
+  });
+
+  const drop = Math.max(0, timestamps.length - width);
+  return {
+    zones: current.zones,
+    timestamps: timestamps.slice(drop),
+    power_values: power.map((row) => row.slice(drop)),
+    efficiency_values: efficiency.map((row) => row.slice(drop)),
+  };
+};
 
 const Dashboard = () => {
   const { theme } = useTheme();
@@ -32,6 +63,7 @@ const Dashboard = () => {
   const [realtimeData, setRealtimeData] = useState(null);
   const [snnPredictions, setSnnPredictions] = useState(null);
   const [blockchainData, setBlockchainData] = useState(null);
+  const heatmapRef = useRef(null);
 
   // Check if first visit and show tour
   useEffect(() => {
@@ -41,20 +73,31 @@ const Dashboard = () => {
     }
   }, []);
 
+  // After the first load only the heatmap columns since the newest one held are fetched
+  const fetchHeatmap = useCallback(async () => {
+    const current = heatmapRef.current;
+    const since = current?.timestamps[current.timestamps.length - 1];
+    const response = await axios.get(`${API}/heatmap/data`, {
+      params: since ? { hours: HEATMAP_HOURS, since } : { hours: HEATMAP_HOURS },
+    });
+    heatmapRef.current = since ? mergeHeatmapDelta(current, response.data) : response.data;
+    return heatmapRef.current;
+  }, []);
+
   // Fetch data
   const fetchData = useCallback(async () => {
     try {
       setLoading(true);
       const [kpi, heatmap, realtime, snn, blockchain] = await Promise.all([
         axios.get(`${API}/kpi/summary`),
-        axios.get(`${API}/heatmap/data?hours=24`),
+        fetchHeatmap(),
         axios.get(`${API}/grid/realtime`),
         axios.get(`${API}/snn/predictions`),
         axios.get(`${API}/blockchain/transactions?limit=10`),
       ]);
 
       setKpiData(kpi.data);
-      setHeatmapData(heatmap.data);
+      setHeatmapData(heatmap);
       setRealtimeData(realtime.data);
       setSnnPredictions(snn.data);
       setBlockchainData(blockchain.data);
@@ -64,7 +107,7 @@ const Dashboard = () => {
     } finally {
       setLoading(false);
     }
-  }, []);
+  }, [fetchHeatmap]);
 
   useEffect(() => {
     fetchData();
@@ -73,19 +116,13 @@ const Dashboard = () => {
     return () => clearInterval(interval);
   }, [fetchData]);
 
-  // Update realtime data more frequently
+  // Realtime grid status is pushed over the shared stream between full refreshes
+  const streamedRealtime = useRealtimeTopic("grid", "/grid/realtime", 5000);
   useEffect(() => {
-    const realtimeInterval = setInterval(async () => {
-      try {
-        const response = await axios.get(`${API}/grid/realtime`);
-        setRealtimeData(response.data);
-      } catch (error) {
-        console.error("Realtime update failed:", error);
-      }
-    }, 5000);
-
-    return () => clearInterval(realtimeInterval);
-  }, []);
+    if (streamedRealtime) {
+      setRealtimeData(streamedRealtime);
+    }
+  }, [streamedRealtime]);
 
   const renderContent = () => {
     switch (activePanel) {
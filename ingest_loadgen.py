@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Energy-Morph Ingest Load Generator
+Pushes synthetic meter readings to /api/ingest/metrics at a fixed rate and
+reports accepted throughput, throttling (429) and request latency.
+
+Usage:
+    python ingest_loadgen.py                                   # 50k readings/s for 30 s against localhost:8001
+    python ingest_loadgen.py --rate 80000 --duration 60 --format arrow --gzip
+    python ingest_loadgen.py --url https://megapack-dash.example.com --batch 5000
+"""
+
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+ZONES = ["Zone_A", "Zone_B", "Zone_C", "Zone_D", "Zone_E", "Zone_F"]
+FIELDS = ("solar_output", "wind_output", "megapack_charge", "grid_demand", "efficiency_ratio")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+BODY_POOL = 16  # distinct request bodies generated up front and sent round-robin
+
+
+def reading_columns(rows: int, start: float, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """One reading per zone per second from `start` (epoch seconds)"""
+    seconds = start + np.arange(rows) // len(ZONES)
+    hour_factor = np.sin((seconds % 86400) / 86400 * 2 * np.pi - np.pi / 2) * 0.3 + 1
+    return {
+        "timestamp": seconds,
+        "zone": np.array(ZONES)[np.arange(rows) % len(ZONES)],
+        "solar_output": np.round(80 * hour_factor + rng.normal(0, 10, rows), 2),
+        "wind_output": np.round(60 + rng.normal(0, 15, rows), 2),
+        "megapack_charge": np.round(rng.uniform(40, 95, rows), 2),
+        "grid_demand": np.round(120 * hour_factor + rng.normal(0, 20, rows), 2),
+        "efficiency_ratio": np.round(0.75 + rng.normal(0, 0.05, rows), 3),
+    }
+
+
+def encode_ndjson(columns: Dict[str, np.ndarray]) -> bytes:
+    lists = {name: values.tolist() for name, values in columns.items()}
+    lists["timestamp"] = [time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)) for ts in lists["timestamp"]]
+    keys = list(lists)
+    return "".join(json.dumps(dict(zip(keys, row))) + "\n" for row in zip(*lists.values())).encode()
+
+
+def encode_arrow(columns: Dict[str, np.ndarray]) -> bytes:
+    import pyarrow as pa
+
+    table = pa.table({
+        "timestamp": pa.array((columns["timestamp"] * 1000).astype(np.int64), pa.timestamp("ms", tz="UTC")),
+        **{name: columns[name] for name in ("zone", *FIELDS)},
+    })
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def build_bodies(batch: int, fmt: str, compress: bool) -> List[bytes]:
+    rng = np.random.default_rng(0)
+    start = time.time() - 86400
+    encode = encode_arrow if fmt == "arrow" else encode_ndjson
+    bodies = []
+    for i in range(BODY_POOL):
+        body = encode(reading_columns(batch, start + i * batch // len(ZONES), rng))
+        bodies.append(gzip.compress(body, compresslevel=1) if compress else body)
+    return bodies
+
+
+async def run_load(client: httpx.AsyncClient, rate: float = 50_000, duration: float = 30, batch: int = 2000,
+                   fmt: str = "ndjson", compress: bool = False, concurrency: int = 8) -> Dict:
+    """Offer `rate` readings/s for `duration` s in `batch`-sized requests; returns throughput and latency figures"""
+    bodies = build_bodies(batch, fmt, compress)
+    headers = {"Content-Type": ARROW_MEDIA_TYPE if fmt == "arrow" else NDJSON_MEDIA_TYPE}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    interval = batch / rate
+    latencies: List[float] = []
+    counts = {"requests": 0, "accepted": 0, "rejected": 0, "throttled": 0, "errors": 0}
+    slots = asyncio.Semaphore(concurrency)
+    pause_until = 0.0
+
+    async def send(body: bytes):
+        nonlocal pause_until
+        try:
+            t0 = time.perf_counter()
+            response = await client.post("/api/ingest/metrics", content=body, headers=headers)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            counts["requests"] += 1
+            if response.status_code == 202:
+                result = response.json()
+                counts["accepted"] += result["accepted"]
+                counts["rejected"] += result["rejected"]
+            elif response.status_code == 429:
+                counts["throttled"] += 1
+                pause_until = max(pause_until, time.monotonic() + float(response.headers.get("Retry-After", "1")))
+            else:
+                counts["errors"] += 1
+        except httpx.HTTPError:
+            counts["errors"] += 1
+        finally:
+            slots.release()
+
+    stats_before = (await client.get("/api/ingest/stats")).json()
+    started = time.monotonic()
+    tasks = []
+    sent = 0
+    while (now := time.monotonic()) - started < duration:
+        if now < pause_until:
+            await asyncio.sleep(pause_until - now)
+            continue
+        due = started + sent * interval
+        if due > now:
+            await asyncio.sleep(due - now)
+        await slots.acquire()
+        tasks.append(asyncio.create_task(send(bodies[sent % len(bodies)])))
+        sent += 1
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    stats_after = (await client.get("/api/ingest/stats")).json()
+
+    latencies.sort()
+    percentile = lambda q: round(latencies[min(int(len(latencies) * q), len(latencies) - 1)], 2) if latencies else None
+    return {
+        "offered_per_second": round(sent * batch / elapsed),
+        "accepted_per_second": round(counts["accepted"] / elapsed),
+        "written_per_second": round((stats_after["written"] - stats_before["written"]) / elapsed),
+        **counts,
+        "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+                       "mean": round(statistics.fmean(latencies), 2) if latencies else None},
+        "server_buffered": stats_after["buffered"],
+        "elapsed_seconds": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for /api/ingest/metrics")
+    parser.add_argument("--url", default="http://localhost:8001", help="backend base URL")
+    parser.add_argument("--rate", type=float, default=50_000, help="readings per second to offer")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--batch", type=int, default=2000, help="readings per request")
+    parser.add_argument("--format", choices=("ndjson", "arrow"), default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip request bodies")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    args = parser.parse_args()
+
+    async def run():
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            return await run_load(client, args.rate, args.duration, args.batch, args.format, args.gzip, args.concurrency)
+
+    result = asyncio.run(run())
+    print(json.dumps(result, indent=2))
+    return 0 if result["accepted_per_second"] >= 0.95 * args.rate else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())